@@ -0,0 +1,135 @@
+import re
+from collections import Counter, defaultdict
+from typing import Iterable, NamedTuple, Optional
+
+from pydantic import ValidationError
+
+from agents.account_classifier import AccountClassificationOutput
+from config import HISTORY_FASTPATH_MIN_CONFIDENCE, HISTORY_FASTPATH_MIN_COUNT, HISTORY_FASTPATH_MIN_SHARE
+
+# 이력 기반으로 자동 분류된 레코드의 reason 접두어 (다시 합의 근거로 쓰지 않기 위해 구분)
+HISTORY_REASON_PREFIX = "[이력기반]"
+# 로컬 분류기(local_classifier.py)가 분류한 레코드의 reason 접두어
+LOCAL_REASON_PREFIX = "[로컬모델]"
+
+
+class HistoryRecord(NamedTuple):
+    """분류 컨텍스트로 쓰는 과거 분류 이력 (장부_결제문자에서 필요한 컬럼만, 원문 message 제외)"""
+    거래상대: Optional[str]
+    거래목적: Optional[str]
+    계정과목_대: Optional[str]
+    계정과목_소: Optional[str]
+    account_reason: Optional[str]
+    confidence: Optional[float]
+    merchant_id: Optional[int]
+
+
+def normalize_party(name: str) -> str:
+    """거래상대 비교용 정규화 키: 대소문자/공백/구두점/법인 표기 차이를 제거"""
+    if not name:
+        return ""
+    key = name.upper()
+    key = re.sub(r'\(주\)|㈜|주식회사|\(유\)|CO\.?,?\s*LTD\.?|INC\.?', '', key)
+    key = re.sub(r'[\s\-_.,·/*()\[\]]', '', key)
+    return key
+
+
+class AccountHistoryLookup:
+    """확정된 분류 이력이 충분히 일치하는 거래상대는 LLM 없이 이력으로 분류
+
+    merchant_id가 있는 row는 같은 가맹점(merchant_id)의 이력으로만 합의를 보고,
+    merchant_id가 없는 row만 거래상대 문자열(원문/정규화)로 찾는다.
+    """
+
+    def __init__(self, records: Iterable,
+                 min_confidence: float = HISTORY_FASTPATH_MIN_CONFIDENCE,
+                 min_count: int = HISTORY_FASTPATH_MIN_COUNT,
+                 min_share: float = HISTORY_FASTPATH_MIN_SHARE):
+        self.min_confidence = min_confidence
+        self.min_count = min_count
+        self.min_share = min_share
+        self.hits = 0
+        self.misses = 0
+
+        # 가맹점/거래상대(원문/정규화)별 (거래목적, 계정과목_대, 계정과목_소) -> [confidence, ...]
+        self.by_merchant = defaultdict(lambda: defaultdict(list))
+        self.exact = defaultdict(lambda: defaultdict(list))
+        self.normalized = defaultdict(lambda: defaultdict(list))
+        self.add(records)
+
+    def add(self, records: Iterable):
+        """합의 근거가 될 수 있는 레코드만 추가 (스트리밍 파이프라인은 새로 반영된 분류를 이어서 추가)"""
+        for record in records:
+            if not record.거래상대 or not record.거래목적 or not record.계정과목_대:
+                continue
+            if record.거래목적 == "취소건" or (record.confidence or 0) < self.min_confidence:
+                continue
+            if (record.account_reason or "").startswith((HISTORY_REASON_PREFIX, LOCAL_REASON_PREFIX)):
+                continue
+            combination = (record.거래목적, record.계정과목_대, record.계정과목_소 or "")
+            if record.merchant_id is not None:
+                self.by_merchant[record.merchant_id][combination].append(record.confidence)
+            self.exact[record.거래상대][combination].append(record.confidence)
+            self.normalized[normalize_party(record.거래상대)][combination].append(record.confidence)
+
+    def _consensus(self, combinations) -> Optional[tuple]:
+        counts = Counter({combination: len(confidences) for combination, confidences in combinations.items()})
+        total = sum(counts.values())
+        if total < self.min_count:
+            return None
+        combination, support = counts.most_common(1)[0]
+        share = support / total
+        if share < self.min_share:
+            return None
+        return combination, support, total, share
+
+    def _candidates(self, party: str, merchant_id: Optional[int]):
+        """(출처, 조합별 confidence) 후보를 우선순위대로"""
+        if merchant_id is not None:
+            # 같은 문자열이라도 다른 가맹점으로 resolve된 이력은 섞지 않음
+            if merchant_id in self.by_merchant:
+                yield "동일 가맹점", self.by_merchant[merchant_id]
+            return
+        if party in self.exact:
+            yield "동일 거래상대", self.exact[party]
+        key = normalize_party(party)
+        if key and key in self.normalized:
+            yield "정규화된 거래상대", self.normalized[key]
+
+    def lookup(self, party: str, merchant_id: Optional[int] = None) -> Optional[AccountClassificationOutput]:
+        """가맹점(없으면 거래상대)의 이력이 합의 기준을 넘으면 분류 결과를, 아니면 None을 반환"""
+        match = None
+        for source, combinations in self._candidates(party, merchant_id):
+            match = self._consensus(combinations)
+            if match is not None:
+                break
+
+        if match is None:
+            self.misses += 1
+            return None
+
+        (business_purpose, main_category, sub_category), support, total, share = match
+        supporting = combinations[(business_purpose, main_category, sub_category)]
+        # 일치 비율 x 근거 레코드의 평균 confidence, 사용자 확정(1.0)과 구분되도록 0.99 상한
+        confidence = round(min(0.99, share * sum(supporting) / len(supporting)), 3)
+
+        try:
+            output = AccountClassificationOutput(
+                business_purpose=business_purpose,
+                main_category=main_category,
+                sub_category=sub_category,
+                confidence=confidence,
+                reason=f"{HISTORY_REASON_PREFIX} {source} 과거 {total}건 중 {support}건이 같은 분류"
+            )
+        except ValidationError:
+            # 현재 분류 체계에 없는 옛날 값이면 LLM에게 넘김
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return output
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
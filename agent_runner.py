@@ -0,0 +1,111 @@
+import asyncio
+import uuid
+from typing import Dict, List, Optional, Sequence, Tuple, Type
+
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+from pydantic import BaseModel, ValidationError
+
+from agents.batch import build_batch_prompt, parse_batch_output
+
+from config import APP_NAME, USER_ID
+from llm_cache import llm_cache
+from telemetry import llm_span
+
+# 프로세스 전체에서 공유하는 세션 서비스와 에이전트별 Runner (호출마다 새로 만들지 않음)
+session_service = InMemorySessionService()
+_runners: Dict[str, Runner] = {}
+
+
+def get_runner(agent) -> Runner:
+    """에이전트별로 한 번만 만든 Runner를 재사용"""
+    runner = _runners.get(agent.name)
+    if runner is None or runner.agent is not agent:
+        runner = Runner(agent=agent, app_name=APP_NAME, session_service=session_service)
+        _runners[agent.name] = runner
+    return runner
+
+
+def open_session_count() -> int:
+    """아직 삭제되지 않은 세션 수 (호출이 끝나면 0이어야 함)"""
+    return sum(len(sessions) for users in session_service.sessions.values() for sessions in users.values())
+
+
+async def _run_once(runner: Runner, session_id: str, prompt: str, usage: dict):
+    """(최종 응답 텍스트, escalate 여부). 토큰 사용량은 usage에 누적"""
+    content = types.Content(role='user', parts=[types.Part(text=prompt)])
+    final_response_text = None
+    escalated = False
+    async for event in runner.run_async(user_id=USER_ID, session_id=session_id, new_message=content):
+        if event.usage_metadata:
+            usage["prompt_tokens"] += event.usage_metadata.prompt_token_count or 0
+            usage["completion_tokens"] += event.usage_metadata.candidates_token_count or 0
+        if event.is_final_response():
+            if event.content and event.content.parts:
+                final_response_text = event.content.parts[0].text
+            elif event.actions and event.actions.escalate:  # Handle potential errors/escalations
+                final_response_text = f"Agent escalated: {event.error_message or 'No specific message.'}"
+                escalated = True
+    return final_response_text, escalated
+
+
+async def run_agent(agent, prompt: str, use_cache: bool = True) -> Optional[str]:
+    """agent로 프롬프트 하나를 실행하고 최종 응답 텍스트를 반환
+
+    Runner는 에이전트별로 재사용하고, 세션은 호출마다 고유 id로 만든 뒤 끝나면 바로 삭제한다.
+    use_cache=True면 같은 (에이전트, instruction, 모델, 프롬프트)의 이전 응답을 재사용하고,
+    출력 스키마 검증을 통과한 새 응답만 캐시에 저장한다.
+    """
+    async with llm_span(agent.name) as usage:
+        if use_cache:
+            cached_response = await asyncio.to_thread(llm_cache.get, agent, prompt)
+            if cached_response is not None:
+                usage["cache"] = "hit"
+                return cached_response
+
+        runner = get_runner(agent)
+        session_id = f"{agent.name}_{uuid.uuid4().hex}"
+        await session_service.create_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+        try:
+            final_response_text, escalated = await _run_once(runner, session_id, prompt, usage)
+        finally:
+            await session_service.delete_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+
+    if use_cache and final_response_text and not escalated:
+        try:
+            if agent.output_schema:
+                agent.output_schema.model_validate_json(final_response_text)
+            await asyncio.to_thread(llm_cache.set, agent, prompt, final_response_text)
+        except ValidationError:
+            pass
+
+    return final_response_text
+
+
+async def cached_item_responses(items: Sequence[Tuple[str, object, str]]) -> Dict[str, str]:
+    """(mac_message_id, 단건 에이전트, 단건 프롬프트) 중 캐시에 응답이 있는 항목 {mac_message_id: 응답}
+
+    배치를 만들기 전에 불러서, 캐시에 없는 항목만 배치로 묶는다.
+    """
+    responses = await asyncio.to_thread(llm_cache.get_many, [(agent, prompt) for _, agent, prompt in items])
+    return {mac_message_id: response for (mac_message_id, _, _), response in zip(items, responses) if response is not None}
+
+
+async def run_batch_agent(batch_agent, item_agent, items: List[Tuple[str, str]],
+                          item_schema: Type[BaseModel]) -> Dict[str, BaseModel]:
+    """(mac_message_id, 단건 프롬프트) 목록을 batch_agent 한 번으로 처리하고 검증을 통과한 항목만 {mac_message_id: 결과}로 반환
+
+    배치 프롬프트는 묶음 구성마다 달라 캐시하지 않고, 검증된 항목을 item_agent(단건 에이전트)의 단건 키로 저장한다.
+    """
+    final_response_text = await run_agent(batch_agent, build_batch_prompt(items), use_cache=False)
+    outputs = parse_batch_output(final_response_text or "", item_schema, [mac_message_id for mac_message_id, _ in items])
+    prompts = dict(items)
+    entries = [
+        (item_agent, prompts[mac_message_id],
+         item_agent.output_schema.model_validate(output.model_dump(exclude={"mac_message_id"})).model_dump_json())
+        for mac_message_id, output in outputs.items()
+    ]
+    if entries:
+        await asyncio.to_thread(llm_cache.set_many, entries)
+    return outputs
@@ -4,7 +4,9 @@ from pydantic import BaseModel
 from llms.openai import MODEL_GPT_5_MINI
 
 from pydantic import BaseModel, Field
-from typing import Literal
+from typing import Literal, List
+
+from agents.batch import BATCH_INSTRUCTION
 
 
 class AccountClassificationOutput(BaseModel):
@@ -119,4 +121,22 @@ JPY로 일본편의점에서 소비된 것은 출장비 식비로 분류.
    reason: "재판매 목적"
 }
 """
-)
\ No newline at end of file
+)
+
+class AccountClassificationBatchItem(AccountClassificationOutput):
+    mac_message_id: str
+
+
+class AccountClassificationBatchOutput(BaseModel):
+    items: List[AccountClassificationBatchItem]
+
+
+account_classifier_batch_agent = LlmAgent(
+    name="account_classifier_batch",
+    model=MODEL_GPT_5_MINI,
+    description="여러 건의 거래상대 이름을 보고, 장부에 어떤 항목으로 기록할 것인지 한번에 추론합니다.",
+    output_schema=AccountClassificationBatchOutput,
+    disallow_transfer_to_parent= True,  # 부모 에이전트로 전환 금지
+    disallow_transfer_to_peers= True,  # 동료 에이전트로 전환 금지
+    instruction=account_classifier.instruction + BATCH_INSTRUCTION
+)
@@ -0,0 +1,41 @@
+import json
+from typing import Dict, Iterable, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+BATCH_INSTRUCTION = """
+
+# 여러 건 동시 처리
+입력은 여러 건을 담은 JSON 배열이며, 각 항목은 mac_message_id와 input으로 구성됩니다.
+각 항목의 input을 위 기준으로 서로 독립적으로 분석하세요.
+결과는 items 배열에 항목마다 하나씩 담고, 입력의 mac_message_id를 그대로 돌려주세요.
+"""
+
+
+def build_batch_prompt(items: Iterable[Tuple[str, str]]) -> str:
+    """(mac_message_id, 단건 프롬프트) 목록을 배치 에이전트 입력 JSON으로 변환"""
+    return json.dumps(
+        [{"mac_message_id": mac_message_id, "input": prompt} for mac_message_id, prompt in items],
+        ensure_ascii=False,
+        indent=1
+    )
+
+
+def parse_batch_output(response_text: str, item_schema: Type[BaseModel], expected_ids: Iterable[str]) \
+        -> Dict[str, BaseModel]:
+    """배치 응답에서 항목별로 따로 검증하여 통과한 항목만 {mac_message_id: 결과}로 반환"""
+    expected_ids = set(expected_ids)
+    try:
+        items = json.loads(response_text).get("items", [])
+    except (json.JSONDecodeError, AttributeError):
+        return {}
+
+    parsed = {}
+    for item in items if isinstance(items, list) else []:
+        try:
+            validated = item_schema.model_validate(item)
+        except ValidationError:
+            continue
+        if validated.mac_message_id in expected_ids and validated.mac_message_id not in parsed:
+            parsed[validated.mac_message_id] = validated
+    return parsed
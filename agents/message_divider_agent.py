@@ -1,6 +1,9 @@
+from typing import List
+
 from google.adk.agents import LlmAgent
 from pydantic import BaseModel
 
+from agents.batch import BATCH_INSTRUCTION
 from llms.openai import MODEL_GPT_5_MINI
 
 
@@ -84,3 +87,33 @@ bank_message_divider_agent = LlmAgent(
 이제 다음 문자 메시지를 분석하세요:
 """
 )
+
+
+class DividedMessageBatchItem(DividedMessageOutput):
+    mac_message_id: str
+
+
+class DividedMessageBatchOutput(BaseModel):
+    items: List[DividedMessageBatchItem]
+
+
+card_message_divider_batch_agent = LlmAgent(
+    name="card_message_divider_batch_agent",
+    model=MODEL_GPT_5_MINI,
+    description="여러 건의 카드 문자 메세지를 한번에 분해합니다.",
+    output_schema=DividedMessageBatchOutput,
+    disallow_transfer_to_parent= True,  # 부모 에이전트로 전환 금지
+    disallow_transfer_to_peers= True,  # 동료 에이전트로 전환 금지
+    instruction=card_message_divider_agent.instruction + BATCH_INSTRUCTION
+)
+
+
+bank_message_divider_batch_agent = LlmAgent(
+    name="bank_message_divider_batch_agent",
+    model=MODEL_GPT_5_MINI,
+    description="여러 건의 은행 문자 메세지를 한번에 분해합니다.",
+    output_schema=DividedMessageBatchOutput,
+    disallow_transfer_to_parent= True,  # 부모 에이전트로 전환 금지
+    disallow_transfer_to_peers= True,  # 동료 에이전트로 전환 금지
+    instruction=bank_message_divider_agent.instruction + BATCH_INSTRUCTION
+)
@@ -0,0 +1,280 @@
+"""결제시간 범위를 stage 하나로 다시 처리하는 backfill CLI (Slack 소켓 연결/스케줄러 없이 실행)
+
+주기 실행은 watermark 이후를 시간 예산 안에서 조금씩 처리하므로, 과거 범위를 다시 처리할 때는 이걸 쓴다.
+- 대상 row를 (결제시간, mac_message_id) 순으로 chunk씩 골라 stage 함수에 mac_message_ids로 넘긴다 (watermark는 그대로).
+- chunk가 끝날 때마다 backfill_run에 cursor를 저장한다. 중단되면 같은 명령(같은 run_id)으로 다시 실행해서 이어간다.
+- LLM worker pool 동시성 상한을 BACKFILL_MAX_CONCURRENCY로 올리고, 배치 프롬프트는 평소 설정을 그대로 쓴다.
+- 기본은 아직 처리되지 않은 row만. --reprocess는 이미 처리된 row도 다시 처리한다 (divide, classify만,
+  사용자가 확정한 분류와 취소건은 제외). 결과는 LedgerWriter로 쓰므로 그 사이 바뀐 row는 덮어쓰지 않는다.
+  divide --reprocess로 거래상대/금액이 바뀐 row는 가맹점과 분류도 비우므로, 이어서 classify를 돌린다.
+- --dry-run은 장부를 바꾸지 않고 바뀔 컬럼을 backfill_diff에 기록한다 (가맹점 배정, 슬랙 전송도 건너뜀).
+- 실제로 반영하는 run은 chunk마다 주기 실행과 같은 stage lock을 잡는다.
+
+    uv run python -m backfill run classify --start 2025-09-01 --end 2025-10-01 [--reprocess] [--dry-run]
+    uv run python -m backfill run divide --start 2025-09-01 --end 2025-09-08 --run-id redivide-w36 --restart
+    uv run python -m backfill status [run_id]
+    uv run python -m backfill diff <run_id> [--limit 50]
+"""
+import argparse
+import asyncio
+import datetime
+import time
+from typing import Awaitable, Callable, List, NamedTuple, Optional
+
+from sqlalchemy import delete, func, select, tuple_
+
+from config import BACKFILL_CHUNK_SIZE, BACKFILL_MAX_CONCURRENCY, WORKER_POOL_CONFIG
+from database import database_session, dispose_engine
+from ledger_writer import ledger_dry_run
+from migrations import check_schema
+from models import BackfillDiff, BackfillRun, 장부_결제문자
+from run_guard import advisory_locks, stage_lock
+from services import (
+    RECEIPT_LINK_START_TIME,
+    classify_target_query, reclassify_target_query, divider_target_query, redivide_target_query,
+    refund_target_query, unlinked_purchase_query,
+    infer_account, message_divider_run, update_cancel_transactions, link_receipt_to_payments,
+)
+from telemetry import LEDGER_WRITES
+
+
+class BackfillStage(NamedTuple):
+    name: str  # stage_lock, worker pool, LedgerWriter에서 쓰는 stage 이름
+    target_query: Callable  # 아직 처리되지 않은 row
+    reprocess_query: Optional[Callable]  # 이미 처리된 row까지 (None이면 --reprocess 불가)
+    run: Callable[[List[str], bool], Awaitable]  # (mac_message_ids, reprocess)
+
+
+BACKFILL_STAGES = {
+    "divide": BackfillStage(
+        "message_divider", divider_target_query, redivide_target_query,
+        lambda mac_message_ids, reprocess: message_divider_run(mac_message_ids, reprocess=reprocess)
+    ),
+    "classify": BackfillStage(
+        "infer_account", classify_target_query, reclassify_target_query,
+        lambda mac_message_ids, reprocess: infer_account(None, mac_message_ids, reprocess=reprocess, notify=False)
+    ),
+    # 매칭/연결은 이미 쓰인 승인·영수증을 후보에서 빼므로 다시 처리하려면 먼저 기존 매칭을 지워야 함
+    "cancel-match": BackfillStage(
+        "update_cancel_transactions", refund_target_query, None,
+        lambda mac_message_ids, reprocess: update_cancel_transactions(mac_message_ids)
+    ),
+    "receipt-link": BackfillStage(
+        "link_receipt_to_payments", lambda: unlinked_purchase_query(RECEIPT_LINK_START_TIME), None,
+        lambda mac_message_ids, reprocess: link_receipt_to_payments(mac_message_ids)
+    ),
+}
+
+
+def chunk_query(stage: BackfillStage, run: BackfillRun, limit: int):
+    """run 범위에서 cursor 다음 chunk의 (결제시간, mac_message_id) (stage 조회 쿼리의 조건을 그대로 씀)"""
+    stmt = (stage.reprocess_query if run.reprocess else stage.target_query)()
+    stmt = stmt.with_only_columns(장부_결제문자.결제시간, 장부_결제문자.mac_message_id).order_by(None).where(
+        장부_결제문자.결제시간 >= run.range_start,
+        장부_결제문자.결제시간 < run.range_end
+    )
+    if run.cursor_time is not None:
+        stmt = stmt.where(
+            tuple_(장부_결제문자.결제시간, 장부_결제문자.mac_message_id) > (run.cursor_time, run.cursor_message_id)
+        )
+    return stmt.order_by(장부_결제문자.결제시간, 장부_결제문자.mac_message_id).limit(limit)
+
+
+def default_run_id(stage: str, start: datetime.datetime, end: datetime.datetime,
+                   reprocess: bool, dry_run: bool) -> str:
+    """같은 명령을 다시 실행하면 같은 run을 이어가도록 인자로 만든 run_id"""
+    run_id = f"{stage}-{start:%Y%m%dT%H%M}-{end:%Y%m%dT%H%M}"
+    if reprocess:
+        run_id += "-reprocess"
+    if dry_run:
+        run_id += "-dry"
+    return run_id
+
+
+async def start_run(run_id: str, stage: str, start: datetime.datetime, end: datetime.datetime,
+                    reprocess: bool, dry_run: bool, restart: bool) -> BackfillRun:
+    """run을 새로 만들거나, 같은 인자의 기존 run을 이어감 (restart면 cursor와 dry-run 기록을 지우고 처음부터)"""
+    async with database_session() as db_session:
+        run = await db_session.get(BackfillRun, run_id)
+        if run is not None:
+            saved = (run.stage, run.range_start, run.range_end, run.reprocess, run.dry_run)
+            if saved != (stage, start, end, reprocess, dry_run):
+                raise SystemExit(f"run {run_id}는 다른 인자로 만들어졌습니다: {saved}")
+            if restart:
+                await db_session.execute(delete(BackfillDiff).where(BackfillDiff.run_id == run_id))
+                run.cursor_time = run.cursor_message_id = run.finished_at = None
+                run.chunks_done = run.rows_done = run.rows_written = run.conflicts = 0
+            elif run.status == "done":
+                print(f"run {run_id}는 이미 끝났습니다 (다시 하려면 --restart)")
+            else:
+                print(f"run {run_id} 이어서 진행: {run.cursor_time} {run.cursor_message_id or ''} 이후, "
+                      f"{run.chunks_done} chunk / {run.rows_done}건 처리됨")
+        else:
+            run = BackfillRun(run_id=run_id, stage=stage, range_start=start, range_end=end, reprocess=reprocess,
+                              dry_run=dry_run, chunks_done=0, rows_done=0, rows_written=0, conflicts=0)
+            db_session.add(run)
+        if run.status != "done" or restart:
+            run.status = "running"
+        run.updated_at = func.now()
+        await db_session.commit()
+        await db_session.refresh(run)
+        return run
+
+
+async def save_progress(run: BackfillRun, **values):
+    async with database_session() as db_session:
+        saved = await db_session.get(BackfillRun, run.run_id)
+        for name, value in values.items():
+            setattr(saved, name, value)
+            setattr(run, name, value)
+        saved.updated_at = func.now()
+        await db_session.commit()
+
+
+def _written(stage_name: str):
+    """LedgerWriter 누적 (applied, conflict) 수 (chunk 전후 차이로 chunk별 반영 건수를 계산)"""
+    return (LEDGER_WRITES.values.get((stage_name, "applied"), 0),
+            LEDGER_WRITES.values.get((stage_name, "conflict"), 0))
+
+
+async def run_backfill(run: BackfillRun, chunk_size: int = BACKFILL_CHUNK_SIZE,
+                       max_concurrency: int = BACKFILL_MAX_CONCURRENCY):
+    stage = BACKFILL_STAGES[run.stage]
+    if stage.name in WORKER_POOL_CONFIG:
+        # 이 프로세스에서만 LLM 동시성 상한을 올림 (rate limit이 나면 worker pool이 알아서 줄임)
+        pool_config = WORKER_POOL_CONFIG[stage.name]
+        pool_config["max_concurrency"] = max(pool_config["max_concurrency"], max_concurrency)
+        pool_config["initial_concurrency"] = max(pool_config["initial_concurrency"], pool_config["max_concurrency"] // 2)
+
+    started = time.perf_counter()
+    try:
+        while True:
+            async with database_session() as db_session:
+                chunk = (await db_session.execute(chunk_query(stage, run, chunk_size))).all()
+            if not chunk:
+                break
+            mac_message_ids = [row.mac_message_id for row in chunk]
+            chunk_started = time.perf_counter()
+            applied_before, conflicts_before = _written(stage.name)
+            if run.dry_run:
+                with ledger_dry_run(run.run_id):
+                    await stage.run(mac_message_ids, run.reprocess)
+            else:
+                async with stage_lock(stage.name):
+                    await stage.run(mac_message_ids, run.reprocess)
+            applied_after, conflicts_after = _written(stage.name)
+
+            last_time, last_message_id = chunk[-1]
+            await save_progress(
+                run,
+                cursor_time=last_time,
+                cursor_message_id=last_message_id,
+                chunks_done=run.chunks_done + 1,
+                rows_done=run.rows_done + len(chunk),
+                rows_written=run.rows_written + int(applied_after - applied_before),
+                conflicts=run.conflicts + int(conflicts_after - conflicts_before),
+            )
+            print(f"[backfill {run.run_id}] chunk {run.chunks_done}: {len(chunk)}건 "
+                  f"({chunk[0][0]} ~ {last_time}), {'기록' if run.dry_run else '반영'} "
+                  f"{int(applied_after - applied_before)}건, conflict {int(conflicts_after - conflicts_before)}건, "
+                  f"{time.perf_counter() - chunk_started:.1f}s")
+    except BaseException:
+        # 마지막으로 끝난 chunk까지는 cursor가 저장되어 있으므로 같은 명령으로 다시 실행하면 이어서 진행
+        try:
+            await save_progress(run, status="interrupted")
+        except Exception as e:
+            print(f"[backfill {run.run_id}] 상태 저장 실패: {e}")
+        print(f"[backfill {run.run_id}] 중단: {run.cursor_time} {run.cursor_message_id or ''} 까지 처리됨")
+        raise
+
+    await save_progress(run, status="done", finished_at=datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None))
+    # 기본 모드에서는 실패한 row가 처리 대기로 남아 있음 (cursor 뒤라 이번 run은 다시 보지 않음)
+    print(f"[backfill {run.run_id}] 완료: {run.chunks_done} chunk, {run.rows_done}건 중 "
+          f"{'기록' if run.dry_run else '반영'} {run.rows_written}건, conflict {run.conflicts}건, "
+          f"미처리 {max(0, run.rows_done - run.rows_written - run.conflicts)}건, {time.perf_counter() - started:.1f}s")
+
+
+async def run_status(run_id: Optional[str] = None):
+    async with database_session() as db_session:
+        stmt = select(BackfillRun).order_by(BackfillRun.started_at.desc())
+        if run_id is not None:
+            stmt = stmt.where(BackfillRun.run_id == run_id)
+        return (await db_session.execute(stmt.limit(50))).scalars().all()
+
+
+async def diff_summary(run_id: str, limit: int):
+    """컬럼별 (old -> new) 변경 건수와 변경 row 일부"""
+    async with database_session() as db_session:
+        counts = (await db_session.execute(
+            select(BackfillDiff.column_name, BackfillDiff.old_value, BackfillDiff.new_value, func.count())
+            .where(BackfillDiff.run_id == run_id)
+            .group_by(BackfillDiff.column_name, BackfillDiff.old_value, BackfillDiff.new_value)
+            .order_by(func.count().desc())
+            .limit(limit)
+        )).all()
+        rows = (await db_session.execute(
+            select(BackfillDiff).where(BackfillDiff.run_id == run_id)
+            .order_by(BackfillDiff.mac_message_id, BackfillDiff.column_name)
+            .limit(limit)
+        )).scalars().all()
+    return counts, rows
+
+
+def _parse_time(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value)
+
+
+async def _main(args):
+    await check_schema()
+    try:
+        if args.command == "run":
+            stage = BACKFILL_STAGES[args.stage]
+            if args.reprocess and stage.reprocess_query is None:
+                raise SystemExit(f"{args.stage}는 --reprocess를 지원하지 않습니다 (기존 매칭을 지운 뒤 기본 모드로 실행하세요)")
+            if args.start >= args.end:
+                raise SystemExit("--start가 --end보다 앞이어야 합니다")
+            run_id = args.run_id or default_run_id(args.stage, args.start, args.end, args.reprocess, args.dry_run)
+            run = await start_run(run_id, args.stage, args.start, args.end, args.reprocess, args.dry_run, args.restart)
+            if run.status == "running":
+                await run_backfill(run, args.chunk_size, args.concurrency)
+            if run.dry_run:
+                print(f"제안 변경 보기: uv run python -m backfill diff {run.run_id}")
+        elif args.command == "status":
+            for run in await run_status(args.run_id):
+                print(f"{run.run_id}: {run.status} | {run.stage} {run.range_start} ~ {run.range_end}"
+                      f"{' reprocess' if run.reprocess else ''}{' dry-run' if run.dry_run else ''} | "
+                      f"cursor {run.cursor_time} {run.cursor_message_id or ''} | {run.chunks_done} chunk, "
+                      f"{run.rows_done}건 중 반영 {run.rows_written}건, conflict {run.conflicts}건 | "
+                      f"시작 {run.started_at}, 갱신 {run.updated_at}")
+        else:
+            counts, rows = await diff_summary(args.run_id, args.limit)
+            print(f"{'컬럼':<16} {'변경 전':<24} {'변경 후':<24} {'건수':>6}")
+            for column_name, old_value, new_value, count in counts:
+                print(f"{column_name:<16} {str(old_value):<24} {str(new_value):<24} {count:>6}")
+            print()
+            for diff in rows:
+                print(f"{diff.mac_message_id} {diff.column_name}: {diff.old_value} -> {diff.new_value}")
+    finally:
+        await advisory_locks.close()
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="결제시간 범위 backfill (Slack/스케줄러 없이)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="stage 하나를 결제시간 범위에 대해 실행 (같은 run_id면 이어서)")
+    run_parser.add_argument("stage", choices=list(BACKFILL_STAGES))
+    run_parser.add_argument("--start", type=_parse_time, required=True, help="결제시간 >= start (UTC, ISO 형식)")
+    run_parser.add_argument("--end", type=_parse_time, required=True, help="결제시간 < end (UTC, ISO 형식)")
+    run_parser.add_argument("--reprocess", action="store_true", help="이미 처리된 row도 다시 처리 (divide, classify)")
+    run_parser.add_argument("--dry-run", action="store_true", help="장부 대신 backfill_diff에 제안 변경만 기록")
+    run_parser.add_argument("--run-id", help="기본: stage/범위/옵션으로 만든 이름 (같은 명령을 다시 실행하면 이어서)")
+    run_parser.add_argument("--restart", action="store_true", help="기존 run의 cursor와 dry-run 기록을 지우고 처음부터")
+    run_parser.add_argument("--chunk-size", type=int, default=BACKFILL_CHUNK_SIZE)
+    run_parser.add_argument("--concurrency", type=int, default=BACKFILL_MAX_CONCURRENCY, help="LLM worker pool 동시성 상한")
+    status_parser = subparsers.add_parser("status", help="최근 backfill run 목록")
+    status_parser.add_argument("run_id", nargs="?")
+    diff_parser = subparsers.add_parser("diff", help="dry-run run의 제안 변경")
+    diff_parser.add_argument("run_id")
+    diff_parser.add_argument("--limit", type=int, default=50)
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,83 @@
+"""Runner 재사용 + 호출별 세션 삭제 시 메모리가 호출 수에 비례해 늘지 않는지 확인
+
+    uv run python -m benchmarks.bench_agent_runner --calls 10000
+
+LLM 대신 고정 응답을 돌려주는 stub 모델로 run_agent를 반복 호출하고,
+워밍업 이후 tracemalloc 증가량이 상한 이내이며 남은 세션이 0개인지 assert한다.
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+from typing import AsyncGenerator
+
+from google.adk.agents import LlmAgent
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import types
+
+from agent_runner import run_agent, open_session_count, _runners
+from agents.message_divider_agent import DividedMessageOutput
+
+STUB_RESPONSE = DividedMessageOutput(
+    transaction_type="승인", amount=12000, currency="KRW", transaction_party="스타벅스"
+).model_dump_json()
+
+
+class StubLlm(BaseLlm):
+    model: str = "stub"
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False) \
+            -> AsyncGenerator[LlmResponse, None]:
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=STUB_RESPONSE)]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=1, candidates_token_count=1, total_token_count=2
+            ),
+        )
+
+
+stub_agent = LlmAgent(
+    name="stub_divider_agent",
+    model=StubLlm(),
+    instruction="stub",
+    output_schema=DividedMessageOutput,
+)
+
+
+async def run_calls(count: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(index):
+        async with semaphore:
+            await run_agent(stub_agent, f"[Web발신] 삼성카드 승인 {index:,}원", use_cache=False)
+
+    await asyncio.gather(*(call(index) for index in range(count)))
+
+
+def run(calls: int, concurrency: int, max_growth_mb: float):
+    # 워밍업: Runner 생성, import 지연 로딩 등 1회성 할당을 측정에서 제외
+    asyncio.run(run_calls(200, concurrency))
+
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    started = time.perf_counter()
+    asyncio.run(run_calls(calls, concurrency))
+    elapsed = time.perf_counter() - started
+    growth = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(baseline, "filename"))
+    tracemalloc.stop()
+
+    growth_mb = growth / 1024 / 1024
+    print(f"{calls}회 호출: {elapsed:.2f}s ({calls / elapsed:.0f} calls/s), "
+          f"메모리 증가 {growth_mb:.2f}MB, 남은 세션 {open_session_count()}개, Runner {len(_runners)}개")
+    assert open_session_count() == 0, "호출이 끝난 세션이 삭제되지 않았습니다"
+    assert len(_runners) == 1, "같은 에이전트의 Runner가 재사용되지 않았습니다"
+    assert growth_mb < max_growth_mb, f"메모리 증가량이 상한({max_growth_mb}MB)을 넘었습니다"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-growth-mb", type=float, default=5.0)
+    args = parser.parse_args()
+    run(args.calls, args.concurrency, args.max_growth_mb)
@@ -0,0 +1,71 @@
+"""단건 호출 vs 배치 호출: 항목당 입력 토큰과 100건당 소요 시간 비교
+
+    uv run python -m benchmarks.bench_batched_prompts --rows 100 --batch-sizes 1 5 10 20
+    uv run python -m benchmarks.bench_batched_prompts --rows 100 --batch-sizes 1 10 --live   # 실제 API 호출
+
+토큰 수는 litellm.token_counter로 instruction + 프롬프트를 세어 계산하므로 API 키 없이도 비교할 수 있다.
+--live는 OPENAI_API_KEY로 실제 호출(캐시 미사용)하여 wall-clock을 잰다.
+"""
+import argparse
+import asyncio
+import time
+
+from litellm import token_counter
+
+from agents.batch import build_batch_prompt
+from agents.message_divider_agent import card_message_divider_agent, card_message_divider_batch_agent
+from agent_runner import run_agent
+from message_parsers import MESSAGE_PARSERS
+
+MODEL = "gpt-5-mini"
+
+
+def sample_items(row_count):
+    examples = [message for templates in MESSAGE_PARSERS.values() for template in templates
+                for message, _ in template.examples]
+    return [(f"BENCH_{i}", examples[i % len(examples)]) for i in range(row_count)]
+
+
+def tokens_per_item(items, batch_size):
+    if batch_size <= 1:
+        agent = card_message_divider_agent
+        total = sum(token_counter(model=MODEL, text=agent.instruction + prompt) for _, prompt in items)
+    else:
+        agent = card_message_divider_batch_agent
+        total = sum(
+            token_counter(model=MODEL, text=agent.instruction + build_batch_prompt(items[i:i + batch_size]))
+            for i in range(0, len(items), batch_size)
+        )
+    return total / len(items)
+
+
+async def live_seconds(items, batch_size):
+    agent = card_message_divider_agent if batch_size <= 1 else card_message_divider_batch_agent
+    chunks = [items[i:i + max(batch_size, 1)] for i in range(0, len(items), max(batch_size, 1))]
+
+    async def call(chunk):
+        prompt = chunk[0][1] if batch_size <= 1 else build_batch_prompt(chunk)
+        await run_agent(agent, prompt, use_cache=False)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call(chunk) for chunk in chunks))
+    return time.perf_counter() - started
+
+
+def run(row_count, batch_sizes, live):
+    items = sample_items(row_count)
+    for batch_size in batch_sizes:
+        line = f"batch_size={batch_size:>3} | 입력 토큰/건 {tokens_per_item(items, batch_size):8.1f}"
+        if live:
+            seconds = asyncio.run(live_seconds(items, batch_size))
+            line += f" | 100건당 {seconds * 100 / row_count:7.2f}s"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--live", action="store_true")
+    args = parser.parse_args()
+    run(args.rows, args.batch_sizes, args.live)
@@ -0,0 +1,70 @@
+"""로컬 분류기 cascade: 합성 확정 이력으로 학습/보정하고 holdout에서 로컬 처리율, 정확도, ECE, 예측 시간 측정
+
+가맹점(브랜드)마다 지점명/법인 표기가 다른 거래상대 변형을 만들고, 브랜드마다 분류 조합을 정한다.
+- 일부 브랜드는 금액에 따라 분류가 갈리고(소액은 경비, 고액은 판매용상품), 일부 row는 사람이 다르게 분류한 노이즈
+- 시간순으로 새 브랜드가 계속 생겨서 holdout에는 학습 때 못 본 가맹점도 섞인다 (LLM으로 가야 정상)
+
+    uv run python -m benchmarks.bench_local_classifier --rows 20000 100000
+"""
+import argparse
+import datetime
+import random
+import time
+
+from benchmarks.bench_ngram_index import make_brands, make_variant
+from benchmarks.synthetic_data import MERCHANTS
+from local_classifier import LabelledTransaction, train, print_metrics
+
+LABELS = sorted({(purpose, main, sub) for _, purpose, main, sub, _ in MERCHANTS})
+SENDERS = ["현대카드", "신한카드", "삼성카드", "국민카드", "하나은행"]
+
+
+def make_records(row_count, brand_count, noise, seed=7):
+    rng = random.Random(seed)
+    brands = make_brands(brand_count, rng)
+    profiles = {}
+    for brand in brands:
+        currency = "JPY" if rng.random() < 0.2 else "KRW"
+        base = rng.choice([3_000, 10_000, 50_000, 300_000]) if currency == "KRW" else rng.choice([500, 3_000, 20_000])
+        split = rng.choice(LABELS) if rng.random() < 0.15 else None  # 고액이면 다른 분류
+        profiles[brand] = (rng.choice(LABELS), split, currency, base, rng.choice(SENDERS))
+
+    records = []
+    start = datetime.datetime(2025, 1, 1)
+    for position in range(row_count):
+        # 뒤로 갈수록 새 브랜드가 등장하도록 브랜드 범위를 시간에 따라 넓힘
+        active = max(20, int(len(brands) * (0.5 + 0.5 * position / row_count)))
+        brand = brands[min(int(rng.paretovariate(1.2)) - 1, active - 1)] if rng.random() < 0.5 else rng.choice(brands[:active])
+        label, split, currency, base, sender = profiles[brand]
+        amount = max(1, int(base * rng.lognormvariate(0, 0.8)))
+        if split is not None and amount > base * 2:
+            label = split
+        if rng.random() < noise:
+            label = rng.choice(LABELS)
+        records.append(LabelledTransaction(
+            start + datetime.timedelta(minutes=position * 7), make_variant(brand, rng), amount, currency,
+            sender if rng.random() < 0.9 else rng.choice(SENDERS), *label
+        ))
+    return records
+
+
+def run(row_counts, brand_count, noise, holdout, epochs):
+    for row_count in row_counts:
+        records = make_records(row_count, brand_count, noise)
+        started = time.perf_counter()
+        model = train(records, holdout=holdout, epochs=epochs)
+        seconds = time.perf_counter() - started
+        print(f"rows={row_count} brands={brand_count} noise={noise:.0%} classes={len(model.labels)} "
+              f"train+calibrate {seconds:.1f}s")
+        print_metrics(model.metrics)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[20_000, 100_000])
+    parser.add_argument("--brands", type=int, default=2000)
+    parser.add_argument("--noise", type=float, default=0.03)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--epochs", type=int, default=8)
+    args = parser.parse_args()
+    run(args.rows, args.brands, args.noise, args.holdout, args.epochs)
@@ -0,0 +1,142 @@
+"""infer_account 유사 거래 검색: rapidfuzz(fuzz.ratio > 70) vs 문자 n-gram TF-IDF 인덱스의 지연시간/recall 비교
+
+가맹점(브랜드)마다 지점명/법인 표기/대소문자/공백이 다른 거래상대 변형을 만들고,
+대상 거래상대와 같은 가맹점의 변형을 정답 이웃으로 본다.
+- recall@k: top-k 안에 들어온 같은 가맹점 이웃 수 / min(k, 같은 가맹점 이웃 수)
+- noise: 돌려준 이웃 중 다른 가맹점 비율
+
+    uv run python -m benchmarks.bench_ngram_index --targets 200 --history 10000 100000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from types import SimpleNamespace
+
+from benchmarks.bench_similarity_index import loop_search
+from ngram_index import NgramIndex, NgramSimilarityIndex
+from similarity_index import SimilarityIndex
+
+SYLLABLES = ["스타", "벅스", "쿠", "팡", "올리", "브", "영", "다이", "소", "롯데", "신세", "계", "현대", "이마", "트", "홈",
+             "플러", "무신", "사", "배달", "민족", "카카", "오", "네이", "버", "마켓", "컬리", "교보", "문고", "파리",
+             "바게", "뜨", "투썸", "메가", "커피", "빽다", "방", "맘스", "터치", "편의", "점"]
+LATIN_BRANDS = ["UNIQLO", "GU", "MUJI", "BEAMS", "COS", "ZARA", "H&M", "CU", "GS25", "LAWSON", "FAMILYMART",
+                "SEVEN-ELEVEN", "AMAZON", "APPLE", "GOOGLE", "ADOBE", "NOTION", "SLACK", "FIGMA", "AWS"]
+BRANCHES = ["본점", "강남점", "신촌점", "잠실점", "홍대입구점", "판교점", "인천공항점", "부산서면점", "온라인", "면세점",
+            "新宿店", "渋谷店", "ONLINE STORE", "KOREA"]
+
+
+def make_brands(count, rng):
+    brands = list(LATIN_BRANDS)
+    while len(brands) < count:
+        brand = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+        if brand not in brands:
+            brands.append(brand)
+    return brands[:count]
+
+
+def make_variant(brand, rng):
+    """SMS마다 다르게 찍히는 가맹점 이름 흉내: 지점명, 법인 표기, 대소문자, 공백"""
+    name = brand
+    if rng.random() < 0.7:
+        name += rng.choice(["", " "]) + rng.choice(BRANCHES)
+    if rng.random() < 0.2:
+        name = rng.choice(["(주)", "㈜", "주식회사 "]) + name
+    if rng.random() < 0.1:
+        name += " CO.,LTD"
+    if rng.random() < 0.2:
+        name = name.lower() if rng.random() < 0.5 else name.replace(" ", "")
+    return name
+
+
+def make_dataset(brand_count, history_size, target_count, seed=7):
+    rng = random.Random(seed)
+    brands = make_brands(brand_count, rng)
+    history = [(make_variant(brand, rng), brand) for brand in (rng.choice(brands) for _ in range(history_size))]
+    targets = [(make_variant(brand, rng), brand) for brand in (rng.choice(brands) for _ in range(target_count))]
+    return history, targets
+
+
+def evaluate(neighbours, targets, brand_of, brand_sizes, k):
+    """쿼리별 recall@k와 noise 평균"""
+    recalls, noises = [], []
+    for query, brand in targets:
+        hits = [name for name, _ in neighbours.get(query, [])][:k]
+        relevant = sum(1 for name in hits if brand_of[name] == brand)
+        expected = min(k, brand_sizes[brand] - (1 if query in brand_of else 0)) or 1
+        recalls.append(min(1.0, relevant / expected))
+        noises.append((len(hits) - relevant) / len(hits) if hits else 0.0)
+    return sum(recalls) / len(recalls), sum(noises) / len(noises)
+
+
+def run(target_count, history_sizes, brand_count, k, ngram_cutoff):
+    for history_size in history_sizes:
+        history, targets = make_dataset(brand_count, history_size, target_count)
+        brand_of = dict(history)
+        brand_sizes = {}
+        for name in brand_of:
+            brand_sizes[brand_of[name]] = brand_sizes.get(brand_of[name], 0) + 1
+        records = [SimpleNamespace(거래상대=name) for name, _ in history]
+        queries = [name for name, _ in targets]
+
+        # 기존 방식: 대상마다 모든 레코드와 fuzz.ratio 비교 (history가 크면 오래 걸려 1만 건까지만)
+        if history_size <= 20_000:
+            started = time.perf_counter()
+            loop_search(queries, records)
+            loop_seconds = f"{time.perf_counter() - started:8.3f}s"
+        else:
+            loop_seconds = "   (skip)"
+
+        started = time.perf_counter()
+        fuzz_index = SimilarityIndex(records)
+        fuzz_neighbours = fuzz_index.search(queries, score_cutoff=70)
+        fuzz_seconds = time.perf_counter() - started
+        fuzz_neighbours = {query: [(name, score) for name, score in hits if score > 70]
+                           for query, hits in fuzz_neighbours.items()}
+
+        started = time.perf_counter()
+        ngram_index = NgramIndex()
+        ngram_similarity = NgramSimilarityIndex(records, ngram_index=ngram_index)
+        build_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        ngram_neighbours = ngram_similarity.search(queries, score_cutoff=ngram_cutoff, limit=k)
+        search_seconds = time.perf_counter() - started
+
+        # 디스크 저장/로드와 증분 추가 (재시작 시 전체 재구축 대신 새 거래상대만 추가)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.npz")
+            started = time.perf_counter()
+            ngram_index.save(path)
+            save_seconds = time.perf_counter() - started
+            size_kb = os.path.getsize(path) / 1024
+            started = time.perf_counter()
+            loaded = NgramIndex.load(path)
+            load_seconds = time.perf_counter() - started
+        assert loaded.search(queries, limit=k) == ngram_index.search(queries, limit=k), "저장/로드 후 검색 결과가 다름"
+        new_names = [f"{make_variant(brand, random.Random(i))} {i}" for i, (_, brand) in enumerate(history[:100])]
+        started = time.perf_counter()
+        loaded.add(new_names)
+        loaded.search(queries[:1], limit=k)
+        incremental_seconds = time.perf_counter() - started
+
+        fuzz_recall, fuzz_noise = evaluate(fuzz_neighbours, targets, brand_of, brand_sizes, k)
+        ngram_recall, ngram_noise = evaluate(ngram_neighbours, targets, brand_of, brand_sizes, k)
+        print(f"history={history_size:>7} distinct={len(ngram_index):>6} targets={target_count} k={k}")
+        print(f"  fuzz.ratio loop   {loop_seconds}")
+        print(f"  fuzz.ratio cdist  {fuzz_seconds:8.3f}s | recall@{k} {fuzz_recall:.3f} | noise {fuzz_noise:.3f}")
+        print(f"  n-gram TF-IDF     {build_seconds:8.3f}s build + {search_seconds:.3f}s search | "
+              f"recall@{k} {ngram_recall:.3f} | noise {ngram_noise:.3f} (cutoff {ngram_cutoff})")
+        print(f"  persist           save {save_seconds:.3f}s ({size_kb:.0f}KB) | load {load_seconds:.3f}s | "
+              f"+100 names & search {incremental_seconds:.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--targets", type=int, default=200)
+    parser.add_argument("--history", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--brands", type=int, default=500)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--ngram-cutoff", type=float, default=50)
+    args = parser.parse_args()
+    run(args.targets, args.history, args.brands, args.k, args.ngram_cutoff)
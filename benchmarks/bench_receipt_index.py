@@ -0,0 +1,79 @@
+"""link_receipt_to_payments 매칭: 기존 전체 스캔 vs ReceiptIndex(bisect + 전역 배정) 비교
+
+    uv run python -m benchmarks.bench_receipt_index --receipts 10000 --payments 1000
+"""
+import argparse
+import datetime
+import random
+import time
+from types import SimpleNamespace
+
+from receipt_index import ReceiptIndex, receipt_currency_code
+
+
+def make_data(receipt_count, payment_count, seed=7):
+    rng = random.Random(seed)
+    start = datetime.date(2025, 1, 1)
+    receipts = [
+        SimpleNamespace(
+            idtbl_receipt=i,
+            receipt_currency=rng.choice([0, 1]),
+            receipt_price=rng.randrange(1000, 500000, 100),
+            cash_receipt_price=rng.choice([0, 0, 0, 1000]),
+            buying_date=start + datetime.timedelta(days=rng.randrange(365)),
+        )
+        for i in range(receipt_count)
+    ]
+    payments = []
+    for i in range(payment_count):
+        receipt = rng.choice(receipts)
+        payments.append(SimpleNamespace(
+            mac_message_id=f"SJ_{i}",
+            currency=receipt_currency_code(receipt.receipt_currency),
+            amount=receipt.receipt_price + receipt.cash_receipt_price,
+            결제시간=datetime.datetime.combine(receipt.buying_date, datetime.time(12))
+                 + datetime.timedelta(days=rng.randrange(-5, 6)),
+        ))
+    return receipts, payments
+
+
+def scan_match(receipts, payments):
+    """기존 방식: 결제마다 모든 Receipt를 비교 (같은 Receipt 중복 연결 가능)"""
+    linked = 0
+    for payment in payments:
+        matching = []
+        for receipt in receipts:
+            total = (receipt.cash_receipt_price or 0) + (receipt.receipt_price or 0)
+            if payment.currency == receipt_currency_code(receipt.receipt_currency) and payment.amount == total:
+                date_diff = abs((payment.결제시간.date() - receipt.buying_date).days)
+                if date_diff <= 30:
+                    matching.append((receipt, date_diff))
+        if matching:
+            linked += 1
+    return linked
+
+
+def run(receipt_count, payment_count):
+    receipts, payments = make_data(receipt_count, payment_count)
+
+    started = time.perf_counter()
+    scan_linked = scan_match(receipts, payments)
+    scan_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index = ReceiptIndex(receipts)
+    matches = index.assign(payments)
+    index_seconds = time.perf_counter() - started
+
+    print(f"receipts={receipt_count} payments={payment_count} | "
+          f"scan {scan_seconds:.3f}s ({scan_linked} linked) | "
+          f"index {index_seconds:.4f}s ({len(matches)} linked, receipt 중복 없음) | "
+          f"speedup x{scan_seconds / index_seconds:.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--receipts", type=int, default=10_000)
+    parser.add_argument("--payments", type=int, default=1_000)
+    args = parser.parse_args()
+    run(args.receipts, args.payments)
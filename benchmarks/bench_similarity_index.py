@@ -0,0 +1,58 @@
+"""infer_account 유사 거래 검색: 기존 fuzz.ratio 루프 vs SimilarityIndex(cdist) 비교
+
+    uv run python -m benchmarks.bench_similarity_index --targets 50 --history 10000 100000
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from rapidfuzz import fuzz
+
+from similarity_index import SimilarityIndex
+
+BRANDS = ["UNIQLO", "스타벅스", "쿠팡", "네이버페이", "GU", "MUJI", "BEAMS", "신세계백화점", "롯데백화점", "현대백화점",
+          "COS", "ZARA", "H&M", "다이소", "올리브영", "CU", "GS25", "LAWSON", "FAMILYMART", "SEVEN-ELEVEN"]
+SUFFIXES = ["", " 본점", " 강남점", " 신촌점", "(주)", " CO.", " 新宿店", " 渋谷店", " ONLINE", " 면세점"]
+
+
+def make_names(count, seed):
+    rng = random.Random(seed)
+    return [f"{rng.choice(BRANDS)}{rng.choice(SUFFIXES)}{rng.randint(0, count // 10)}" for _ in range(count)]
+
+
+def loop_search(targets, records):
+    """기존 infer_account 방식: 대상마다 모든 레코드와 한 쌍씩 비교"""
+    return {
+        target: [record for record in records if record.거래상대 and fuzz.ratio(target, record.거래상대) > 70]
+        for target in targets
+    }
+
+
+def run(target_count, history_sizes):
+    targets = make_names(target_count, seed=1)
+    for history_size in history_sizes:
+        records = [SimpleNamespace(거래상대=name) for name in make_names(history_size, seed=2)]
+
+        started = time.perf_counter()
+        loop_search(targets, records)
+        loop_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        index = SimilarityIndex(records)
+        build_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        index.similar_records(targets, score_cutoff=70)
+        search_seconds = time.perf_counter() - started
+
+        print(f"history={history_size:>7} targets={target_count} distinct={len(index):>6} | "
+              f"loop {loop_seconds:8.3f}s | index build {build_seconds:6.3f}s + search {search_seconds:6.3f}s | "
+              f"speedup x{loop_seconds / (build_seconds + search_seconds):.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--targets", type=int, default=50)
+    parser.add_argument("--history", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+    run(args.targets, args.history)
@@ -0,0 +1,105 @@
+"""OpenAI 대신 쓰는 결정적 stub 모델
+
+LiteLlm을 상속해 에이전트에 그대로 끼울 수 있고, 호출마다 지정한 지연을 흉내낸 뒤
+출력 스키마(단건/배치, 문자 분해/계정 분류)에 맞는 응답을 프롬프트에서 결정적으로 만들어 돌려준다.
+"""
+import asyncio
+import hashlib
+import json
+import re
+from typing import AsyncGenerator
+
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.models.lite_llm import LiteLlm
+from google.genai import types
+
+from agents.account_classifier import AccountClassificationOutput, AccountClassificationBatchOutput
+from agents.message_divider_agent import DividedMessageOutput, DividedMessageBatchOutput
+from message_parsers import MESSAGE_PARSERS, normalize_message
+
+CLASSIFICATIONS = [
+    ("경비", "운영비", "소모품비"),
+    ("경비", "출장비", "교통비"),
+    ("판매용상품", "상품비", "국내상품"),
+    ("판매용상품", "상품비", "해외상품"),
+    ("개인사용", "생활비", "식비"),
+]
+AMOUNT_PATTERN = re.compile(r'(\d[\d,]*)(?:원|\.00)?')
+
+
+def _stable_hash(text: str) -> int:
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def divide_message(prompt: str) -> dict:
+    """등록된 템플릿으로 분해하고, 맞지 않으면 첫 금액과 마지막 줄로 결정적 결과 생성"""
+    text = normalize_message(prompt)
+    for templates in MESSAGE_PARSERS.values():
+        for template in templates:
+            divided_message = template.parse(text)
+            if divided_message is not None:
+                return divided_message.model_dump()
+    amount_match = AMOUNT_PATTERN.search(text)
+    lines = text.splitlines() or [""]
+    return DividedMessageOutput(
+        transaction_type="승인",
+        amount=int(amount_match.group(1).replace(",", "")) if amount_match else 0,
+        currency="JPY" if "JPY" in text else "KRW",
+        transaction_party=lines[-1][:40] or "미확인",
+    ).model_dump()
+
+
+def classify_account(prompt: str) -> dict:
+    party_match = re.search(r'거래상대:\s*([^,\n]+)', prompt)
+    party = party_match.group(1).strip() if party_match else prompt
+    purpose, main, sub = CLASSIFICATIONS[_stable_hash(party) % len(CLASSIFICATIONS)]
+    return AccountClassificationOutput(
+        business_purpose=purpose, main_category=main, sub_category=sub,
+        confidence=0.8, reason=f"stub 분류 ({party})"
+    ).model_dump()
+
+
+class StubLiteLlm(LiteLlm):
+    """response_schema에 따라 결정적 응답을 만드는 LiteLlm 대체 모델"""
+
+    latency_seconds: float = 0.0
+    calls: int = 0
+    items: int = 0
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False) \
+            -> AsyncGenerator[LlmResponse, None]:
+        prompt = "".join(
+            part.text or "" for content in llm_request.contents if content.role == "user" for part in content.parts or []
+        )
+        schema = llm_request.config.response_schema if llm_request.config else None
+        if schema in (DividedMessageBatchOutput, AccountClassificationBatchOutput):
+            handler = divide_message if schema is DividedMessageBatchOutput else classify_account
+            items = json.loads(prompt)
+            response = {"items": [{"mac_message_id": item["mac_message_id"], **handler(item["input"])} for item in items]}
+            self.items += len(items)
+        elif schema is DividedMessageOutput:
+            response = divide_message(prompt)
+            self.items += 1
+        else:
+            response = classify_account(prompt)
+            self.items += 1
+        self.calls += 1
+
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        text = json.dumps(response, ensure_ascii=False)
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=text)]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=len(prompt) // 2, candidates_token_count=len(text) // 2,
+                total_token_count=(len(prompt) + len(text)) // 2
+            ),
+        )
+
+
+def install_stub_model(agents, latency_seconds: float = 0.0) -> StubLiteLlm:
+    """주어진 에이전트들의 model을 하나의 StubLiteLlm으로 교체"""
+    stub = StubLiteLlm(model="stub/deterministic", latency_seconds=latency_seconds)
+    for agent in agents:
+        agent.model = stub
+    return stub
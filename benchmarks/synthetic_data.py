@@ -0,0 +1,200 @@
+"""벤치마크용 합성 장부_결제문자 / tbl_receipt 데이터
+
+실제 발신번호별 문자 형식, 반복 등장하는 가맹점, 승인-승인취소 쌍, 이미 분류된 과거 이력,
+SJ/HJ 중복 수신(현대카드), 판매용상품 결제에 대응하는 영수증을 seed 기반으로 재현 가능하게 만든다.
+"""
+import datetime
+import random
+from typing import Dict, List, NamedTuple
+
+from config import CARD_SENDER_LIST, BANK_SENDER_LIST
+
+KST = datetime.timedelta(hours=9)
+START_TIME = datetime.datetime(2025, 9, 1)  # message_divider_run 필터 이후 (UTC)
+
+# (가맹점, 거래목적, 계정과목_대, 계정과목_소, 통화)
+MERCHANTS = [
+    ("스타벅스", "경비", "운영비", "복리후생비", "KRW"),
+    ("쿠팡", "경비", "운영비", "소모품비", "KRW"),
+    ("네이버페이", "경비", "운영비", "소모품비", "KRW"),
+    ("카카오T", "경비", "출장비", "교통비", "KRW"),
+    ("대한항공", "경비", "출장비", "항공료", "KRW"),
+    ("GS25", "개인사용", "생활비", "식비", "KRW"),
+    ("올리브영", "개인사용", "생활비", "생활용품", "KRW"),
+    ("롯데백화점", "판매용상품", "상품비", "국내상품", "KRW"),
+    ("신세계백화점", "판매용상품", "상품비", "국내상품", "KRW"),
+    ("무신사", "판매용상품", "상품비", "국내상품", "KRW"),
+    ("UNIQLO", "판매용상품", "상품비", "해외상품", "JPY"),
+    ("BEAMS", "판매용상품", "상품비", "해외상품", "JPY"),
+    ("ISETAN", "판매용상품", "상품비", "해외상품", "JPY"),
+    ("DON QUIJOTE", "판매용상품", "상품비", "해외상품", "JPY"),
+    ("메타광고", "경비", "광고비", "온라인광고", "KRW"),
+    ("구글광고", "경비", "광고비", "온라인광고", "KRW"),
+    ("국세청", "경비", "세금", "부가세", "KRW"),
+    ("배달의민족", "개인사용", "생활비", "식비", "KRW"),
+]
+BRANCHES = ["", "강남점", "신촌점", "본점", "홍대점", "잠실점", "GINZA", "SHINJUKU", "SHIBUYA", "온라인"]
+
+SENDER_WEIGHTS = {
+    '+8215888900': 25, '+82220008100': 3, '+8215447200': 15, '+8215776200': 20,
+    '+8215881688': 10, '+8215888100': 7, '+82269589000': 5, '+8215993333': 10, '+8215778000': 5,
+}
+HYUNDAI = '+8215776200'
+FOREIGN_CAPABLE = {'+8215888900', '+8215776200'}
+
+
+class SyntheticDataset(NamedTuple):
+    ledger: List[Dict]
+    receipts: List[Dict]
+    counts: Dict[str, int]
+
+
+def _kst(moment: datetime.datetime):
+    local = moment + KST
+    return local.strftime("%m/%d"), local.strftime("%H:%M")
+
+
+def _amount_text(amount: int, currency: str) -> str:
+    return f"{amount:,}원" if currency == "KRW" else f"{currency} {amount:,}.00"
+
+
+def render_message(sender_number: str, transaction_type: str, amount: int, currency: str, party: str,
+                   moment: datetime.datetime, rng: random.Random) -> str:
+    """발신번호별 실제 문자 형식으로 원문 생성"""
+    mmdd, hhmm = _kst(moment)
+    card = f"{rng.randrange(10000):04d}"
+    money = _amount_text(amount, currency)
+    kind = "해외" + transaction_type if currency != "KRW" and transaction_type == "승인" else transaction_type
+    cumulative = f"누적{rng.randrange(100000, 9000000):,}원"
+    if sender_number in ('+8215888900', '+82220008100'):
+        return f"[Web발신]\n삼성{card}{kind} 고*지\n{money} 일시불\n{mmdd} {hhmm} {party}\n{cumulative}"
+    if sender_number == '+8215447200':
+        cancel = "취소" if transaction_type == "승인취소" else kind
+        return f"[Web발신]\n신한카드({card}){cancel} 고*지 {money}(일시불){mmdd} {hhmm} {party} {cumulative}"
+    if sender_number == HYUNDAI:
+        return f"[Web발신]\n현대카드 M {kind}\n고*지\n{money} 일시불\n{mmdd} {hhmm}\n{party}\n{cumulative}"
+    if sender_number == '+8215881688':
+        return f"[Web발신]\nKB국민카드{card}{kind}\n고*지님\n{money} 일시불\n{mmdd} {hhmm}\n{party}\n{cumulative}"
+    if sender_number == '+8215888100':
+        return f"[Web발신]\n롯데{card}{kind}\n고*지\n{money} 일시불\n{mmdd} {hhmm}\n{party}\n{cumulative}"
+    if sender_number == '+82269589000':
+        return f"[Web발신]\n우리({card}){kind}\n고*지님\n{money} 일시불\n{mmdd} {hhmm}\n{party}\n{cumulative}"
+    balance = f"잔액 {rng.randrange(100000, 50000000):,}원"
+    if sender_number == '+8215993333':
+        return f"[Web발신]\n[카카오뱅크]\n고*지({card})\n{mmdd} {hhmm}\n{transaction_type} {amount:,}원\n{party}\n{balance}"
+    return f"[Web발신]\n신한{mmdd} {hhmm}\n110-***-{card}56\n{transaction_type} {amount:,}\n{balance}\n {party}"
+
+
+def render_irregular_message(sender_number: str, amount: int, party: str, moment: datetime.datetime) -> str:
+    """파서 템플릿에 맞지 않아 LLM fallback으로 가는 안내형 문자"""
+    mmdd, hhmm = _kst(moment)
+    sender_name = CARD_SENDER_LIST.get(sender_number) or BANK_SENDER_LIST.get(sender_number)
+    return f"[Web발신]\n[{sender_name}] 결제 안내\n{mmdd} {hhmm} {party}에서 {amount:,}원이 결제되었습니다."
+
+
+def generate_dataset(row_count: int, seed: int = 42, classified_ratio: float = 0.6, cancel_ratio: float = 0.03,
+                     irregular_ratio: float = 0.05, receipt_ratio: float = 0.7, days: int = 180) -> SyntheticDataset:
+    """장부_결제문자 약 row_count건과 영수증을 생성
+
+    앞쪽 classified_ratio 만큼은 이미 분해/분류가 끝난 과거 이력이고, 나머지는 파이프라인이 처리할 새 문자다.
+    """
+    rng = random.Random(seed)
+    senders = list(SENDER_WEIGHTS)
+    weights = [SENDER_WEIGHTS[sender] for sender in senders]
+    parties = [(f"{name}{branch}".strip(), name, purpose, main, sub, currency)
+               for name, purpose, main, sub, currency in MERCHANTS for branch in BRANCHES]
+    span_seconds = days * 24 * 3600
+    moments = sorted(START_TIME + datetime.timedelta(seconds=rng.randrange(span_seconds)) for _ in range(row_count))
+
+    ledger = []
+    receipts = []
+    counts = {"approvals": 0, "cancels": 0, "duplicates": 0, "irregular": 0, "classified": 0, "receipts": 0}
+    sequence = 0
+
+    def add_row(prefix, sender_number, moment, message, divided=None, classification=None):
+        nonlocal sequence
+        sequence += 1
+        row = {
+            "mac_message_id": f"{prefix}_{sequence:09d}",
+            "message": message,
+            "장부에포함": None,
+            "결제시간": moment,
+            "발신번호": sender_number,
+            "transaction_type": None, "amount": None, "currency": None, "거래상대": None,
+            "발신자명": None, "거래목적": None, "계정과목_대": None, "계정과목_소": None,
+            "account_reason": None, "confidence": None, "idtbl_receipt": None,
+        }
+        if divided is not None:
+            row.update(divided)
+            row["장부에포함"] = True
+            row["발신자명"] = CARD_SENDER_LIST.get(sender_number) or BANK_SENDER_LIST.get(sender_number)
+        if classification is not None:
+            row.update(classification)
+        ledger.append(row)
+        return row
+
+    classified_until = int(row_count * classified_ratio)
+    for index, moment in enumerate(moments):
+        if len(ledger) >= row_count:
+            break
+        sender_number = rng.choices(senders, weights)[0]
+        party, name, purpose, main, sub, currency = rng.choice(parties)
+        is_bank = sender_number in BANK_SENDER_LIST
+        if currency != "KRW" and sender_number not in FOREIGN_CAPABLE:
+            currency = "KRW"
+        amount = rng.randrange(1000, 300000, 100) if currency == "KRW" else rng.randrange(500, 60000, 100)
+        transaction_type = rng.choice(["입금", "출금"]) if is_bank else "승인"
+        prefix = rng.choice(["SJ", "HJ"])
+        history = index < classified_until
+
+        if not history and rng.random() < irregular_ratio:
+            message = render_irregular_message(sender_number, amount, party, moment)
+            counts["irregular"] += 1
+        else:
+            message = render_message(sender_number, transaction_type, amount, currency, party, moment, rng)
+
+        divided = {"transaction_type": transaction_type, "amount": amount, "currency": currency, "거래상대": party} \
+            if history else None
+        classification = {
+            "거래목적": purpose, "계정과목_대": main, "계정과목_소": sub,
+            "account_reason": f"{name} 반복 거래", "confidence": 0.95,
+        } if history and transaction_type == "승인" else None
+        row = add_row(prefix, sender_number, moment, message, divided, classification)
+        counts["approvals"] += transaction_type == "승인"
+        counts["classified"] += classification is not None
+
+        # 현대카드 문자는 두 폰(SJ/HJ)에 모두 수신되어 SJ 쪽이 중복 처리 대상
+        if sender_number == HYUNDAI and prefix == "HJ" and rng.random() < 0.5:
+            add_row("SJ", sender_number, moment, message, divided)
+            counts["duplicates"] += 1
+
+        if transaction_type == "승인" and rng.random() < cancel_ratio:
+            cancel_moment = moment + datetime.timedelta(seconds=rng.randrange(3600, 5 * 24 * 3600))
+            cancel_amount = amount if rng.random() < 0.8 else amount // 2
+            cancel_message = render_message(sender_number, "승인취소", cancel_amount, currency, party, cancel_moment, rng)
+            add_row(prefix, sender_number, cancel_moment, cancel_message,
+                    {"transaction_type": "승인취소", "amount": cancel_amount, "currency": currency, "거래상대": party}
+                    if history else None)
+            counts["cancels"] += 1
+
+        if transaction_type == "승인" and purpose == "판매용상품" and rng.random() < receipt_ratio:
+            receipts.append({
+                "idtbl_receipt": len(receipts) + 1,
+                "receipt_image_path": f"receipts/{row['mac_message_id']}.jpg",
+                "receipt_currency": 0 if currency == "JPY" else 1,
+                "receipt_price": amount,
+                "cash_receipt_price": 0,
+                "buying_date": (moment + KST + datetime.timedelta(days=rng.randrange(-2, 3))).date(),
+                "manager_confirmed": False,
+            })
+            counts["receipts"] += 1
+
+    counts["ledger"] = len(ledger)
+    return SyntheticDataset(ledger, receipts, counts)
+
+
+def parse_row_count(value: str) -> int:
+    """'10k', '100k', '1M' 형태의 건수"""
+    value = value.strip().lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(value[-1], 1)
+    return int(float(value.rstrip("km")) * multiplier)
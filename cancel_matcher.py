@@ -0,0 +1,134 @@
+import bisect
+import datetime
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from rapidfuzz import fuzz
+
+from config import CANCEL_MATCH_WINDOW_DAYS, CANCEL_MATCH_MIN_SIMILARITY, CANCEL_PARTIAL_WINDOW_DAYS
+
+FULL_CANCEL = "전체취소"
+PARTIAL_CANCEL = "부분취소"
+
+
+class LedgerTransaction(NamedTuple):
+    """매칭에 필요한 승인/승인취소 컬럼만 (거래목적/account_reason은 LedgerWriter의 조회 당시 값 확인용)"""
+    mac_message_id: str
+    결제시간: Optional[datetime.datetime]
+    amount: Optional[int]
+    currency: Optional[str]
+    발신자명: Optional[str]
+    거래상대: Optional[str]
+    merchant_id: Optional[int]
+    거래목적: Optional[str]
+    account_reason: Optional[str]
+
+
+class CancelMatch(NamedTuple):
+    refund: object
+    approval: object
+    match_type: str  # FULL_CANCEL 또는 PARTIAL_CANCEL
+    similarity: float
+    seconds_apart: float
+
+
+class CancelMatcher:
+    """승인취소 하나에 승인 하나를 1:1로 매칭
+
+    merchant_id가 있는 승인은 (금액, 통화, 발신자명, merchant_id) 버킷과 (통화, 발신자명, merchant_id) 버킷에 넣어,
+    merchant_id가 있는 승인취소는 같은 가맹점의 승인만 비교한다.
+    merchant_id가 없는 승인취소는 (금액, 통화, 발신자명) 버킷에서 거래상대 문자열 유사도로 전체취소만 찾는다.
+    부분취소는 금액으로 확인할 수 없으므로 같은 가맹점 안에서 partial_window 이내만 자동 매칭하고, 나머지는 수동 확인으로 남긴다.
+    버킷은 시간순으로 넣어두고, 각 승인취소는 자기 버킷 안에서 window 이내의 이전 승인만 비교한다.
+    한 번 매칭된 승인은 다시 쓰지 않는다.
+    """
+
+    def __init__(self, approvals: Iterable, window: datetime.timedelta = datetime.timedelta(days=CANCEL_MATCH_WINDOW_DAYS),
+                 min_similarity: float = CANCEL_MATCH_MIN_SIMILARITY,
+                 partial_window: datetime.timedelta = datetime.timedelta(days=CANCEL_PARTIAL_WINDOW_DAYS)):
+        self.window = window
+        self.partial_window = min(partial_window, window)
+        self.min_similarity = min_similarity
+        self.exact_index: Dict[Tuple, List] = defaultdict(list)
+        self.partial_index: Dict[Tuple, List] = defaultdict(list)
+        for approval in approvals:
+            if approval.결제시간 is None or approval.amount is None:
+                continue
+            self.exact_index[(approval.amount, approval.currency, approval.발신자명)].append(approval)
+            if approval.merchant_id is not None:
+                self.exact_index[(approval.amount, approval.currency, approval.발신자명, approval.merchant_id)].append(approval)
+                self.partial_index[(approval.currency, approval.발신자명, approval.merchant_id)].append(approval)
+        # 버킷을 시간순으로 정렬해두고 window 범위만 bisect로 잘라서 비교
+        self.bucket_times: Dict[int, List] = {}
+        for bucket in list(self.exact_index.values()) + list(self.partial_index.values()):
+            bucket.sort(key=lambda approval: approval.결제시간)
+            self.bucket_times[id(bucket)] = [approval.결제시간 for approval in bucket]
+        self.used = set()
+
+    @staticmethod
+    def _exact_key(refund) -> Tuple:
+        if refund.merchant_id is not None:
+            return refund.amount, refund.currency, refund.발신자명, refund.merchant_id
+        return refund.amount, refund.currency, refund.발신자명
+
+    def _window(self, refund, bucket, window: datetime.timedelta):
+        if bucket is None:
+            return ()
+        times = self.bucket_times.get(id(bucket))
+        if not times:
+            return ()
+        start = bisect.bisect_left(times, refund.결제시간 - window)
+        end = bisect.bisect_right(times, refund.결제시간)
+        return bucket[start:end]
+
+    def _best(self, refund, candidates, match_type):
+        best = None
+        best_key = None
+        window = self.partial_window if match_type == PARTIAL_CANCEL else self.window
+        for approval in self._window(refund, candidates, window):
+            if approval.mac_message_id in self.used:
+                continue
+            seconds_apart = (refund.결제시간 - approval.결제시간).total_seconds()
+            if match_type == PARTIAL_CANCEL and not (0 < refund.amount < approval.amount):
+                continue
+            if refund.merchant_id is not None:
+                score = 100.0  # 같은 가맹점 버킷 안이므로 거래상대 문자열은 비교하지 않음
+            else:
+                score = fuzz.ratio(refund.거래상대 or "", approval.거래상대 or "")
+            if score < self.min_similarity:
+                continue
+            # 거래상대 유사도가 높을수록, 시간이 가까울수록 우선
+            key = (-score, seconds_apart)
+            if best_key is None or key < best_key:
+                best_key = key
+                best = CancelMatch(refund, approval, match_type, score, seconds_apart)
+        return best
+
+    def match(self, refunds: Iterable) -> Tuple[List[CancelMatch], List]:
+        """(매칭 목록, 매칭 실패 승인취소 목록) 반환. 전체취소를 먼저 모두 배정한 뒤 같은 가맹점 안에서 부분취소를 찾는다"""
+        refunds = list(refunds)
+        unmatched = [refund for refund in refunds if refund.결제시간 is None or refund.amount is None]
+        refunds = sorted((refund for refund in refunds if refund.결제시간 is not None and refund.amount is not None),
+                         key=lambda refund: refund.결제시간)
+        matches = []
+        remaining = []
+        for refund in refunds:
+            best = self._best(refund, self.exact_index.get(self._exact_key(refund)), FULL_CANCEL)
+            if best is None:
+                remaining.append(refund)
+                continue
+            self.used.add(best.approval.mac_message_id)
+            matches.append(best)
+
+        for refund in remaining:
+            if refund.merchant_id is None:
+                unmatched.append(refund)
+                continue
+            best = self._best(refund, self.partial_index.get((refund.currency, refund.발신자명, refund.merchant_id)),
+                              PARTIAL_CANCEL)
+            if best is None:
+                unmatched.append(refund)
+                continue
+            self.used.add(best.approval.mac_message_id)
+            matches.append(best)
+        return matches, unmatched
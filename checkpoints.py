@@ -0,0 +1,203 @@
+"""stage별 watermark/checkpoint
+
+각 stage는 시작할 때 pipeline_checkpoint의 (결제시간, mac_message_id) watermark를 읽어 그 이후 row만 조회하고,
+성공적으로 끝나면 시작 시점의 high-water mark로 watermark를 옮긴다. 결제시간이 오래된 문자가 늦게 업로드되는 경우를 위해
+watermark에서 stage별 look-back만큼 되돌아간 시점부터 다시 본다 (look-back이 0이면 (결제시간, mac_message_id) 튜플 비교).
+update_all_records, message_divider, update_cancel_transactions, link_receipt_to_payments처럼 대상 조건이 이미
+"아직 처리되지 않은 row"(부분 인덱스)인 stage는 watermark를 쓰지 않는다 (처리에 실패했거나 늦게 처리할 수 있게 된 row가
+watermark 뒤로 밀려 다시 조회되지 않는 일이 없도록).
+
+    uv run python -m checkpoints status
+    uv run python -m checkpoints reset <stage|all>                        # 다음 실행에서 처음부터 다시 처리
+    uv run python -m checkpoints rewind <stage|all> --hours 48            # watermark를 48시간 되돌림
+    uv run python -m checkpoints rewind <stage|all> --to 2025-10-01T00:00  # watermark를 지정한 시각으로
+"""
+import argparse
+import asyncio
+import datetime
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Iterable, List, Optional, Sequence
+
+from sqlalchemy import delete, or_, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import func
+
+from config import PIPELINE_CHECKPOINT_ENABLED, PIPELINE_CHECKPOINT_LOOKBACK_HOURS
+from database import database_session
+from migrations import check_schema
+from models import PipelineCheckpoint, 장부_결제문자
+from run_guard import current_budget
+from telemetry import current_stage
+
+# checkpoint를 쓰는 stage와 look-back
+CHECKPOINT_LOOKBACK = {
+    "remove_duplicate_message": datetime.timedelta(hours=PIPELINE_CHECKPOINT_LOOKBACK_HOURS),
+}
+
+
+class StageCheckpoint:
+    """한 번의 stage 실행에서 쓰는 watermark (disabled면 filter가 쿼리를 그대로 돌려줌)"""
+
+    def __init__(self, stage: str, watermark_time: Optional[datetime.datetime] = None,
+                 watermark_message_id: Optional[str] = None,
+                 lookback: datetime.timedelta = datetime.timedelta(0), enabled: bool = True):
+        self.stage = stage
+        self.watermark_time = watermark_time
+        self.watermark_message_id = watermark_message_id
+        self.lookback = lookback
+        self.enabled = enabled
+
+    @property
+    def since(self) -> Optional[datetime.datetime]:
+        """이번 실행에서 다시 보는 가장 이른 결제시간"""
+        if not self.enabled or self.watermark_time is None:
+            return None
+        return self.watermark_time - self.lookback
+
+    def filter(self, stmt):
+        """select/update 문에 watermark 이후 조건 추가 (결제시간이 없는 row는 항상 포함)"""
+        if self.since is None:
+            return stmt
+        if self.lookback or self.watermark_message_id is None:
+            after = 장부_결제문자.결제시간 >= self.since
+        else:
+            after = tuple_(장부_결제문자.결제시간, 장부_결제문자.mac_message_id) > \
+                (self.watermark_time, self.watermark_message_id)
+        return stmt.where(or_(after, 장부_결제문자.결제시간.is_(None)))
+
+    def __repr__(self):
+        if self.since is None:
+            return f"StageCheckpoint({self.stage}, 전체)"
+        return f"StageCheckpoint({self.stage}, {self.since} 이후)"
+
+
+def high_water_query():
+    """현재 가장 뒤의 (결제시간, mac_message_id) (ix_ledger_time_message_id를 역순으로 한 건)"""
+    return select(장부_결제문자.결제시간, 장부_결제문자.mac_message_id).where(
+        장부_결제문자.결제시간.is_not(None)
+    ).order_by(장부_결제문자.결제시간.desc(), 장부_결제문자.mac_message_id.desc()).limit(1)
+
+
+@asynccontextmanager
+async def stage_checkpoint(stage: str, mac_message_ids=None) -> AsyncIterator[StageCheckpoint]:
+    """`async with stage_checkpoint(name, mac_message_ids) as checkpoint:` 안에서 checkpoint.filter(stmt)로 조회
+
+    mac_message_ids가 지정된 실행(streaming 파이프라인)과 CHECKPOINT_LOOKBACK에 없는 stage는 watermark를 읽지도 옮기지도 않는다.
+    예외로 끝나면 watermark를 옮기지 않아 다음 실행에서 같은 범위를 다시 본다.
+    """
+    if not PIPELINE_CHECKPOINT_ENABLED or mac_message_ids is not None or stage not in CHECKPOINT_LOOKBACK:
+        yield StageCheckpoint(stage, enabled=False)
+        return
+
+    async with database_session() as db_session:
+        saved = await db_session.get(PipelineCheckpoint, stage)
+        high_water = (await db_session.execute(high_water_query())).first()
+    checkpoint = StageCheckpoint(
+        stage,
+        saved.watermark_time if saved else None,
+        saved.watermark_message_id if saved else None,
+        CHECKPOINT_LOOKBACK[stage]
+    )
+    started_at = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)  # 결제시간과 같은 naive UTC
+    started = time.perf_counter()
+    yield checkpoint
+
+    budget = current_budget()
+    if budget is not None and stage in budget.truncated:
+        # 시간 예산 때문에 일부만 처리했으므로 watermark를 옮기지 않음 (남은 row를 다음 실행에서 다시 봄)
+        print(f"[checkpoint] {checkpoint}: 일부만 처리되어 watermark 유지")
+        return
+
+    recorder = current_stage()
+    values = {
+        "last_run_at": started_at,
+        "last_run_seconds": round(time.perf_counter() - started, 3),
+        "last_rows_in": recorder.rows_in if recorder else None,
+        "last_rows_out": recorder.rows_out if recorder else None,
+        "updated_at": func.now(),
+    }
+    if high_water is not None:
+        values["watermark_time"], values["watermark_message_id"] = high_water
+    async with database_session() as db_session:
+        await db_session.execute(
+            insert(PipelineCheckpoint).values(stage=stage, total_runs=1, **values).on_conflict_do_update(
+                index_elements=[PipelineCheckpoint.stage],
+                set_={**values, "total_runs": PipelineCheckpoint.total_runs + 1}
+            )
+        )
+        await db_session.commit()
+    print(f"[checkpoint] {checkpoint} -> {high_water[0] if high_water else '변경 없음'}")
+
+
+def _resolve_stages(stage: str) -> List[str]:
+    if stage == "all":
+        return list(CHECKPOINT_LOOKBACK)
+    if stage not in CHECKPOINT_LOOKBACK:
+        raise SystemExit(f"알 수 없는 stage: {stage} (가능: {', '.join(CHECKPOINT_LOOKBACK)}, all)")
+    return [stage]
+
+
+async def reset_checkpoints(stages: Iterable[str]) -> int:
+    """checkpoint 삭제 (다음 실행은 stage 쿼리의 기본 범위 전체를 다시 처리)"""
+    async with database_session() as db_session:
+        result = await db_session.execute(delete(PipelineCheckpoint).where(PipelineCheckpoint.stage.in_(list(stages))))
+        await db_session.commit()
+    return result.rowcount
+
+
+async def rewind_checkpoints(stages: Iterable[str], to: Optional[datetime.datetime] = None,
+                             hours: Optional[float] = None) -> int:
+    """watermark를 지정한 시각(to)으로, 또는 hours만큼 되돌림 (앞으로 옮기지는 않음)"""
+    if to is not None:
+        watermark_time = func.least(PipelineCheckpoint.watermark_time, to)
+    else:
+        watermark_time = PipelineCheckpoint.watermark_time - datetime.timedelta(hours=hours)
+    async with database_session() as db_session:
+        result = await db_session.execute(
+            update(PipelineCheckpoint).where(
+                PipelineCheckpoint.stage.in_(list(stages)),
+                PipelineCheckpoint.watermark_time.is_not(None)
+            ).values(watermark_time=watermark_time, watermark_message_id=None, updated_at=func.now())
+        )
+        await db_session.commit()
+    return result.rowcount
+
+
+async def checkpoint_status() -> Sequence[PipelineCheckpoint]:
+    async with database_session() as db_session:
+        return (await db_session.execute(select(PipelineCheckpoint).order_by(PipelineCheckpoint.stage))).scalars().all()
+
+
+async def _main(args):
+    await check_schema()
+    if args.command == "status":
+        saved = {checkpoint.stage: checkpoint for checkpoint in await checkpoint_status()}
+        for stage, lookback in CHECKPOINT_LOOKBACK.items():
+            checkpoint = saved.get(stage)
+            if checkpoint is None:
+                print(f"{stage:>28}: 없음 (다음 실행에서 전체 처리) | look-back {lookback}")
+                continue
+            print(f"{stage:>28}: {checkpoint.watermark_time} {checkpoint.watermark_message_id or ''} | "
+                  f"look-back {lookback} | 마지막 실행 {checkpoint.last_run_at} ({checkpoint.last_run_seconds}s, "
+                  f"in {checkpoint.last_rows_in} / out {checkpoint.last_rows_out}) | 누적 {checkpoint.total_runs}회")
+    elif args.command == "reset":
+        print(f"checkpoint 삭제: {await reset_checkpoints(_resolve_stages(args.stage))}건")
+    else:
+        if (args.to is None) == (args.hours is None):
+            raise SystemExit("--to 또는 --hours 중 하나를 지정하세요")
+        to = datetime.datetime.fromisoformat(args.to) if args.to else None
+        print(f"checkpoint 되돌림: {await rewind_checkpoints(_resolve_stages(args.stage), to, args.hours)}건")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="stage별 checkpoint 관리")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status")
+    reset_parser = subparsers.add_parser("reset", help="checkpoint 삭제")
+    reset_parser.add_argument("stage", help="stage 이름 또는 all")
+    rewind_parser = subparsers.add_parser("rewind", help="watermark 되돌리기")
+    rewind_parser.add_argument("stage", help="stage 이름 또는 all")
+    rewind_parser.add_argument("--to", help="이 시각으로 (결제시간과 같은 UTC 기준, ISO 형식)")
+    rewind_parser.add_argument("--hours", type=float, help="이 시간만큼 되돌림")
+    asyncio.run(_main(parser.parse_args()))
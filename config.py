@@ -5,6 +5,10 @@ dotenv.load_dotenv()
 
 # Database configuration
 POSTGRESQL_DATABASE_DSN = os.getenv('POSTGRESQL_DATABASE_DSN')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))  # 상시 유지할 커넥션 수
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))  # pool_size를 넘어 추가로 열 수 있는 커넥션 수
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))  # 초 단위, 오래된 커넥션 재생성
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))  # 커넥션 대기 최대 시간(초)
 
 # Slack configuration
 SLACK_BOT_TOKEN = os.getenv('SLACK_BOT_TOKEN')
@@ -21,6 +25,129 @@ USER_ID = "modepick"
 # Concurrency configuration
 MAX_CONCURRENT_SESSIONS = 3  # Number of parallel sessions for message processing
 
+# 배치 프롬프트 설정 (한 번의 LLM 호출에 담을 건수, 1이면 단건 호출)
+DIVIDER_BATCH_SIZE = int(os.getenv('DIVIDER_BATCH_SIZE', '10'))
+CLASSIFIER_BATCH_SIZE = int(os.getenv('CLASSIFIER_BATCH_SIZE', '5'))
+LEDGER_WRITE_CHUNK_SIZE = int(os.getenv('LEDGER_WRITE_CHUNK_SIZE', '500'))  # 분해/분류 결과를 한 UPDATE 문장으로 반영할 row 수
+
+# Stage별 LLM worker pool 설정 (AIMD: 건강하면 +1, rate limit이면 절반)
+WORKER_POOL_CONFIG = {
+    'message_divider': {
+        'initial_concurrency': MAX_CONCURRENT_SESSIONS,
+        'min_concurrency': 1,
+        'max_concurrency': int(os.getenv('MESSAGE_DIVIDER_MAX_CONCURRENCY', '16')),
+        'target_latency_seconds': 15.0,
+        'max_retries': 3,
+        'retry_delay_seconds': 2.0,
+    },
+    'infer_account': {
+        'initial_concurrency': 5,
+        'min_concurrency': 1,
+        'max_concurrency': int(os.getenv('INFER_ACCOUNT_MAX_CONCURRENCY', '16')),
+        'target_latency_seconds': 20.0,
+        'max_retries': 3,
+        'retry_delay_seconds': 2.0,
+    },
+}
+
+# LLM response cache configuration
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', './llm_cache.sqlite3')  # 컨테이너에서는 볼륨 경로로 (docker-compose.yml)
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))  # 기본 30일
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '50000'))
+
+# Similarity search configuration
+SIMILARITY_WORKERS = int(os.getenv('SIMILARITY_WORKERS', '-1'))  # rapidfuzz cdist 스레드 수 (-1은 전체 코어)
+SIMILARITY_QUERY_CHUNK = 256  # cdist 한번에 계산할 쿼리 수 (메모리 상한)
+SIMILAR_RECORD_TOP_K = 50  # infer_account 컨텍스트용으로 가져올 유사 거래상대 수
+SIMILARITY_BACKEND = os.getenv('SIMILARITY_BACKEND', 'ngram')  # 'ngram'(문자 n-gram TF-IDF 코사인) 또는 'rapidfuzz'(fuzz.ratio)
+SIMILARITY_INDEX_PATH = os.getenv('SIMILARITY_INDEX_PATH', './party_ngram_index.npz')  # n-gram 인덱스 저장 위치
+SIMILARITY_NGRAM_SCORE_CUTOFF = float(os.getenv('SIMILARITY_NGRAM_SCORE_CUTOFF', '50'))  # 코사인 유사도 x 100
+SIMILARITY_RAPIDFUZZ_SCORE_CUTOFF = 70  # fuzz.ratio 최소 점수
+HISTORY_STREAM_BATCH_SIZE = int(os.getenv('HISTORY_STREAM_BATCH_SIZE', '5000'))  # 이력/승인 조회 시 서버측 커서로 한번에 가져올 row 수
+
+# 가맹점(merchant) resolver 설정
+MERCHANT_RESOLVER_ENABLED = os.getenv('MERCHANT_RESOLVER_ENABLED', 'true').lower() == 'true'
+MERCHANT_FUZZY_MIN_SCORE = float(os.getenv('MERCHANT_FUZZY_MIN_SCORE', '0.8'))  # 기존 가맹점에 붙일 최소 n-gram 코사인 유사도
+MERCHANT_ASSIGN_BATCH_SIZE = int(os.getenv('MERCHANT_ASSIGN_BATCH_SIZE', '5000'))  # 한 번에 가맹점을 배정할 row 수 (기존 row backfill 포함)
+
+# 승인취소 매칭 설정
+CANCEL_MATCH_WINDOW_DAYS = int(os.getenv('CANCEL_MATCH_WINDOW_DAYS', '90'))  # 승인취소 이전 며칠까지의 승인을 후보로 볼지
+CANCEL_MATCH_MIN_SIMILARITY = 80  # 거래상대 유사도 최소값
+# 부분취소는 금액이 달라 오매칭 위험이 커서 같은 가맹점(merchant_id)끼리, 더 짧은 window 안에서만 자동 매칭 (나머지는 수동 확인)
+CANCEL_PARTIAL_WINDOW_DAYS = int(os.getenv('CANCEL_PARTIAL_WINDOW_DAYS', '14'))
+# 이보다 오래된 미매칭 승인취소는 주기 실행에서 보지 않음 (오래된 승인취소 하나가 매번 승인 조회 범위를 넓히지 않도록, backfill로 처리)
+CANCEL_REFUND_MAX_AGE_DAYS = int(os.getenv('CANCEL_REFUND_MAX_AGE_DAYS', '30'))
+
+# 영수증 연결 설정
+RECEIPT_MATCH_WINDOW_DAYS = 30  # 결제시간과 buying_date 허용 차이(일)
+
+# History fast-path configuration (LLM 없이 과거 확정 이력으로 분류)
+HISTORY_FASTPATH_ENABLED = os.getenv('HISTORY_FASTPATH_ENABLED', 'true').lower() == 'true'
+HISTORY_FASTPATH_MIN_CONFIDENCE = float(os.getenv('HISTORY_FASTPATH_MIN_CONFIDENCE', '0.95'))  # 근거로 쓸 이력의 최소 confidence
+HISTORY_FASTPATH_MIN_COUNT = int(os.getenv('HISTORY_FASTPATH_MIN_COUNT', '3'))  # 최소 이력 건수
+HISTORY_FASTPATH_MIN_SHARE = float(os.getenv('HISTORY_FASTPATH_MIN_SHARE', '0.9'))  # 최다 분류가 차지해야 하는 비율
+
+# 로컬 분류기 cascade 설정 (local_classifier.py, 이력 fast path 다음, LLM 앞)
+LOCAL_CLASSIFIER_ENABLED = os.getenv('LOCAL_CLASSIFIER_ENABLED', 'true').lower() == 'true'
+LOCAL_CLASSIFIER_PATH = os.getenv('LOCAL_CLASSIFIER_PATH', './account_local_classifier.npz')  # 학습된 모델 파일 (없으면 모두 LLM)
+LOCAL_CLASSIFIER_MIN_PROBABILITY = float(os.getenv('LOCAL_CLASSIFIER_MIN_PROBABILITY', '0.9'))  # 이 확률 미만은 LLM으로
+LOCAL_CLASSIFIER_MIN_LABEL_CONFIDENCE = float(os.getenv('LOCAL_CLASSIFIER_MIN_LABEL_CONFIDENCE', '0.9'))  # 학습에 쓸 분류의 최소 confidence
+
+# 파이프라인 실행 방식 ('interval': 주기 실행만, 'streaming': LISTEN/NOTIFY 이벤트 기반 + 저빈도 reconciliation)
+PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'interval')
+RECONCILIATION_INTERVAL_MINUTES = int(os.getenv(
+    'RECONCILIATION_INTERVAL_MINUTES', '60' if PIPELINE_MODE == 'streaming' else '15'
+))
+PIPELINE_NOTIFY_CHANNEL = 'ledger_message_inserted'
+PIPELINE_BATCH_LINGER_SECONDS = float(os.getenv('PIPELINE_BATCH_LINGER_SECONDS', '0.5'))  # 첫 id 이후 배치를 모으는 시간
+PIPELINE_MAX_BATCH_SIZE = 100
+PIPELINE_RECONNECT_DELAY_SECONDS = 5
+# 스트리밍 infer_account가 stage에 들고 있는 분류 이력을 DB에서 다시 읽는 주기 (그 사이에는 반영한 분류만 이어서 추가)
+PIPELINE_HISTORY_REFRESH_SECONDS = float(os.getenv('PIPELINE_HISTORY_REFRESH_SECONDS', '3600'))
+
+# stage별 checkpoint (watermark 이후 row만 처리, 늦게 업로드된 문자는 look-back으로 다시 봄)
+PIPELINE_CHECKPOINT_ENABLED = os.getenv('PIPELINE_CHECKPOINT_ENABLED', 'true').lower() == 'true'
+PIPELINE_CHECKPOINT_LOOKBACK_HOURS = float(os.getenv('PIPELINE_CHECKPOINT_LOOKBACK_HOURS', '72'))  # 업로드 지연 알림(48시간)보다 길게
+
+# 주기 실행 job guard (Postgres advisory lock으로 replica 간에도 job/stage가 한 곳에서만 실행)
+RUN_GUARD_ENABLED = os.getenv('RUN_GUARD_ENABLED', 'true').lower() == 'true'
+RUN_LOCK_POLL_SECONDS = 0.5  # stage lock을 기다릴 때 pg_try_advisory_lock 재시도 간격
+ROUTINE_TIME_BUDGET_SECONDS = int(os.getenv(
+    'ROUTINE_TIME_BUDGET_SECONDS', str(int(RECONCILIATION_INTERVAL_MINUTES * 60 * 0.8))
+))  # 이 시간이 지나면 새 작업을 시작하지 않고 나머지는 다음 실행으로 넘김
+ROUTINE_MIN_INTERVAL_SECONDS = int(os.getenv(
+    'ROUTINE_MIN_INTERVAL_SECONDS', str(RECONCILIATION_INTERVAL_MINUTES * 60 // 2)
+))  # 다른 replica가 이 시간 안에 실행했으면 이번 fire는 건너뜀
+DAILY_JOB_TIME_BUDGET_SECONDS = int(os.getenv('DAILY_JOB_TIME_BUDGET_SECONDS', '600'))
+DAILY_JOB_MIN_INTERVAL_SECONDS = 12 * 3600
+SCHEDULER_MISFIRE_GRACE_SECONDS = int(os.getenv('SCHEDULER_MISFIRE_GRACE_SECONDS', '300'))
+
+# backfill CLI 설정 (backfill.py, 결제시간 범위를 chunk 단위로 다시 처리)
+BACKFILL_CHUNK_SIZE = int(os.getenv('BACKFILL_CHUNK_SIZE', '1000'))  # stage 한 번 실행에 넘길 row 수 (chunk마다 진행 cursor 저장)
+BACKFILL_MAX_CONCURRENCY = int(os.getenv('BACKFILL_MAX_CONCURRENCY', '32'))  # backfill 중 LLM worker pool 동시성 상한
+
+# Slack outbox 설정 (채널별 token bucket: Slack chat.postMessage는 채널당 초당 1건 + 짧은 burst 허용)
+SLACK_CHANNEL_RATE_PER_SECOND = float(os.getenv('SLACK_CHANNEL_RATE_PER_SECOND', '1.0'))
+SLACK_CHANNEL_BURST = int(os.getenv('SLACK_CHANNEL_BURST', '5'))
+SLACK_OUTBOX_POLL_SECONDS = 5  # 새 메시지 알림이 없을 때 outbox를 확인하는 주기
+SLACK_OUTBOX_BATCH_SIZE = 500  # 한 번에 가져올 대기 메시지 수
+SLACK_OUTBOX_MAX_BACKOFF_SECONDS = 300  # 일시적 오류(네트워크, 5xx 등)의 재시도 간격 상한 (횟수 제한 없이 계속 재시도)
+SLACK_DIGEST_MAX_LINES = 40  # digest 메시지 하나에 담을 최대 row 수 (Block Kit 블록 50개 제한 이내)
+# 한 번에 SLACK_ACCOUNT_RESULT_DIGEST_MIN_ROWS건 이상 나온 분류 결과는 digest로 묶어 전송 (수백 건 backlog도 수 초 안에 전송)
+# 그보다 적으면 건별 전송. digest 스레드에서는 답글에 수정할 아이디를 적어 수정 요청한다 (handlers.py)
+SLACK_ACCOUNT_RESULT_DIGEST = os.getenv('SLACK_ACCOUNT_RESULT_DIGEST', 'true').lower() == 'true'
+SLACK_ACCOUNT_RESULT_DIGEST_MIN_ROWS = int(os.getenv('SLACK_ACCOUNT_RESULT_DIGEST_MIN_ROWS', '5'))
+
+# Slack 스레드 원본 메시지 캐시 (봇이 보낸 메시지를 전송 시점에 저장해 답글마다 조회하지 않도록)
+THREAD_CACHE_MAX_ENTRIES = int(os.getenv('THREAD_CACHE_MAX_ENTRIES', '5000'))
+THREAD_CACHE_TTL_SECONDS = int(os.getenv('THREAD_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))  # 기본 7일
+
+# Prometheus /metrics 엔드포인트 (OpenTelemetry span은 설정된 TracerProvider가 있을 때만 내보냄)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_HOST = os.getenv('METRICS_HOST', '0.0.0.0')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))
+
 # Sender lists
 CARD_SENDER_LIST = {
     '+8215888900': '삼성카드',
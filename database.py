@@ -1,26 +1,143 @@
 import ssl
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import asyncpg
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncEngine
 from sqlalchemy.orm import sessionmaker
-from config import POSTGRESQL_DATABASE_DSN, APP_ENV
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from config import POSTGRESQL_DATABASE_DSN, APP_ENV, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, \
+    DB_POOL_TIMEOUT
+from telemetry import instrument_engine
+
+CA_CERT_PATH = "./ap-northeast-2-bundle.pem"
+
+# 프로세스 전체에서 공유하는 엔진/세션팩토리 (최초 사용 시 생성)
+_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[sessionmaker] = None
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """커넥션 체크아웃 대기 시간을 기록하는 커넥션 풀"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_count = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def connect(self):
+        started = time.perf_counter()
+        connection = super().connect()
+        waited = time.perf_counter() - started
+        self.checkout_count += 1
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return connection
+
+
+def _ssl_context():
+    return ssl.create_default_context(cafile=CA_CERT_PATH)
+
+
+def get_engine() -> AsyncEngine:
+    """프로세스 전역 엔진을 반환 (없으면 생성)"""
+    global _engine, _session_factory
+    if _engine is not None:
+        return _engine
 
-async def get_database_session() -> AsyncSession:
-    """DSN을 사용하여 PostgreSQL 데이터베이스에 연결"""
     dsn = POSTGRESQL_DATABASE_DSN
     if not dsn:
         raise ValueError("POSTGRESQL_DATABASE_DSN 환경변수가 설정되지 않았습니다")
 
-    CA_CERT_PATH = "./ap-northeast-2-bundle.pem"
-    ssl_context = ssl.create_default_context(cafile=CA_CERT_PATH)
-
-
     if APP_ENV == "dev":
         connect_args = {}
     else:
-        connect_args = {"ssl": ssl_context}
+        connect_args = {"ssl": _ssl_context()}
+
+    _engine = create_async_engine(
+        dsn,
+        connect_args=connect_args,
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=True,
+    )
+    instrument_engine(_engine)
+    _session_factory = sessionmaker(
+        class_=AsyncSession, autocommit=False, autoflush=False, expire_on_commit=False, bind=_engine
+    )
+    return _engine
+
+
+async def get_database_session() -> AsyncSession:
+    """공유 커넥션 풀에서 세션을 생성 (호출자가 close 책임)"""
+    get_engine()
+    return _session_factory()
+
+
+@asynccontextmanager
+async def database_session() -> AsyncIterator[AsyncSession]:
+    """`async with database_session() as db_session:` 형태로 사용하는 세션 컨텍스트"""
+    db_session = await get_database_session()
+    try:
+        yield db_session
+    except Exception:
+        await db_session.rollback()
+        raise
+    finally:
+        await db_session.close()
+
+
+async def dispose_engine():
+    """종료 시 커넥션 풀을 정리"""
+    global _engine, _session_factory
+    if _engine is None:
+        return
+    await _engine.dispose()
+    _engine = None
+    _session_factory = None
+
+
+def get_pool_stats() -> dict:
+    """현재 커넥션 풀 상태 (체크아웃 수, overflow, 대기 시간)"""
+    if _engine is None:
+        return {"initialized": False}
+
+    pool = _engine.sync_engine.pool
+    stats = {
+        "initialized": True,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+    }
+    if isinstance(pool, TimedQueuePool):
+        stats["checkout_count"] = pool.checkout_count
+        stats["total_wait_seconds"] = round(pool.total_wait_seconds, 4)
+        stats["max_wait_seconds"] = round(pool.max_wait_seconds, 4)
+        stats["avg_wait_seconds"] = round(pool.total_wait_seconds / pool.checkout_count, 4) \
+            if pool.checkout_count else 0.0
+    return stats
+
+
+async def connect_listener() -> asyncpg.Connection:
+    """LISTEN/NOTIFY 전용 asyncpg 커넥션 (풀 밖에서 계속 열려 있어야 하므로 별도로 생성)"""
+    return await connect_raw()
+
+
+async def connect_raw() -> asyncpg.Connection:
+    """풀을 거치지 않는 asyncpg 커넥션 (LISTEN, COPY, 트랜잭션 밖에서 실행해야 하는 DDL 등)"""
+    dsn = POSTGRESQL_DATABASE_DSN
+    if not dsn:
+        raise ValueError("POSTGRESQL_DATABASE_DSN 환경변수가 설정되지 않았습니다")
 
-    engine = create_async_engine(dsn,     connect_args=connect_args,)
-    AsyncSessionLocal = sessionmaker(
-        class_=AsyncSession, autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+    url = make_url(dsn).set(drivername="postgresql")
+    return await asyncpg.connect(
+        url.render_as_string(hide_password=False),
+        ssl=None if APP_ENV == "dev" else _ssl_context()
     )
-    return AsyncSessionLocal()
\ No newline at end of file
@@ -0,0 +1,179 @@
+"""LLM worker 결과를 모아 장부_결제문자에 chunk 단위로 반영하는 writer
+
+worker는 DB 세션을 열지 않고 LedgerWrite(바꿀 값 + 조회 당시 값)만 돌려주고, stage의 writer 하나가 모아서
+chunk마다 UPDATE ... FROM (VALUES ...) RETURNING 한 문장, 한 트랜잭션으로 반영한다.
+조회한 뒤 그 컬럼이 바뀐 row(예: 그 사이 슬랙에서 사용자가 분류를 수정)는 덮어쓰지 않고 conflict로 남긴다.
+ledger_dry_run(run_id) 안에서는 같은 검사를 SELECT로 하고, 장부 대신 backfill_diff에 바뀔 컬럼만 기록한다.
+"""
+import asyncio
+import contextvars
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set
+
+from sqlalchemy import cast, column, insert, select, update, values
+
+from config import LEDGER_WRITE_CHUNK_SIZE
+from database import database_session
+from models import BackfillDiff, 장부_결제문자
+from telemetry import LEDGER_WRITES
+
+LEDGER = 장부_결제문자.__table__
+
+_dry_run_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("ledger_dry_run_id", default=None)
+
+
+@contextmanager
+def ledger_dry_run(run_id: str) -> Iterator[None]:
+    """이 안에서 만든 LedgerWriter는 장부_결제문자를 바꾸지 않고 run_id로 backfill_diff에 기록"""
+    token = _dry_run_id.set(run_id)
+    try:
+        yield
+    finally:
+        _dry_run_id.reset(token)
+
+
+def current_dry_run() -> Optional[str]:
+    """dry-run 중이면 run_id (stage가 writer 밖의 부수 효과를 건너뛸 때 확인)"""
+    return _dry_run_id.get()
+
+
+class LedgerWrite(NamedTuple):
+    """row 하나에 쓸 값과, 조회 당시의 같은 컬럼 값 (optimistic check용)"""
+    mac_message_id: str
+    values: Dict[str, Any]
+    expected: Dict[str, Any]
+
+
+def ledger_write(row, new_values: Dict[str, Any]) -> LedgerWrite:
+    """조회한 row에 new_values를 쓰는 LedgerWrite (row는 수정하지 않음)"""
+    return LedgerWrite(row.mac_message_id, new_values, {name: getattr(row, name) for name in new_values})
+
+
+def update_statement(columns: Sequence[str], writes: Sequence[LedgerWrite]):
+    """writes를 한 문장으로: 조회 당시 값과 지금 값이 같은 row만 갱신하고 갱신된 mac_message_id를 RETURNING"""
+    rows = values(
+        column("mac_message_id", LEDGER.c.mac_message_id.type),
+        *(column(f"new_{name}", LEDGER.c[name].type) for name in columns),
+        *(column(f"old_{name}", LEDGER.c[name].type) for name in columns),
+        name="ledger_write"
+    ).data([
+        (write.mac_message_id, *(write.values[name] for name in columns), *(write.expected[name] for name in columns))
+        for write in writes
+    ])
+    # None은 타입 없는 NULL로 들어가서, 한 컬럼이 모두 NULL이면 VALUES 열이 text가 되므로 원래 타입으로 cast
+    return update(LEDGER).where(
+        LEDGER.c.mac_message_id == rows.c.mac_message_id,
+        *(LEDGER.c[name].is_not_distinct_from(cast(rows.c[f"old_{name}"], LEDGER.c[name].type)) for name in columns)
+    ).values(
+        {name: cast(rows.c[f"new_{name}"], LEDGER.c[name].type) for name in columns}
+    ).returning(LEDGER.c.mac_message_id)
+
+
+class LedgerWriter:
+    """stage 하나의 LedgerWrite를 모아 chunk_size마다, 그리고 끝날 때 남은 것을 반영
+
+        async with LedgerWriter("infer_account") as writer:
+            await writer.add(writes)
+        writer.applied  # 실제로 반영된 mac_message_id
+    """
+
+    def __init__(self, stage: str, chunk_size: int = LEDGER_WRITE_CHUNK_SIZE):
+        self.stage = stage
+        self.chunk_size = max(1, chunk_size)
+        self.pending: List[LedgerWrite] = []
+        self.applied: Set[str] = set()
+        self.conflicts: List[str] = []
+        self.statements = 0
+        self.seconds = 0.0
+        self.dry_run_id = current_dry_run()
+        self._lock = asyncio.Lock()  # 동시에 한 chunk만 쓰도록
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        # stage가 중간에 실패해도 이미 받은 LLM 결과는 반영
+        await self.flush()
+        action = f"dry-run 기록({self.dry_run_id})" if self.dry_run_id is not None else "DB 반영"
+        print(f"[{self.stage}] {action}: {self.summary()}")
+
+    async def add(self, writes: Iterable[LedgerWrite]):
+        """결과 추가 (chunk_size 이상 모이면 반영). None은 무시"""
+        self.pending.extend(write for write in writes if write is not None)
+        if len(self.pending) >= self.chunk_size:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            while self.pending:
+                chunk, self.pending = self.pending[:self.chunk_size], self.pending[self.chunk_size:]
+                await self._write(chunk)
+
+    async def _write(self, chunk: List[LedgerWrite]):
+        started = time.perf_counter()
+        # 같은 row가 두 번 들어오면 나중 결과만 (UPDATE ... FROM에서 한 row가 여러 VALUES와 조인되지 않도록)
+        latest = {write.mac_message_id: write for write in chunk}
+        by_columns: Dict[tuple, List[LedgerWrite]] = defaultdict(list)
+        for write in latest.values():
+            by_columns[tuple(write.values)].append(write)
+
+        applied = set()
+        async with database_session() as db_session:
+            for columns, writes in by_columns.items():
+                if self.dry_run_id is not None:
+                    applied.update(await self._write_diff(db_session, columns, writes))
+                    continue
+                result = await db_session.execute(update_statement(columns, writes))
+                applied.update(result.scalars())
+                self.statements += 1
+            await db_session.commit()
+
+        conflicts = [mac_message_id for mac_message_id in latest if mac_message_id not in applied]
+        self.applied.update(applied)
+        self.conflicts.extend(conflicts)
+        self.seconds += time.perf_counter() - started
+        LEDGER_WRITES.inc(len(applied), stage=self.stage, outcome="applied")
+        LEDGER_WRITES.inc(len(conflicts), stage=self.stage, outcome="conflict")
+        if conflicts:
+            print(f"[{self.stage}] 조회 이후 변경된 row {len(conflicts)}건은 덮어쓰지 않음: {', '.join(conflicts[:20])}")
+
+    async def _write_diff(self, db_session, columns: Sequence[str], writes: Sequence[LedgerWrite]) -> Set[str]:
+        """dry-run: 지금 값이 조회 당시와 같은 row만 바뀔 컬럼을 backfill_diff에 기록하고 그 mac_message_id를 반환"""
+        result = await db_session.execute(
+            select(LEDGER.c.mac_message_id, *(LEDGER.c[name] for name in columns)).where(
+                LEDGER.c.mac_message_id.in_([write.mac_message_id for write in writes])
+            )
+        )
+        current = {row.mac_message_id: row._mapping for row in result}
+        applied = set()
+        diff_rows = []
+        for write in writes:
+            row = current.get(write.mac_message_id)
+            if row is None or any(row[name] != write.expected[name] for name in columns):
+                continue
+            applied.add(write.mac_message_id)
+            diff_rows.extend(
+                {
+                    "run_id": self.dry_run_id,
+                    "stage": self.stage,
+                    "mac_message_id": write.mac_message_id,
+                    "column_name": name,
+                    "old_value": None if write.expected[name] is None else str(write.expected[name]),
+                    "new_value": None if write.values[name] is None else str(write.values[name]),
+                }
+                for name in columns if write.values[name] != write.expected[name]
+            )
+        if diff_rows:
+            await db_session.execute(insert(BackfillDiff), diff_rows)
+        self.statements += 2
+        return applied
+
+    def summary(self) -> dict:
+        return {
+            "applied": len(self.applied),
+            "conflicts": len(self.conflicts),
+            "statements": self.statements,
+            "db_seconds": round(self.seconds, 3),
+        }
@@ -0,0 +1,228 @@
+"""에이전트 응답 캐시 (로컬 SQLite)
+
+키는 (에이전트 이름, instruction, 출력 스키마, 모델 id, 단건 프롬프트)다. 배치 호출도 항목마다 단건 에이전트 키로
+조회/저장하므로, 어떤 row끼리 묶였는지와 관계없이 reprocess/backfill에서 적중한다.
+컨테이너에서는 LLM_CACHE_PATH를 마운트한 볼륨 아래로 두어야 재배포 후에도 캐시가 남는다 (docker-compose.yml, README 참고).
+
+    uv run python -m llm_cache stats|warm|evict|clear
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from config import LLM_CACHE_ENABLED, LLM_CACHE_PATH, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_ENTRIES
+
+
+def agent_model_id(agent) -> str:
+    """LlmAgent.model이 문자열이든 LiteLlm 객체든 모델 id 문자열로 변환"""
+    model = agent.model
+    return model if isinstance(model, str) else getattr(model, "model", type(model).__name__)
+
+
+def cache_key(agent, prompt: str) -> str:
+    """(에이전트 이름, instruction, 출력 스키마, 모델 id, 프롬프트) 해시"""
+    output_schema = json.dumps(agent.output_schema.model_json_schema(), sort_keys=True, ensure_ascii=False) \
+        if agent.output_schema else ""
+    payload = json.dumps(
+        [agent.name, agent.instruction, output_schema, agent_model_id(agent), prompt],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LlmCache:
+    """에이전트 응답을 로컬 SQLite에 저장하는 content-addressed 캐시 (TTL + 최대 건수 기준 eviction)
+
+    sqlite3 호출은 blocking이라 이벤트 루프에서는 asyncio.to_thread로 부른다. 연결 하나를 lock으로 직렬화해서 여러 스레드가 쓴다.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, enabled: bool = LLM_CACHE_ENABLED):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        self._writes_since_evict = 0
+        self._lock = threading.RLock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    agent_name TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._connection.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_last_access ON llm_cache (last_access)")
+        return self._connection
+
+    def get(self, agent, prompt: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        key = cache_key(agent, prompt)
+        now = time.time()
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self.connection.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def get_many(self, requests: Iterable[Tuple[object, str]]) -> List[Optional[str]]:
+        """(agent, prompt) 목록의 캐시된 응답 (없거나 TTL이 지나면 None, 순서 유지)"""
+        keys = [cache_key(agent, prompt) for agent, prompt in requests]
+        if not self.enabled or not keys:
+            return [None] * len(keys)
+        now = time.time()
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                found.update(
+                    (key, response) for key, response, created_at in self.connection.execute(
+                        f"SELECT key, response, created_at FROM llm_cache WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk
+                    ) if now - created_at <= self.ttl_seconds
+                )
+            if found:
+                self.connection.executemany("UPDATE llm_cache SET last_access = ? WHERE key = ?",
+                                            [(now, key) for key in found])
+                self.connection.commit()
+            self.hits += sum(key in found for key in keys)
+            self.misses += sum(key not in found for key in keys)
+        return [found.get(key) for key in keys]
+
+    def set(self, agent, prompt: str, response: str):
+        self.set_many([(agent, prompt, response)])
+
+    def set_many(self, entries):
+        """(agent, prompt, response) 목록을 한 트랜잭션으로 저장"""
+        if not self.enabled:
+            return
+        now = time.time()
+        rows = [(cache_key(agent, prompt), agent.name, response, now, now) for agent, prompt, response in entries]
+        with self._lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO llm_cache (key, agent_name, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self.connection.commit()
+            self._writes_since_evict += len(rows)
+            if self._writes_since_evict >= 100:
+                self.evict()
+
+    def evict(self) -> int:
+        """TTL이 지난 항목과, 최대 건수를 넘는 오래 안 쓴 항목을 삭제"""
+        with self._lock:
+            self._writes_since_evict = 0
+            deleted = self.connection.execute(
+                "DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+            deleted += self.connection.execute("""
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,)).rowcount
+            self.connection.commit()
+            return deleted
+
+    def clear(self):
+        with self._lock:
+            self.connection.execute("DELETE FROM llm_cache")
+            self.connection.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = dict(self.connection.execute(
+                "SELECT agent_name, COUNT(*) FROM llm_cache GROUP BY agent_name"
+            ).fetchall()) if self.enabled else {}
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "entries": entries,
+        }
+
+
+llm_cache = LlmCache()
+
+
+async def warm_from_ledger() -> int:
+    """이미 분해된 장부_결제문자 row로 문자 분해 에이전트의 단건 캐시를 채움
+
+    배치 분해도 항목마다 단건 에이전트 키로 캐시를 조회하므로(agent_runner.run_batch_agent) 배치 모드에서도 적중한다.
+    분류 에이전트 프롬프트는 당시의 유사 거래 이력을 포함하므로 재구성할 수 없어 대상에서 제외한다.
+    """
+    from sqlalchemy import select
+
+    from agents.message_divider_agent import card_message_divider_agent, bank_message_divider_agent, \
+        DividedMessageOutput
+    from config import CARD_SENDER_LIST, BANK_SENDER_LIST
+    from database import database_session
+    from models import 장부_결제문자
+    from services import preprocess_message
+
+    entries = []
+    async with database_session() as db_session:
+        stmt = select(
+            장부_결제문자.message, 장부_결제문자.발신번호, 장부_결제문자.transaction_type,
+            장부_결제문자.amount, 장부_결제문자.currency, 장부_결제문자.거래상대
+        ).filter(
+            장부_결제문자.transaction_type.is_not(None),
+            장부_결제문자.transaction_type != 'N',
+            장부_결제문자.amount.is_not(None),
+            장부_결제문자.거래상대.is_not(None)
+        )
+        for row in (await db_session.execute(stmt)).all():
+            if row.발신번호 in CARD_SENDER_LIST:
+                agent = card_message_divider_agent
+            elif row.발신번호 in BANK_SENDER_LIST:
+                agent = bank_message_divider_agent
+            else:
+                continue
+            response = DividedMessageOutput(
+                transaction_type=row.transaction_type,
+                amount=row.amount,
+                currency=row.currency or "",
+                transaction_party=row.거래상대
+            ).model_dump_json()
+            entries.append((agent, await preprocess_message(row.message), response))
+
+    await asyncio.to_thread(llm_cache.set_many, entries)
+    return len(entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM 응답 캐시 관리")
+    parser.add_argument("command", choices=["stats", "warm", "evict", "clear"])
+    args = parser.parse_args()
+
+    if args.command == "warm":
+        print(f"캐시 warm-up: {asyncio.run(warm_from_ledger())}건")
+    elif args.command == "evict":
+        print(f"캐시 정리: {llm_cache.evict()}건 삭제")
+    elif args.command == "clear":
+        llm_cache.clear()
+        print("캐시를 비웠습니다.")
+    print(llm_cache.stats())
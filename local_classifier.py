@@ -0,0 +1,497 @@
+"""거래상대/금액으로 (거래목적, 계정과목_대, 계정과목_소)를 바로 예측하는 로컬 분류기 (account_classifier 앞단 cascade)
+
+슬랙에서 확정된(1.0) 분류와 모델이 확신한(0.9 이상) 분류가 쌓여 있으므로, 그걸로 학습한 선형 모델이
+보정된 확률 LOCAL_CLASSIFIER_MIN_PROBABILITY 이상으로 맞힐 수 있는 row는 LLM 없이 분류하고 나머지만 LLM으로 보낸다.
+
+- 특징: merchant_key(지점명 제거 + normalize_party)의 문자 2~3-gram과 키 자체, 통화, 통화별 금액 구간(로그 스케일),
+  발신자명. 모두 crc32로 2^HASH_BITS 차원에 해싱해서 vocabulary 없이 저장/예측한다.
+- 모델: 세 값을 합친 조합 하나를 class로 보는 softmax 회귀 (numpy mini-batch Adagrad, scikit-learn 없이).
+- 보정: 시간순으로 마지막 holdout 구간에서 temperature 하나를 NLL 최소로 맞춘다. 저장하는 모델은 기본으로
+  holdout을 빼고 학습한 그 모델이라 temperature와 holdout 지표가 저장된 모델을 그대로 설명한다. --refit이면 전체로
+  다시 학습해서 저장하지만, temperature와 지표는 refit 전 모델 기준이다 (지표의 refit=1로 표시).
+- 학습 때 보지 못한 가맹점은 금액/발신자만으로 확률이 높게 나올 수 있어서 확률과 관계없이 LLM으로 보낸다.
+  본 가맹점은 가중치(해시 공간을 다른 특징과 공유)가 아니라 학습 row의 가맹점 키 32비트 해시 목록으로 따로 저장한다.
+- 학습 데이터에서 이력 기반/로컬 모델이 자동으로 채운 분류는 빼서 자기 예측을 다시 배우지 않게 한다.
+
+모델 파일은 프로세스에서 한 번만 읽고(get_local_classifier), 학습/평가는 CLI로 따로 돌린다.
+
+    uv run python -m local_classifier train [--holdout 0.2] [--epochs 8] [--refit] [--output ./account_local_classifier.npz]
+    uv run python -m local_classifier evaluate [--since 2025-10-01T00:00:00]  # 기본은 모델 학습 이후 확정된 row
+"""
+import argparse
+import asyncio
+import datetime
+import math
+import os
+import tempfile
+import time
+import zlib
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from pydantic import ValidationError
+from sqlalchemy import select, or_, not_
+
+from account_history import HISTORY_REASON_PREFIX, LOCAL_REASON_PREFIX
+from agents.account_classifier import AccountClassificationOutput
+from config import LOCAL_CLASSIFIER_PATH, LOCAL_CLASSIFIER_MIN_PROBABILITY, LOCAL_CLASSIFIER_MIN_LABEL_CONFIDENCE
+from merchant_resolver import merchant_key
+from models import 장부_결제문자
+from ngram_index import char_ngrams
+from telemetry import LOCAL_CLASSIFICATIONS
+
+# 특징 해시가 merchant_key에 의존하므로 merchant_key 규칙이 바뀌면 올려서 이전 모델을 거부 (3: 업태 단어는 지점명으로 떼지 않음)
+MODEL_FORMAT_VERSION = 3
+HASH_BITS = 16
+FEATURE_DIMENSIONS = 1 << HASH_BITS
+TEMPERATURE_GRID = np.exp(np.linspace(np.log(0.25), np.log(4.0), 49))
+REPORT_THRESHOLDS = (0.5, 0.7, 0.8, 0.9, 0.95, 0.99)
+
+
+class LabelledTransaction(NamedTuple):
+    """학습/평가용 확정 분류 (장부_결제문자에서 필요한 컬럼만)"""
+    결제시간: Optional[datetime.datetime]
+    거래상대: Optional[str]
+    amount: Optional[int]
+    currency: Optional[str]
+    발신자명: Optional[str]
+    거래목적: Optional[str]
+    계정과목_대: Optional[str]
+    계정과목_소: Optional[str]
+
+
+def training_data_query(since: Optional[datetime.datetime] = None):
+    """확정된 승인 분류를 시간순으로 (자동 분류/취소건 제외, ix_ledger_confident_history)"""
+    stmt = select(*(getattr(장부_결제문자, name) for name in LabelledTransaction._fields)).filter(
+        장부_결제문자.transaction_type == '승인',
+        장부_결제문자.confidence >= LOCAL_CLASSIFIER_MIN_LABEL_CONFIDENCE,
+        장부_결제문자.거래상대.is_not(None),
+        장부_결제문자.거래목적.is_not(None),
+        장부_결제문자.거래목적 != '취소건',
+        장부_결제문자.계정과목_대.is_not(None),
+        or_(
+            장부_결제문자.account_reason.is_(None),
+            not_(or_(장부_결제문자.account_reason.startswith(HISTORY_REASON_PREFIX, autoescape=True),
+                     장부_결제문자.account_reason.startswith(LOCAL_REASON_PREFIX, autoescape=True)))
+        )
+    )
+    if since is not None:
+        stmt = stmt.filter(장부_결제문자.결제시간 > since)
+    return stmt.order_by(장부_결제문자.결제시간.asc())
+
+
+def _hash(token: str) -> int:
+    return zlib.crc32(token.encode()) & (FEATURE_DIMENSIONS - 1)
+
+
+def amount_bucket(amount: Optional[int]) -> str:
+    """금액의 반 자릿수(10^0.5) 단위 구간 (통화마다 크기가 달라서 통화와 묶어서 씀)"""
+    if not amount or amount <= 0:
+        return "none"
+    return str(min(24, int(math.log10(amount) * 2)))
+
+
+def merchant_feature(key: str) -> int:
+    """가맹점 키(merchant_key) 자체의 해시 차원"""
+    return _hash(f"k:{key}")
+
+
+def merchant_hash(key: str) -> int:
+    """학습 때 본 가맹점인지 판단할 가맹점 키의 32비트 해시 (특징 해시 공간과 별개라 다른 특징과 충돌하지 않음)"""
+    return zlib.crc32(f"k:{key}".encode())
+
+
+def encode(key: str, amount: Optional[int], currency: Optional[str],
+           sender: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """row 하나(key는 거래상대의 merchant_key)의 (해시 차원, 가중치) sparse 벡터.
+    L2 정규화, 빈 row가 없도록 통화/발신자는 항상 포함"""
+    weights: Dict[int, float] = {}
+    grams = char_ngrams(key)
+    for gram in grams:
+        dimension = _hash(f"g:{gram}")
+        weights[dimension] = weights.get(dimension, 0.0) + 1.0 / math.sqrt(len(grams))
+    for dimension in (merchant_feature(key),
+                      _hash(f"c:{currency or ''}"),
+                      _hash(f"a:{currency or ''}:{amount_bucket(amount)}"),
+                      _hash(f"s:{sender or ''}")):
+        weights[dimension] = weights.get(dimension, 0.0) + 1.0
+    indices = np.fromiter(weights.keys(), dtype=np.int64, count=len(weights))
+    values = np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+    return indices, values / np.linalg.norm(values)
+
+
+class EncodedRows(NamedTuple):
+    """여러 row의 sparse 특징 (CSR 형태)"""
+    indptr: np.ndarray
+    indices: np.ndarray
+    values: np.ndarray
+    merchants: np.ndarray  # row별 merchant_hash
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def take(self, rows: np.ndarray) -> "EncodedRows":
+        starts, ends = self.indptr[rows], self.indptr[rows + 1]
+        lengths = ends - starts
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        positions = np.repeat(starts - indptr[:-1], lengths) + np.arange(indptr[-1])
+        return EncodedRows(indptr, self.indices[positions], self.values[positions], self.merchants[rows])
+
+
+def encode_records(records: Sequence) -> EncodedRows:
+    keys = [merchant_key(record.거래상대 or "") for record in records]
+    vectors = [encode(key, record.amount, record.currency, record.발신자명) for key, record in zip(keys, records)]
+    indptr = np.zeros(len(vectors) + 1, dtype=np.int64)
+    np.cumsum([len(indices) for indices, _ in vectors], out=indptr[1:])
+    return EncodedRows(
+        indptr,
+        np.concatenate([indices for indices, _ in vectors]) if vectors else np.zeros(0, dtype=np.int64),
+        np.concatenate([values for _, values in vectors]) if vectors else np.zeros(0, dtype=np.float32),
+        np.array([merchant_hash(key) for key in keys], dtype=np.int64),
+    )
+
+
+def record_label(record) -> Tuple[str, str, str]:
+    return record.거래목적, record.계정과목_대, record.계정과목_소 or ""
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    np.exp(logits, out=logits)
+    return logits / logits.sum(axis=-1, keepdims=True)
+
+
+class LocalClassifier:
+    """해시 특징 softmax 회귀 + temperature scaling"""
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, labels: List[Tuple[str, str, str]],
+                 merchant_hashes: np.ndarray, temperature: float = 1.0, trained_until: str = "",
+                 metrics: Optional[dict] = None, min_probability: float = LOCAL_CLASSIFIER_MIN_PROBABILITY):
+        self.weights = weights
+        self.bias = bias
+        self.labels = labels
+        self.temperature = temperature
+        self.trained_until = trained_until
+        self.metrics = metrics or {}
+        self.min_probability = min_probability
+        self.merchant_hashes = np.unique(np.asarray(merchant_hashes, dtype=np.int64))  # 학습 row의 merchant_hash
+        self._known_merchants = frozenset(self.merchant_hashes.tolist())
+        self.resolved = 0
+        self.escalated = 0
+
+    def logits(self, rows: EncodedRows) -> np.ndarray:
+        contributions = self.weights[rows.indices] * rows.values[:, None]
+        return np.add.reduceat(contributions, rows.indptr[:-1], axis=0) + self.bias
+
+    def predict_proba(self, rows: EncodedRows) -> np.ndarray:
+        return _softmax(self.logits(rows) / self.temperature)
+
+    def known_merchants(self, rows: EncodedRows) -> np.ndarray:
+        """row별로 학습 때 본 가맹점인지"""
+        return np.isin(rows.merchants, self.merchant_hashes)
+
+    def predict(self, party, amount, currency, sender) -> Tuple[Optional[Tuple[str, str, str]], float]:
+        """row 하나의 (조합, 보정된 확률). 학습 때 보지 못한 가맹점이면 (None, 0.0)"""
+        key = merchant_key(party or "")
+        if merchant_hash(key) not in self._known_merchants:
+            return None, 0.0
+        indices, values = encode(key, amount, currency, sender)
+        probabilities = _softmax((values @ self.weights[indices] + self.bias) / self.temperature)
+        best = int(probabilities.argmax())
+        return self.labels[best], float(probabilities[best])
+
+    def classify(self, row) -> Optional[AccountClassificationOutput]:
+        """확률이 min_probability 이상이면 분류 결과를, 아니면 None(LLM으로)을 반환"""
+        label, probability = self.predict(row.거래상대, row.amount, row.currency, row.발신자명)
+        output = None
+        if label is not None and probability >= self.min_probability:
+            business_purpose, main_category, sub_category = label
+            try:
+                # 사용자 확정(1.0)과 구분되도록 0.99 상한
+                output = AccountClassificationOutput(
+                    business_purpose=business_purpose,
+                    main_category=main_category,
+                    sub_category=sub_category,
+                    confidence=round(min(0.99, probability), 3),
+                    reason=f"{LOCAL_REASON_PREFIX} 로컬 분류기 확률 {probability:.3f}"
+                )
+            except ValidationError:
+                output = None
+        if output is None:
+            self.escalated += 1
+            LOCAL_CLASSIFICATIONS.inc(outcome="escalated")
+        else:
+            self.resolved += 1
+            LOCAL_CLASSIFICATIONS.inc(outcome="resolved")
+        return output
+
+    @property
+    def local_fraction(self) -> float:
+        total = self.resolved + self.escalated
+        return self.resolved / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "classes": len(self.labels),
+            "trained_until": self.trained_until,
+            "min_probability": self.min_probability,
+            "resolved": self.resolved,
+            "escalated": self.escalated,
+            "local_fraction": round(self.local_fraction, 3),
+        }
+
+    def save(self, path: str):
+        """npz로 저장 (0이 아닌 가중치 행만, 임시 파일에 쓴 뒤 교체)"""
+        rows = np.flatnonzero(np.any(self.weights != 0, axis=1))
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, suffix=".npz", delete=False) as temporary:
+            np.savez_compressed(
+                temporary,
+                version=np.array(MODEL_FORMAT_VERSION),
+                hash_bits=np.array(HASH_BITS),
+                rows=rows,
+                weights=self.weights[rows],
+                bias=self.bias,
+                labels=np.array(self.labels, dtype=str).reshape(-1, 3),
+                merchant_hashes=self.merchant_hashes,
+                temperature=np.array(self.temperature),
+                trained_until=np.array(self.trained_until),
+                metric_names=np.array(list(self.metrics), dtype=str),
+                metric_values=np.array(list(self.metrics.values()), dtype=np.float64),
+            )
+        os.replace(temporary.name, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["LocalClassifier"]:
+        """저장된 모델을 읽음. 파일이 없거나 형식이 다르면 None (모든 row를 LLM으로)"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if int(data["version"]) != MODEL_FORMAT_VERSION or int(data["hash_bits"]) != HASH_BITS:
+                    print(f"로컬 분류기 형식이 달라 사용하지 않습니다. 다시 학습하세요: {path}")
+                    return None
+                labels = [tuple(label) for label in data["labels"].tolist()]
+                weights = np.zeros((FEATURE_DIMENSIONS, len(labels)), dtype=np.float32)
+                weights[data["rows"]] = data["weights"]
+                return cls(weights, data["bias"], labels, data["merchant_hashes"],
+                           temperature=float(data["temperature"]),
+                           trained_until=str(data["trained_until"]),
+                           metrics=dict(zip(data["metric_names"].tolist(), data["metric_values"].tolist())))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"로컬 분류기를 읽지 못해 사용하지 않습니다 ({path}): {e}")
+            return None
+
+
+def fit(rows: EncodedRows, targets: np.ndarray, class_count: int, epochs: int = 8, batch_size: int = 256,
+        learning_rate: float = 0.5, l2: float = 1e-6, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """softmax 회귀를 mini-batch Adagrad로 학습 (배치에 나온 특징 행만 갱신)"""
+    rng = np.random.default_rng(seed)
+    weights = np.zeros((FEATURE_DIMENSIONS, class_count), dtype=np.float32)
+    weight_squares = np.zeros_like(weights)
+    bias = np.zeros(class_count, dtype=np.float32)
+    bias_squares = np.zeros_like(bias)
+    for _ in range(epochs):
+        order = rng.permutation(len(rows))
+        for start in range(0, len(order), batch_size):
+            batch_rows = order[start:start + batch_size]
+            batch = rows.take(batch_rows)
+            contributions = weights[batch.indices] * batch.values[:, None]
+            logits = np.add.reduceat(contributions, batch.indptr[:-1], axis=0) + bias
+            errors = _softmax(logits)
+            errors[np.arange(len(batch_rows)), targets[batch_rows]] -= 1.0
+            errors /= len(batch_rows)
+
+            row_of_value = np.repeat(np.arange(len(batch_rows)), np.diff(batch.indptr))
+            dimensions, positions = np.unique(batch.indices, return_inverse=True)
+            gradient = np.zeros((len(dimensions), class_count), dtype=np.float32)
+            np.add.at(gradient, positions, errors[row_of_value] * batch.values[:, None])
+            gradient += l2 * weights[dimensions]
+            weight_squares[dimensions] += gradient ** 2
+            weights[dimensions] -= learning_rate * gradient / (np.sqrt(weight_squares[dimensions]) + 1e-8)
+
+            bias_gradient = errors.sum(axis=0)
+            bias_squares += bias_gradient ** 2
+            bias -= learning_rate * bias_gradient / (np.sqrt(bias_squares) + 1e-8)
+    return weights, bias
+
+
+def fit_temperature(logits: np.ndarray, targets: np.ndarray) -> float:
+    """holdout NLL이 가장 작은 temperature (정답 class가 모델에 없는 row는 제외)"""
+    known = targets >= 0
+    if not known.any():
+        return 1.0
+    logits, targets = logits[known], targets[known]
+    losses = []
+    for temperature in TEMPERATURE_GRID:
+        probabilities = _softmax(logits / temperature)
+        losses.append(-np.mean(np.log(probabilities[np.arange(len(targets)), targets] + 1e-12)))
+    return float(TEMPERATURE_GRID[int(np.argmin(losses))])
+
+
+def evaluate(model: LocalClassifier, records: Sequence, rows: Optional[EncodedRows] = None) -> dict:
+    """정확도, ECE, 임계값별 로컬 처리율/정확도, 설정 임계값의 로컬 처리율, row당 예측 시간"""
+    rows = rows if rows is not None else encode_records(records)
+    label_ids = {label: position for position, label in enumerate(model.labels)}
+    targets = np.array([label_ids.get(record_label(record), -1) for record in records], dtype=np.int64)
+    probabilities = model.predict_proba(rows)
+    predicted = probabilities.argmax(axis=1)
+    probability = probabilities[np.arange(len(records)), predicted]
+    correct = predicted == targets
+
+    bins = np.minimum((probability * 10).astype(np.int64), 9)
+    ece = sum(abs(correct[bins == b].mean() - probability[bins == b].mean()) * (bins == b).mean()
+              for b in range(10) if (bins == b).any())
+    # 처음 보는 가맹점은 확률과 관계없이 LLM으로
+    confidence = np.where(model.known_merchants(rows), probability, 0.0)
+
+    sample = records[:2000]
+    started = time.perf_counter()
+    for record in sample:
+        model.predict(record.거래상대, record.amount, record.currency, record.발신자명)
+    micros = (time.perf_counter() - started) / max(1, len(sample)) * 1e6
+
+    metrics = {
+        "rows": float(len(records)),
+        "accuracy": float(correct.mean()),
+        "unseen_label": float((targets < 0).mean()),
+        "ece": float(ece),
+        "predict_us": micros,
+    }
+    for threshold in sorted(set(REPORT_THRESHOLDS) | {model.min_probability}):
+        accepted = confidence >= threshold
+        metrics[f"coverage@{threshold:g}"] = float(accepted.mean())
+        metrics[f"accuracy@{threshold:g}"] = float(correct[accepted].mean()) if accepted.any() else 0.0
+    metrics["local_fraction"] = metrics[f"coverage@{model.min_probability:g}"]
+    return metrics
+
+
+def train(records: Sequence, holdout: float = 0.2, epochs: int = 8, min_class_count: int = 3,
+          refit: bool = False) -> LocalClassifier:
+    """시간순 마지막 holdout 구간으로 temperature를 맞추고 평가한 모델을 반환
+
+    refit이면 전체로 다시 학습한 모델을 반환하되, temperature와 metrics는 refit 전 모델 것이다 (metrics["refit"]=1).
+    """
+    labels_count = Counter(record_label(record) for record in records)
+    labels = []
+    for label, count in labels_count.most_common():
+        if count < min_class_count:
+            continue
+        try:
+            # 현재 분류 체계에 없는 옛날 조합은 class로 쓰지 않음
+            AccountClassificationOutput(business_purpose=label[0], main_category=label[1], sub_category=label[2],
+                                        confidence=1.0, reason="")
+        except ValidationError:
+            continue
+        labels.append(label)
+    if not labels:
+        raise ValueError("학습할 분류 조합이 없습니다")
+    label_ids = {label: position for position, label in enumerate(labels)}
+
+    rows = encode_records(records)
+    targets = np.array([label_ids.get(record_label(record), -1) for record in records], dtype=np.int64)
+    split = int(len(records) * (1 - holdout))
+    train_rows = np.flatnonzero(targets[:split] >= 0)
+    holdout_rows = np.arange(split, len(records))
+
+    started = time.perf_counter()
+    weights, bias = fit(rows.take(train_rows), targets[train_rows], len(labels), epochs=epochs)
+    model = LocalClassifier(weights, bias, labels, rows.merchants[train_rows])
+    metrics = {}
+    if len(holdout_rows):
+        holdout_encoded = rows.take(holdout_rows)
+        model.temperature = fit_temperature(model.logits(holdout_encoded), targets[holdout_rows])
+        metrics = evaluate(model, records[split:], holdout_encoded)
+    print(f"학습 {len(train_rows)}건 / holdout {len(holdout_rows)}건, class {len(labels)}개, "
+          f"{time.perf_counter() - started:.1f}s, temperature {model.temperature:.2f}")
+
+    if refit and len(holdout_rows):
+        # 보정한 temperature는 그대로 두고 최근 구간까지 포함해서 다시 학습 (새 모델은 보정/평가되지 않음)
+        all_rows = np.flatnonzero(targets >= 0)
+        weights, bias = fit(rows.take(all_rows), targets[all_rows], len(labels), epochs=epochs)
+        model = LocalClassifier(weights, bias, labels, rows.merchants[all_rows], temperature=model.temperature)
+    if metrics:
+        metrics["refit"] = float(refit)
+    model.metrics = metrics
+    model.trained_until = max((record.결제시간 for record in records if record.결제시간),
+                              default=datetime.datetime.min).isoformat()
+    return model
+
+
+def print_metrics(metrics: dict):
+    print(f"  rows {int(metrics['rows'])} | accuracy {metrics['accuracy']:.3f} | "
+          f"모델에 없는 조합 {metrics['unseen_label']:.1%} | ECE {metrics['ece']:.3f} | "
+          f"예측 {metrics['predict_us']:.1f}µs/row")
+    for name in sorted(name for name in metrics if name.startswith("coverage@")):
+        threshold = name.split("@", 1)[1]
+        print(f"  임계값 {threshold:>5}: 로컬 처리 {metrics[name]:6.1%} | 정확도 {metrics[f'accuracy@{threshold}']:.3f}")
+    print(f"  로컬 처리율(설정 임계값): {metrics['local_fraction']:.1%}")
+
+
+_local_classifier: Optional[LocalClassifier] = None
+_loaded = False
+
+
+def get_local_classifier(path: str = LOCAL_CLASSIFIER_PATH) -> Optional[LocalClassifier]:
+    """디스크에 저장된 로컬 분류기 (프로세스에서 한 번만 읽음). 없으면 None"""
+    global _local_classifier, _loaded
+    if not _loaded:
+        _loaded = True
+        _local_classifier = LocalClassifier.load(path)
+        if _local_classifier is None:
+            print(f"로컬 분류기 없음, 모든 분류를 LLM으로 처리합니다 ({path})")
+        else:
+            print(f"로컬 분류기 로드: class {len(_local_classifier.labels)}개, "
+                  f"{_local_classifier.trained_until}까지 학습 ({path})")
+    return _local_classifier
+
+
+async def load_training_data(since: Optional[datetime.datetime] = None) -> List[LabelledTransaction]:
+    from database import database_session
+    from services import stream_records
+    async with database_session() as db_session:
+        return await stream_records(db_session, training_data_query(since), LabelledTransaction)
+
+
+async def _main(args):
+    if args.command == "train":
+        records = await load_training_data()
+        print(f"확정 분류 {len(records)}건 로드")
+        model = train(records, holdout=args.holdout, epochs=args.epochs, min_class_count=args.min_class_count,
+                      refit=args.refit)
+        if model.metrics:
+            evaluated = "refit 전 모델 기준, 저장한 모델은 holdout까지 다시 학습" if args.refit else "저장한 모델 기준"
+            print(f"holdout 평가 (마지막 {args.holdout:.0%}, {evaluated}):")
+            print_metrics(model.metrics)
+        model.save(args.output)
+        print(f"저장: {args.output} ({os.path.getsize(args.output) / 1024:.0f}KB)")
+    elif args.command == "evaluate":
+        model = LocalClassifier.load(args.model)
+        if model is None:
+            print(f"모델이 없습니다: {args.model}")
+            return
+        since = datetime.datetime.fromisoformat(args.since or model.trained_until)
+        records = await load_training_data(since)
+        if not records:
+            print(f"{since.isoformat()} 이후 확정된 분류가 없습니다 (--since로 기간을 지정하세요)")
+            return
+        print(f"{since.isoformat()} 이후 확정 분류 {len(records)}건 평가 (학습 {model.trained_until}까지):")
+        print_metrics(evaluate(model, records))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="계정 분류 로컬 모델 학습/평가")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser("train", help="장부에서 확정 분류를 읽어 학습하고 저장")
+    train_parser.add_argument("--output", default=LOCAL_CLASSIFIER_PATH)
+    train_parser.add_argument("--holdout", type=float, default=0.2, help="temperature 보정/평가에 쓸 최근 구간 비율")
+    train_parser.add_argument("--epochs", type=int, default=8)
+    train_parser.add_argument("--min-class-count", type=int, default=3)
+    train_parser.add_argument("--refit", action="store_true",
+                              help="holdout 구간까지 다시 학습해서 저장 (temperature/지표는 refit 전 모델 기준)")
+    evaluate_parser = subparsers.add_parser("evaluate", help="저장된 모델을 학습 이후 확정된 분류로 평가")
+    evaluate_parser.add_argument("--model", default=LOCAL_CLASSIFIER_PATH)
+    evaluate_parser.add_argument("--since", help="이 시각 이후 결제만 평가 (기본: 모델 학습 데이터의 마지막 결제시간)")
+    asyncio.run(_main(parser.parse_args()))
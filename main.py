@@ -16,6 +16,16 @@ from services import (
     check_last_message_upload, update_cancel_transactions, link_receipt_to_payments, send_unlinked_receipts_to_slack
 )
 from handlers import handle_message
+from database import dispose_engine, get_pool_stats
+from llm_cache import llm_cache
+from pipeline import StreamingPipeline
+from slack_outbox import SlackOutboxSender
+from migrations import check_schema
+from run_guard import guarded_job, stage_lock, current_budget, advisory_locks
+from thread_cache import bot_identity, thread_root_cache
+from merchant_resolver import merchant_resolver
+from local_classifier import get_local_classifier
+from telemetry import start_metrics_server
 
 configure()
 
@@ -28,15 +38,44 @@ configure()
 app = AsyncApp(token=SLACK_BOT_TOKEN)
 
 
-# 5분마다 실행할 함수
-async def run_agent_routine():
-    await update_all_records()
-    await remove_duplicate_message()
-    await message_divider_run()
-    await update_cancel_transactions()
-    await infer_account(app)
-    await link_receipt_to_payments()
+slack_outbox = SlackOutboxSender(app)
+pipeline = StreamingPipeline(app) if config.PIPELINE_MODE == 'streaming' else None
+
+
+ROUTINE_STAGES = [
+    ("update_all_records", update_all_records),
+    ("remove_duplicate_message", remove_duplicate_message),
+    ("message_divider", message_divider_run),
+    ("update_cancel_transactions", update_cancel_transactions),
+    ("infer_account", lambda: infer_account(app)),
+    ("link_receipt_to_payments", link_receipt_to_payments),
+]
 
+
+# 주기적으로 실행할 함수 (streaming 모드에서는 놓친 row를 처리하는 reconciliation sweep)
+# replica 중 한 곳에서만, 시간 예산 안에서 실행하고 남은 row는 다음 실행으로 넘김
+@guarded_job("run_agent_routine", config.ROUTINE_TIME_BUDGET_SECONDS, config.ROUTINE_MIN_INTERVAL_SECONDS)
+async def run_agent_routine():
+    budget = current_budget()
+    for stage_name, stage in ROUTINE_STAGES:
+        if budget is not None and budget.exceeded():
+            budget.truncate(stage_name)
+            continue
+        # 파이프라인/다른 replica와 같은 stage를 동시에 처리하지 않도록 stage별 lock 안에서 실행
+        async with stage_lock(stage_name) as acquired:
+            if acquired:
+                await stage()
+    print(f"DB 커넥션 풀 상태: {get_pool_stats()}")
+    print(f"LLM 캐시 상태: {await asyncio.to_thread(llm_cache.stats)}")
+    print(f"Slack outbox 상태: {slack_outbox.stats()}")
+    print(f"스레드 원본 캐시 상태: {thread_root_cache.stats()}")
+    print(f"가맹점 resolver 상태: {merchant_resolver.stats()}")
+    if config.LOCAL_CLASSIFIER_ENABLED and get_local_classifier() is not None:
+        print(f"로컬 분류기 상태: {get_local_classifier().stats()}")
+    if pipeline is not None:
+        print(f"파이프라인 상태: {pipeline.latency_stats()}")
+
+@guarded_job("check_once_per_day", config.DAILY_JOB_TIME_BUDGET_SECONDS, config.DAILY_JOB_MIN_INTERVAL_SECONDS)
 async def check_once_per_day():
     try:
         await check_last_message_upload(app)
@@ -51,17 +90,24 @@ async def check_once_per_day():
 
 # 스케줄러 설정
 scheduler = AsyncIOScheduler()
+# 이전 실행이 끝나지 않았으면 겹쳐 실행하지 않고(max_instances), 밀린 fire는 한 번으로 합침(coalesce)
 scheduler.add_job(
     run_agent_routine,
     'interval',
-    minutes=15
+    minutes=config.RECONCILIATION_INTERVAL_MINUTES,
+    max_instances=1,
+    coalesce=True,
+    misfire_grace_time=config.SCHEDULER_MISFIRE_GRACE_SECONDS
 )
 
 scheduler.add_job(
     check_once_per_day,
     'cron',
     hour=14,
-    minute=0
+    minute=0,
+    max_instances=1,
+    coalesce=True,
+    misfire_grace_time=config.SCHEDULER_MISFIRE_GRACE_SECONDS
 )
 
 
@@ -72,13 +118,34 @@ app.event("message")(handle_message)
 
 async def main():
     # check_last_message_upload()
+    # 테이블/컬럼은 migrations로만 만들므로, 적용되지 않은 revision이 있으면 아무것도 띄우기 전에 실패
+    await check_schema()
+    metrics_server = await start_metrics_server()
+    await bot_identity.load(app.client)
+    # 로컬 분류기 모델은 시작할 때 한 번만 읽음 (다시 학습한 모델은 재시작 후 적용)
+    if config.LOCAL_CLASSIFIER_ENABLED:
+        get_local_classifier()
+    # sender를 먼저 띄워야 첫 routine 결과가 바로 전송됨
+    await slack_outbox.start()
     await run_agent_routine()
     try:
+        if pipeline is not None:
+            pipeline.start()
         scheduler.start()
         handler = AsyncSocketModeHandler(app, SLACK_APP_TOKEN)
         await handler.start_async()
     except Exception as e:
         print(f"앱 시작 실패: {e}")
+    finally:
+        if scheduler.running:
+            scheduler.shutdown(wait=False)
+        if pipeline is not None:
+            await pipeline.stop()
+        await slack_outbox.stop()
+        await advisory_locks.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        await dispose_engine()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,289 @@
+"""거래상대 원문 변형을 canonical 가맹점(merchant_id)으로 묶는 resolver
+
+같은 가맹점이 카드사별 표기, 잘림, 한글/영문 표기 차이로 여러 거래상대 문자열로 들어온다.
+문자를 분해할 때 row마다 merchant_id를 붙여두면 이후 stage는 문자열 유사도 대신 merchant_id 동등 조건으로 비교할 수 있다.
+
+- 먼저 merchant_key(지점명을 떼고 normalize_party한 키)로 merchant_alias를 정확히 찾는다 (프로세스 메모리 캐시 -> DB 순).
+- 처음 보는 키만 n-gram TF-IDF 코사인 유사도로 기존 가맹점 키에 붙이고 (MERCHANT_FUZZY_MIN_SCORE 이상),
+  그래도 남은 키는 서로 묶어서(single-linkage) 묶음마다 새 가맹점을 만든다.
+- 한글/영문처럼 문자열로는 묶이지 않는 변형은 merge 명령으로 합친다.
+  (실행 중인 프로세스는 재시작 전까지 이전 merchant_id를 캐시에 들고 있으므로, 합친 뒤 필요하면 merge를 다시 실행)
+
+    uv run python -m merchant_resolver stats [--top 30]
+    uv run python -m merchant_resolver merge <from_merchant_id> <into_merchant_id>
+"""
+import argparse
+import asyncio
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import func
+
+from account_history import normalize_party
+from config import MERCHANT_RESOLVER_ENABLED, MERCHANT_FUZZY_MIN_SCORE, MERCHANT_ASSIGN_BATCH_SIZE
+from database import database_session
+from models import Merchant, MerchantAlias, 장부_결제문자
+from ngram_index import NgramIndex
+from telemetry import MERCHANT_RESOLUTIONS
+
+
+BRANCH_SUFFIX = re.compile(r'\S+(점|店)$')
+# 점/店으로 끝나지만 지점명이 아니라 업태인 단어 ("신세계 백화점"과 "신세계 면세점"은 다른 가맹점)
+STORE_TYPE_SUFFIXES = ("백화점", "면세점", "편의점", "할인점", "대리점", "전문점", "음식점", "양판점",
+                       "百貨店", "免税店", "専門店")
+
+
+def is_branch_name(token: str) -> bool:
+    """"강남점", "新宿店"처럼 떼어도 되는 지점명인지 (업태 단어는 제외)"""
+    return bool(BRANCH_SUFFIX.fullmatch(token)) and not token.endswith(STORE_TYPE_SUFFIXES)
+
+
+def merchant_key(name: str) -> str:
+    """가맹점 비교용 키: 공백으로 분리된 마지막 지점명("스타벅스 강남점", "UNIQLO 新宿店")을 떼고 normalize_party"""
+    tokens = (name or "").split()
+    if len(tokens) > 1 and is_branch_name(tokens[-1]):
+        tokens = tokens[:-1]
+    return normalize_party(" ".join(tokens))
+
+
+def cluster_keys(keys: List[str], min_score: float) -> List[List[Tuple[str, Optional[float]]]]:
+    """n-gram 코사인 유사도가 min_score 이상인 키끼리 묶음 (묶음의 첫 키는 가장 짧은 키, 점수는 묶일 때의 최고 유사도)"""
+    index = NgramIndex()
+    index.add(keys)
+    parent = {key: key for key in keys}
+
+    def root(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    best_score: Dict[str, float] = {}
+    for key, hits in index.search(keys, limit=10, min_score=min_score).items():
+        for other, score in hits:
+            if other == key:
+                continue
+            for member in (key, other):
+                best_score[member] = max(best_score.get(member, 0.0), score)
+            parent[root(other)] = root(key)
+
+    clusters = defaultdict(list)
+    for key in keys:
+        clusters[root(key)].append(key)
+    result = []
+    for members in clusters.values():
+        members.sort(key=lambda key: (len(key), key))
+        result.append([(members[0], None)] + [(key, best_score.get(key)) for key in members[1:]])
+    return result
+
+
+class MerchantResolver:
+    """정규화 키 -> merchant_id 캐시와 fuzzy fallback"""
+
+    def __init__(self, min_score: float = MERCHANT_FUZZY_MIN_SCORE):
+        self.min_score = min_score
+        self.merchant_by_key: Dict[str, int] = {}
+        self.ngram_index = NgramIndex()  # 등록된 alias 키 (fuzzy fallback 후보)
+        self.loaded = False
+        self.counts = Counter()  # cache_hit, db_hit, fuzzy, new
+        self._lock = asyncio.Lock()
+
+    def _remember(self, key: str, merchant_id: int):
+        self.merchant_by_key[key] = merchant_id
+        self.ngram_index.add([key])
+
+    def _count(self, outcome: str, amount: int = 1):
+        if amount:
+            self.counts[outcome] += amount
+            MERCHANT_RESOLUTIONS.inc(amount, outcome=outcome)
+
+    async def _load(self):
+        async with database_session() as db_session:
+            rows = (await db_session.execute(select(MerchantAlias.normalized_key, MerchantAlias.merchant_id))).all()
+        self.merchant_by_key = {key: merchant_id for key, merchant_id in rows}
+        self.ngram_index = NgramIndex()
+        self.ngram_index.add(self.merchant_by_key)
+        self.loaded = True
+        print(f"가맹점 alias {len(self.merchant_by_key)}개 로드")
+
+    async def resolve(self, names: Iterable[str]) -> Dict[str, int]:
+        """거래상대 원문 -> merchant_id (정규화 키가 비는 이름은 결과에 없음)"""
+        async with self._lock:
+            if not self.loaded:
+                await self._load()
+            names_by_key: Dict[str, List[str]] = defaultdict(list)
+            for name in set(names):
+                key = merchant_key(name)
+                if key:
+                    names_by_key[key].append(name)
+
+            unseen = {key: min(names) for key, names in names_by_key.items() if key not in self.merchant_by_key}
+            self._count("cache_hit", len(names_by_key) - len(unseen))
+            if unseen:
+                await self._register(unseen)
+            return {
+                name: self.merchant_by_key[key]
+                for key, names in names_by_key.items() if key in self.merchant_by_key
+                for name in names
+            }
+
+    async def _register(self, unseen: Dict[str, str]):
+        """캐시에 없는 키를 DB에서 찾고, 없으면 fuzzy로 기존 가맹점에 붙이거나 새 가맹점을 만들어 alias 저장"""
+        async with database_session() as db_session:
+            # 다른 프로세스가 먼저 등록한 키
+            rows = (await db_session.execute(
+                select(MerchantAlias.normalized_key, MerchantAlias.merchant_id)
+                .where(MerchantAlias.normalized_key.in_(list(unseen)))
+            )).all()
+            for key, merchant_id in rows:
+                self._remember(key, merchant_id)
+                del unseen[key]
+            self._count("db_hit", len(rows))
+            if not unseen:
+                return
+
+            aliases = []
+            neighbours = self.ngram_index.search(list(unseen), limit=1, min_score=self.min_score)
+            for key, hits in neighbours.items():
+                if hits:
+                    matched_key, score = hits[0]
+                    aliases.append({"normalized_key": key, "merchant_id": self.merchant_by_key[matched_key],
+                                    "raw_name": unseen[key], "match_method": "fuzzy", "match_score": score})
+
+            # 기존 가맹점과 비슷하지 않은 키는 같은 배치 안에서 서로 묶어 묶음마다 새 가맹점 하나
+            clusters = cluster_keys([key for key, hits in neighbours.items() if not hits], self.min_score)
+            if clusters:
+                merchant_ids = (await db_session.scalars(
+                    insert(Merchant).returning(Merchant.merchant_id, sort_by_parameter_order=True),
+                    [{"canonical_name": unseen[cluster[0][0]]} for cluster in clusters]
+                )).all()
+                for cluster, merchant_id in zip(clusters, merchant_ids):
+                    for position, (key, score) in enumerate(cluster):
+                        aliases.append({"normalized_key": key, "merchant_id": merchant_id, "raw_name": unseen[key],
+                                        "match_method": "fuzzy" if position else "new", "match_score": score})
+
+            await db_session.execute(
+                insert(MerchantAlias).on_conflict_do_nothing(index_elements=[MerchantAlias.normalized_key]), aliases
+            )
+            # 동시에 같은 키를 등록한 프로세스가 있으면 먼저 저장된 쪽을 따름
+            saved = (await db_session.execute(
+                select(MerchantAlias.normalized_key, MerchantAlias.merchant_id)
+                .where(MerchantAlias.normalized_key.in_(list(unseen)))
+            )).all()
+            await db_session.commit()
+
+        for key, merchant_id in saved:
+            self._remember(key, merchant_id)
+        methods = Counter(alias["match_method"] for alias in aliases)
+        self._count("fuzzy", methods["fuzzy"])
+        self._count("new", methods["new"])
+
+    def stats(self) -> dict:
+        lookups = sum(self.counts.values())
+        return {
+            "aliases": len(self.merchant_by_key),
+            "merchants": len(set(self.merchant_by_key.values())),
+            **{outcome: self.counts[outcome] for outcome in ("cache_hit", "db_hit", "fuzzy", "new")},
+            "hit_rate": round((self.counts["cache_hit"] + self.counts["db_hit"]) / lookups, 3) if lookups else 0.0,
+        }
+
+
+merchant_resolver = MerchantResolver()
+
+
+def merchant_pending_query():
+    """거래상대가 있고 가맹점이 아직 배정되지 않은 row, 최근 것부터 (ix_ledger_merchant_pending)"""
+    return select(장부_결제문자.mac_message_id, 장부_결제문자.거래상대).where(
+        장부_결제문자.merchant_id.is_(None),
+        장부_결제문자.거래상대.is_not(None)
+    ).order_by(장부_결제문자.결제시간.desc())
+
+
+async def assign_merchants(mac_message_ids=None) -> int:
+    """가맹점이 없는 row에 merchant_id 배정
+
+    mac_message_ids가 주어지면 그 row만, 아니면 MERCHANT_ASSIGN_BATCH_SIZE건씩 (기존 row backfill 포함) 처리한다.
+    """
+    if not MERCHANT_RESOLVER_ENABLED:
+        return 0
+    stmt = merchant_pending_query()
+    if mac_message_ids is not None:
+        stmt = stmt.where(장부_결제문자.mac_message_id.in_(list(mac_message_ids)))
+    else:
+        stmt = stmt.limit(MERCHANT_ASSIGN_BATCH_SIZE)
+    async with database_session() as db_session:
+        rows = (await db_session.execute(stmt)).all()
+        if not rows:
+            return 0
+        merchant_by_name = await merchant_resolver.resolve(row.거래상대 for row in rows)
+        updates = [{"mac_message_id": row.mac_message_id, "merchant_id": merchant_by_name[row.거래상대]}
+                   for row in rows if row.거래상대 in merchant_by_name]
+        if updates:
+            await db_session.execute(update(장부_결제문자), updates)
+        await db_session.commit()
+    print(f"가맹점 배정: {len(updates)}/{len(rows)}건, resolver 상태: {merchant_resolver.stats()}")
+    return len(updates)
+
+
+async def merge_merchants(from_merchant_id: int, into_merchant_id: int) -> Tuple[int, int]:
+    """from 가맹점의 alias와 장부 row를 into 가맹점으로 옮김 (옮긴 alias 수, row 수)"""
+    async with database_session() as db_session:
+        aliases = await db_session.execute(
+            update(MerchantAlias).where(MerchantAlias.merchant_id == from_merchant_id)
+            .values(merchant_id=into_merchant_id, match_method="manual")
+        )
+        ledger_rows = await db_session.execute(
+            update(장부_결제문자).where(장부_결제문자.merchant_id == from_merchant_id)
+            .values(merchant_id=into_merchant_id)
+        )
+        await db_session.commit()
+    return aliases.rowcount, ledger_rows.rowcount
+
+
+async def merchant_summary(top: int):
+    """alias가 많은 가맹점 순으로 (merchant_id, canonical_name, alias 수, row 수)"""
+    alias_counts = select(MerchantAlias.merchant_id, func.count().label("aliases")) \
+        .group_by(MerchantAlias.merchant_id).subquery()
+    row_counts = select(장부_결제문자.merchant_id, func.count().label("rows")) \
+        .where(장부_결제문자.merchant_id.is_not(None)).group_by(장부_결제문자.merchant_id).subquery()
+    async with database_session() as db_session:
+        return (await db_session.execute(
+            select(Merchant.merchant_id, Merchant.canonical_name, alias_counts.c.aliases,
+                   func.coalesce(row_counts.c.rows, 0))
+            .join(alias_counts, alias_counts.c.merchant_id == Merchant.merchant_id)
+            .outerjoin(row_counts, row_counts.c.merchant_id == Merchant.merchant_id)
+            .order_by(alias_counts.c.aliases.desc()).limit(top)
+        )).all()
+
+
+async def _main(args):
+    from database import dispose_engine
+
+    try:
+        if args.command == "stats":
+            async with database_session() as db_session:
+                merchants = await db_session.scalar(select(func.count()).select_from(Merchant))
+                aliases = await db_session.scalar(select(func.count()).select_from(MerchantAlias))
+                pending = await db_session.scalar(select(func.count()).select_from(merchant_pending_query().subquery()))
+            print(f"가맹점 {merchants}개, alias {aliases}개, 미배정 row {pending}건")
+            for merchant_id, canonical_name, alias_count, row_count in await merchant_summary(args.top):
+                print(f"{merchant_id:>8} {canonical_name} | alias {alias_count} | row {row_count}")
+        else:
+            alias_count, row_count = await merge_merchants(args.from_merchant_id, args.into_merchant_id)
+            print(f"가맹점 {args.from_merchant_id} -> {args.into_merchant_id}: alias {alias_count}개, row {row_count}건 이동")
+    finally:
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="가맹점(merchant) 관리")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    stats_parser = subparsers.add_parser("stats")
+    stats_parser.add_argument("--top", type=int, default=30)
+    merge_parser = subparsers.add_parser("merge", help="두 가맹점을 하나로 합침")
+    merge_parser.add_argument("from_merchant_id", type=int)
+    merge_parser.add_argument("into_merchant_id", type=int)
+    asyncio.run(_main(parser.parse_args()))
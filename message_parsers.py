@@ -0,0 +1,261 @@
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from agents.message_divider_agent import DividedMessageOutput
+from config import CARD_SENDER_LIST, BANK_SENDER_LIST
+
+# 발신자명별 정규식 파서 적중 / LLM fallback 횟수
+PARSER_HITS = Counter()
+LLM_FALLBACKS = Counter()
+
+TRANSACTION_TYPES = r'해외승인취소|해외취소|해외승인|승인취소|취소|승인|거절|입금|출금'
+TRANSACTION_TYPE_MAP = {
+    '승인': '승인',
+    '해외승인': '승인',
+    '승인취소': '승인취소',
+    '취소': '승인취소',
+    '해외취소': '승인취소',
+    '해외승인취소': '승인취소',
+    '거절': '거절',
+    '입금': '입금',
+    '출금': '출금',
+}
+
+# "12,000원" 또는 "JPY 3,300.00" 형태의 금액
+AMOUNT = r'(?:(?P<krw>\d[\d,]*)원|(?P<currency>KRW|JPY|USD|EUR)\s?(?P<fx>\d[\d,]*(?:\.\d+)?))'
+DATETIME = r'\d{2}/\d{2}\s\d{2}:\d{2}'
+PARTY = r'(?P<party>[^\n]+?)'
+
+
+class MessageTemplate:
+    """발신사 문자 템플릿 하나에 대응하는 정규식. examples는 (익명화된 원문, 기대 결과) 목록"""
+
+    def __init__(self, name: str, pattern: str, examples: Iterable[Tuple[str, Tuple]] = ()):
+        self.name = name
+        self.regex = re.compile(pattern, re.MULTILINE)
+        self.examples = list(examples)
+
+    def parse(self, text: str) -> Optional[DividedMessageOutput]:
+        match = self.regex.search(text)
+        if not match:
+            return None
+
+        groups = match.groupdict()
+        transaction_type = TRANSACTION_TYPE_MAP.get(groups.get('type'))
+        if transaction_type is None:
+            return None
+
+        if groups.get('krw'):
+            amount_text, currency = groups['krw'], 'KRW'
+        elif groups.get('fx'):
+            amount_text, currency = groups['fx'], groups['currency']
+        else:
+            return None
+
+        amount_text = amount_text.replace(',', '')
+        if '.' in amount_text:
+            integer_part, decimal_part = amount_text.split('.', 1)
+            # 소수점 금액(USD 12.50 등)은 정수 컬럼에 담을 수 없으니 LLM에게 넘김
+            if decimal_part.strip('0'):
+                return None
+            amount_text = integer_part
+
+        party = (groups.get('party') or '').strip()
+        if not party:
+            return None
+
+        return DividedMessageOutput(
+            transaction_type=transaction_type,
+            amount=int(amount_text),
+            currency=currency,
+            transaction_party=party,
+        )
+
+
+# 발신번호 -> 템플릿 목록
+MESSAGE_PARSERS: Dict[str, List[MessageTemplate]] = defaultdict(list)
+
+
+def register_templates(sender_numbers: Iterable[str], *templates: MessageTemplate):
+    """발신번호에 템플릿 등록 (먼저 등록한 템플릿부터 시도)"""
+    for sender_number in sender_numbers:
+        MESSAGE_PARSERS[sender_number].extend(templates)
+
+
+def card_template(name: str, header: str, name_line: bool = True, examples=()) -> MessageTemplate:
+    """헤더(카드명+승인종류) / [이름] / 금액 / 일시 / 가맹점 순서의 카드 승인문자 템플릿"""
+    name_line_pattern = r'[^\n]+\n' if name_line else ''
+    return MessageTemplate(
+        name,
+        rf'\A{header}(?P<type>{TRANSACTION_TYPES})[^\n]*\n{name_line_pattern}{AMOUNT}[^\n]*\n'
+        rf'{DATETIME}\s+{PARTY}\s*$',
+        examples
+    )
+
+
+def normalize_message(message: str) -> str:
+    """[Web발신] 제거, 줄 단위 공백 정리, 빈 줄 제거"""
+    text = (message or '').replace('[Web발신]', '')
+    lines = [re.sub(r'\s+', ' ', line).strip() for line in text.splitlines()]
+    return '\n'.join(line for line in lines if line)
+
+
+def parse_message(sender_number: str, message: str) -> Optional[DividedMessageOutput]:
+    """등록된 템플릿으로 문자를 분해. 맞는 템플릿이 없으면 None (LLM fallback)"""
+    sender_name = CARD_SENDER_LIST.get(sender_number) or BANK_SENDER_LIST.get(sender_number) or sender_number
+    text = normalize_message(message)
+    for template in MESSAGE_PARSERS.get(sender_number, []):
+        divided_message = template.parse(text)
+        if divided_message is not None:
+            PARSER_HITS[sender_name] += 1
+            return divided_message
+
+    LLM_FALLBACKS[sender_name] += 1
+    return None
+
+
+def parser_stats() -> dict:
+    """발신자명별 파서 적중/LLM fallback 횟수"""
+    return {
+        sender_name: {"parser": PARSER_HITS[sender_name], "llm": LLM_FALLBACKS[sender_name]}
+        for sender_name in sorted(set(PARSER_HITS) | set(LLM_FALLBACKS))
+    }
+
+
+register_templates(
+    ['+8215888900', '+82220008100'],
+    card_template(
+        '삼성카드', r'삼성\d{4}', name_line=False,
+        examples=[
+            ("[Web발신]\n삼성1234승인 고*지\n12,000원 일시불\n10/15 12:34 스타벅스강남R점\n누적1,234,567원",
+             ('승인', 12000, 'KRW', '스타벅스강남R점')),
+            ("[Web발신]\n삼성1234해외승인 고*지\nJPY 3,300.00\n10/15 12:34 UNIQLO GINZA",
+             ('승인', 3300, 'JPY', 'UNIQLO GINZA')),
+            ("[Web발신]\n삼성1234승인취소 고*지\n12,000원 일시불\n10/15 13:01 스타벅스강남R점",
+             ('승인취소', 12000, 'KRW', '스타벅스강남R점')),
+        ]
+    ),
+)
+
+register_templates(
+    ['+8215447200'],
+    MessageTemplate(
+        '신한카드',
+        rf'\A신한카드\(\d{{4}}\)(?P<type>{TRANSACTION_TYPES})\s+[^\s\d]+\s+{AMOUNT}(?:\([^)]*\))?\s*'
+        rf'{DATETIME}\s+{PARTY}(?:\s*누적\s?[\d,]+원?)?\s*$',
+        examples=[
+            ("[Web발신]\n신한카드(1234)승인 고*지 12,000원(일시불)10/15 12:34 스타벅스 누적1,234,567원",
+             ('승인', 12000, 'KRW', '스타벅스')),
+            ("[Web발신]\n신한카드(1234)해외승인 고*지 USD 25.00 10/15 12:34 AMAZON.COM",
+             ('승인', 25, 'USD', 'AMAZON.COM')),
+            ("[Web발신]\n신한카드(1234)취소 고*지 12,000원(일시불)10/15 12:34 스타벅스",
+             ('승인취소', 12000, 'KRW', '스타벅스')),
+        ]
+    ),
+)
+
+register_templates(
+    ['+8215776200'],
+    card_template(
+        '현대카드', r'[^\n]*?',
+        examples=[
+            ("[Web발신]\n현대카드 M 승인\n고*지\n12,000원 일시불\n10/15 12:34\n스타벅스\n누적1,234,567원",
+             ('승인', 12000, 'KRW', '스타벅스')),
+            ("[Web발신] [현대카드] The Platinum 해외승인\n권*진\nJPY 15,400\n10/15 12:34\nBEAMS SHINJUKU",
+             ('승인', 15400, 'JPY', 'BEAMS SHINJUKU')),
+            ("[Web발신] 올리브영 현대카드 승인취소\n고*지\n8,900원 일시불\n10/15 12:34\n올리브영 신촌점",
+             ('승인취소', 8900, 'KRW', '올리브영 신촌점')),
+        ]
+    ),
+)
+
+register_templates(
+    ['+8215881688'],
+    card_template(
+        '국민카드', r'KB국민카드\s?\d{4}',
+        examples=[
+            ("[Web발신]\nKB국민카드1234승인\n고*지님\n12,000원 일시불\n10/15 12:34\n스타벅스\n누적1,234,567원",
+             ('승인', 12000, 'KRW', '스타벅스')),
+            ("[Web발신]\nKB국민카드1234해외승인\n고*지님\nEUR 120.00\n10/15 12:34\nGALERIES LAFAYETTE",
+             ('승인', 120, 'EUR', 'GALERIES LAFAYETTE')),
+        ]
+    ),
+)
+
+register_templates(
+    ['+8215888100'],
+    card_template(
+        '롯데카드', r'롯데\d{4}',
+        examples=[
+            ("[Web발신]\n롯데1234승인\n고*지\n53,000원 일시불\n10/15 12:34\n롯데백화점본점\n누적1,234,567원",
+             ('승인', 53000, 'KRW', '롯데백화점본점')),
+            ("[Web발신]\n롯데1234승인취소\n고*지\n53,000원 일시불\n10/16 09:10\n롯데백화점본점",
+             ('승인취소', 53000, 'KRW', '롯데백화점본점')),
+        ]
+    ),
+)
+
+register_templates(
+    ['+82269589000'],
+    card_template(
+        '우리카드', r'우리\(\d{4}\)',
+        examples=[
+            ("[Web발신]\n우리(1234)승인\n고*지님\n12,000원 일시불\n10/15 12:34\n스타벅스\n누적1,234,567원",
+             ('승인', 12000, 'KRW', '스타벅스')),
+        ]
+    ),
+)
+
+register_templates(
+    ['+8215993333'],
+    MessageTemplate(
+        '카카오뱅크',
+        rf'\A\[카카오뱅크\]\s*[^\n(]*\(\d{{4}}\)\s+{DATETIME}\s+(?P<type>입금|출금)\s+(?P<krw>\d[\d,]*)원\s+'
+        rf'{PARTY}(?:\s*잔액\s?[\d,]+원?)?\s*$',
+        examples=[
+            ("[Web발신]\n[카카오뱅크]\n고*지(1234)\n10/15 12:34\n출금 12,000원\n스타벅스\n잔액 100,000원",
+             ('출금', 12000, 'KRW', '스타벅스')),
+            ("[Web발신]\n[카카오뱅크] 고*지(1234) 10/15 12:34 입금 500,000원 홍길동",
+             ('입금', 500000, 'KRW', '홍길동')),
+        ]
+    ),
+)
+
+register_templates(
+    ['+8215778000'],
+    MessageTemplate(
+        '신한은행',
+        rf'\A\[?신한\]?\s*{DATETIME}\s+[\d*\-]+\s+(?P<type>입금|출금)\s+(?P<krw>\d[\d,]*)원?\s+'
+        rf'잔액\s+[\d,]+원?\s+{PARTY}\s*$',
+        examples=[
+            ("[Web발신]\n신한10/15 12:34\n110-***-123456\n출금 12,000\n잔액 100,000\n 스타벅스",
+             ('출금', 12000, 'KRW', '스타벅스')),
+            ("[Web발신]\n신한10/15 12:34\n110-***-123456\n입금 1,500,000\n잔액 1,600,000\n 네이버파이낸셜",
+             ('입금', 1500000, 'KRW', '네이버파이낸셜')),
+        ]
+    ),
+)
+
+
+def verify_examples() -> List[str]:
+    """등록된 템플릿의 예시 문자가 기대 결과대로 분해되는지 확인하고 실패 목록을 반환"""
+    failures = []
+    for sender_number, templates in MESSAGE_PARSERS.items():
+        for template in templates:
+            for message, expected in template.examples:
+                divided_message = template.parse(normalize_message(message))
+                actual = None if divided_message is None else (
+                    divided_message.transaction_type, divided_message.amount,
+                    divided_message.currency, divided_message.transaction_party
+                )
+                if actual != expected:
+                    failures.append(f"{template.name} ({sender_number}): {message!r} -> {actual}, 기대값 {expected}")
+    return failures
+
+
+if __name__ == "__main__":
+    failed = verify_examples()
+    for failure in failed:
+        print(failure)
+    print(f"템플릿 예시 검증: 실패 {len(failed)}건")
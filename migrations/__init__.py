@@ -0,0 +1,167 @@
+"""장부 DB 스키마 마이그레이션 (models.py와 함께 버전 관리)
+
+    uv run python -m migrations status
+    uv run python -m migrations upgrade [revision]
+    uv run python -m migrations downgrade <revision>    # revision 이후를 되돌림 ('base'면 전부)
+
+versions/NNNN_*.py 모듈은 revision, description, transactional과 실행할 SQL 목록을 반환하는 upgrade()/downgrade()를 가진다.
+적용된 revision은 schema_migrations 테이블에 기록한다. 테이블은 이 마이그레이션으로만 만들고, 앱과 CLI는 시작할 때
+check_schema()로 최신 revision까지 적용됐는지 확인해서 아니면 바로 실패한다.
+CREATE INDEX CONCURRENTLY는 트랜잭션 안에서 실행할 수 없으므로 transactional = False인 revision은 한 문장씩 autocommit으로
+실행한다. 그런 revision의 SQL은 모두 IF [NOT] EXISTS로 작성해서, 중간에 실패해도 다시 실행하면 이어서 진행된다.
+"""
+import importlib
+import pkgutil
+from pathlib import Path
+from types import ModuleType
+from typing import List, Optional
+
+from database import connect_raw
+from models import metadata
+
+VERSIONS_PACKAGE = f"{__name__}.versions"
+VERSION_TABLE = f"{metadata.schema}.schema_migrations"
+
+
+def load_revisions() -> List[ModuleType]:
+    """versions/ 아래 revision 모듈을 revision 순서대로"""
+    revisions = [
+        importlib.import_module(f"{VERSIONS_PACKAGE}.{module.name}")
+        for module in pkgutil.iter_modules([str(Path(__file__).parent / "versions")])
+    ]
+    revisions.sort(key=lambda revision: revision.revision)
+    seen = set()
+    for revision in revisions:
+        if revision.revision in seen:
+            raise ValueError(f"중복된 revision: {revision.revision}")
+        seen.add(revision.revision)
+    return revisions
+
+
+async def _ensure_version_table(connection):
+    await connection.execute(f"CREATE SCHEMA IF NOT EXISTS {metadata.schema}")
+    await connection.execute(f"""
+        CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (
+            revision TEXT PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+    """)
+
+
+async def _applied_revisions(connection) -> set:
+    return {row["revision"] for row in await connection.fetch(f"SELECT revision FROM {VERSION_TABLE}")}
+
+
+async def _drop_invalid_indexes(connection):
+    """CONCURRENTLY 생성이 중간에 실패하면 INVALID 인덱스가 남아 IF NOT EXISTS가 건너뛰므로 먼저 정리"""
+    rows = await connection.fetch("""
+        SELECT index_class.relname AS name
+        FROM pg_index
+        JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+        JOIN pg_namespace ON pg_namespace.oid = index_class.relnamespace
+        WHERE pg_namespace.nspname = $1 AND NOT pg_index.indisvalid
+    """, metadata.schema)
+    for row in rows:
+        print(f"  INVALID 인덱스 삭제: {row['name']}")
+        await connection.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {metadata.schema}."{row["name"]}"')
+
+
+async def _apply(connection, revision: ModuleType, statements: List[str], record_sql: str, *record_args):
+    if getattr(revision, "transactional", True):
+        async with connection.transaction():
+            for statement in statements:
+                await connection.execute(statement)
+            await connection.execute(record_sql, *record_args)
+        return
+
+    await _drop_invalid_indexes(connection)
+    for statement in statements:
+        await connection.execute(statement)
+    await connection.execute(record_sql, *record_args)
+
+
+async def upgrade(target: Optional[str] = None) -> List[str]:
+    """target(없으면 최신)까지 적용되지 않은 revision을 순서대로 적용하고 적용한 revision 목록을 반환"""
+    revisions = load_revisions()
+    if target is not None and target not in {revision.revision for revision in revisions}:
+        raise ValueError(f"알 수 없는 revision: {target}")
+
+    connection = await connect_raw()
+    try:
+        await _ensure_version_table(connection)
+        applied = await _applied_revisions(connection)
+        upgraded = []
+        for revision in revisions:
+            if revision.revision not in applied:
+                print(f"upgrade {revision.revision}: {revision.description}")
+                await _apply(
+                    connection, revision, revision.upgrade(),
+                    f"INSERT INTO {VERSION_TABLE} (revision, description) VALUES ($1, $2)",
+                    revision.revision, revision.description
+                )
+                upgraded.append(revision.revision)
+            if revision.revision == target:
+                break
+        return upgraded
+    finally:
+        await connection.close()
+
+
+async def downgrade(target: str) -> List[str]:
+    """target보다 뒤의 적용된 revision을 역순으로 되돌림 (target='base'면 전부)"""
+    revisions = load_revisions()
+    if target != "base" and target not in {revision.revision for revision in revisions}:
+        raise ValueError(f"알 수 없는 revision: {target}")
+
+    connection = await connect_raw()
+    try:
+        await _ensure_version_table(connection)
+        applied = await _applied_revisions(connection)
+        downgraded = []
+        for revision in reversed(revisions):
+            if revision.revision == target:
+                break
+            if revision.revision in applied:
+                print(f"downgrade {revision.revision}: {revision.description}")
+                await _apply(
+                    connection, revision, revision.downgrade(),
+                    f"DELETE FROM {VERSION_TABLE} WHERE revision = $1", revision.revision
+                )
+                downgraded.append(revision.revision)
+        return downgraded
+    finally:
+        await connection.close()
+
+
+async def pending_revisions() -> List[str]:
+    """아직 적용되지 않은 revision (schema_migrations가 없으면 전부, 테이블을 만들지 않음)"""
+    connection = await connect_raw()
+    try:
+        exists = await connection.fetchval("SELECT to_regclass($1)", VERSION_TABLE)
+        applied = await _applied_revisions(connection) if exists else set()
+    finally:
+        await connection.close()
+    return [revision.revision for revision in load_revisions() if revision.revision not in applied]
+
+
+async def check_schema():
+    """적용되지 않은 revision이 있으면 RuntimeError (앱/CLI 시작 시 호출, 없는 테이블/컬럼으로 중간에 실패하지 않도록)"""
+    pending = await pending_revisions()
+    if pending:
+        raise RuntimeError(f"DB 스키마가 최신이 아닙니다. 적용되지 않은 revision: {', '.join(pending)} "
+                           f"(uv run python -m migrations upgrade 후 다시 실행하세요)")
+
+
+async def status() -> List[dict]:
+    """revision별 적용 여부"""
+    connection = await connect_raw()
+    try:
+        await _ensure_version_table(connection)
+        applied = await _applied_revisions(connection)
+    finally:
+        await connection.close()
+    return [
+        {"revision": revision.revision, "description": revision.description, "applied": revision.revision in applied}
+        for revision in load_revisions()
+    ]
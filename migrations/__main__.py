@@ -0,0 +1,24 @@
+import argparse
+import asyncio
+
+from migrations import upgrade, downgrade, status
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="장부 DB 스키마 마이그레이션")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    upgrade_parser = subparsers.add_parser("upgrade", help="최신(또는 지정한 revision)까지 적용")
+    upgrade_parser.add_argument("revision", nargs="?")
+    downgrade_parser = subparsers.add_parser("downgrade", help="지정한 revision 이후를 되돌림 ('base'면 전부)")
+    downgrade_parser.add_argument("revision")
+    subparsers.add_parser("status", help="revision별 적용 여부")
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        applied = asyncio.run(upgrade(args.revision))
+        print(f"적용: {', '.join(applied) if applied else '없음 (최신 상태)'}")
+    elif args.command == "downgrade":
+        reverted = asyncio.run(downgrade(args.revision))
+        print(f"되돌림: {', '.join(reverted) if reverted else '없음'}")
+    else:
+        for revision in asyncio.run(status()):
+            print(f"[{'x' if revision['applied'] else ' '}] {revision['revision']} {revision['description']}")
@@ -0,0 +1,34 @@
+"""slack_outbox 테이블"""
+from models import metadata
+
+revision = "0001"
+description = "slack_outbox 테이블"
+transactional = True
+
+SCHEMA = metadata.schema
+
+
+def upgrade():
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.slack_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            channel TEXT NOT NULL,
+            text TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            digest BOOLEAN NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            last_error TEXT,
+            next_attempt_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            sent_at TIMESTAMP WITHOUT TIME ZONE,
+            slack_ts TEXT
+        )
+        """,
+        f"CREATE INDEX IF NOT EXISTS ix_slack_outbox_status_next_attempt ON {SCHEMA}.slack_outbox (status, next_attempt_at)",
+    ]
+
+
+def downgrade():
+    return [f"DROP TABLE IF EXISTS {SCHEMA}.slack_outbox"]
@@ -0,0 +1,33 @@
+"""services.py stage 조회 쿼리용 장부_결제문자 / tbl_receipt 인덱스 (models.py의 Index 정의와 같음)
+
+운영 중인 테이블을 잠그지 않도록 CONCURRENTLY로 만들고 지운다.
+"""
+from models import metadata
+
+revision = "0002"
+description = "장부_결제문자 stage 쿼리 인덱스"
+transactional = False
+
+SCHEMA = metadata.schema
+LEDGER = f'{SCHEMA}."장부_결제문자"'
+RECEIPT = f"{SCHEMA}.tbl_receipt"
+
+INDEXES = {
+    "ix_ledger_divider_pending": f'{LEDGER} ("결제시간") WHERE transaction_type IS NULL',
+    "ix_ledger_purpose_pending": f'{LEDGER} (transaction_type, "결제시간") WHERE "거래목적" IS NULL',
+    "ix_ledger_type_time": f'{LEDGER} (transaction_type, "결제시간")',
+    "ix_ledger_receipt_pending": f'{LEDGER} ("거래목적", "결제시간") WHERE idtbl_receipt IS NULL',
+    "ix_ledger_confident_history": f"{LEDGER} (confidence) WHERE transaction_type IS NOT NULL",
+    "ix_ledger_sender_message_id": f'{LEDGER} ("발신번호", mac_message_id text_pattern_ops)',
+    "ix_ledger_message_prefix_time": f'{LEDGER} (left(mac_message_id, 3), "결제시간")',
+    "ix_ledger_not_included": f'{LEDGER} ("발신번호") WHERE "장부에포함" IS NOT TRUE',
+    "ix_receipt_buying_date": f"{RECEIPT} (buying_date)",
+}
+
+
+def upgrade():
+    return [f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}" for name, definition in INDEXES.items()]
+
+
+def downgrade():
+    return [f"DROP INDEX CONCURRENTLY IF EXISTS {SCHEMA}.{name}" for name in reversed(INDEXES)]
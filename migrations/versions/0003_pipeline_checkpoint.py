@@ -0,0 +1,35 @@
+"""stage별 watermark를 저장하는 pipeline_checkpoint 테이블과 high-water mark 조회용 인덱스 (checkpoints.py)"""
+from models import metadata
+
+revision = "0003"
+description = "pipeline_checkpoint 테이블"
+transactional = False
+
+SCHEMA = metadata.schema
+
+
+def upgrade():
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.pipeline_checkpoint (
+            stage TEXT PRIMARY KEY,
+            watermark_time TIMESTAMP WITHOUT TIME ZONE,
+            watermark_message_id TEXT,
+            last_run_at TIMESTAMP WITHOUT TIME ZONE,
+            last_run_seconds DOUBLE PRECISION,
+            last_rows_in INTEGER,
+            last_rows_out INTEGER,
+            total_runs INTEGER NOT NULL,
+            updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now()
+        )
+        """,
+        f'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ledger_time_message_id '
+        f'ON {SCHEMA}."장부_결제문자" ("결제시간", mac_message_id)',
+    ]
+
+
+def downgrade():
+    return [
+        f"DROP INDEX CONCURRENTLY IF EXISTS {SCHEMA}.ix_ledger_time_message_id",
+        f"DROP TABLE IF EXISTS {SCHEMA}.pipeline_checkpoint",
+    ]
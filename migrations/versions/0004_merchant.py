@@ -0,0 +1,62 @@
+"""canonical 가맹점 테이블(merchant, merchant_alias)과 장부_결제문자.merchant_id (merchant_resolver.py)
+
+merchant_id 컬럼은 NULL 기본값이라 테이블을 다시 쓰지 않고, FK는 NOT VALID로 붙인 뒤 따로 검증해서
+쓰기를 막는 시간을 줄인다. 기존 row의 merchant_id는 assign_merchants가 주기 실행마다 나눠서 채운다.
+"""
+from models import metadata
+
+revision = "0004"
+description = "merchant 테이블과 장부_결제문자.merchant_id"
+transactional = False
+
+SCHEMA = metadata.schema
+LEDGER = f'{SCHEMA}."장부_결제문자"'
+
+INDEXES = {
+    "ix_ledger_merchant_pending": f'{LEDGER} ("결제시간") WHERE merchant_id IS NULL AND "거래상대" IS NOT NULL',
+    "ix_ledger_merchant_time": f'{LEDGER} (merchant_id, "결제시간")',
+}
+
+
+def upgrade():
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.merchant (
+            merchant_id BIGSERIAL PRIMARY KEY,
+            canonical_name TEXT NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now()
+        )
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.merchant_alias (
+            normalized_key TEXT PRIMARY KEY,
+            merchant_id BIGINT NOT NULL REFERENCES {SCHEMA}.merchant (merchant_id),
+            raw_name TEXT NOT NULL,
+            match_method TEXT NOT NULL,
+            match_score DOUBLE PRECISION,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now()
+        )
+        """,
+        f"CREATE INDEX IF NOT EXISTS ix_merchant_alias_merchant ON {SCHEMA}.merchant_alias (merchant_id)",
+        f"ALTER TABLE {LEDGER} ADD COLUMN IF NOT EXISTS merchant_id BIGINT",
+        f"""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'fk_ledger_merchant') THEN
+                ALTER TABLE {LEDGER} ADD CONSTRAINT fk_ledger_merchant
+                    FOREIGN KEY (merchant_id) REFERENCES {SCHEMA}.merchant (merchant_id) NOT VALID;
+            END IF;
+        END $$
+        """,
+        f"ALTER TABLE {LEDGER} VALIDATE CONSTRAINT fk_ledger_merchant",
+        *(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}" for name, definition in INDEXES.items()),
+    ]
+
+
+def downgrade():
+    return [
+        *(f"DROP INDEX CONCURRENTLY IF EXISTS {SCHEMA}.{name}" for name in reversed(INDEXES)),
+        f"ALTER TABLE {LEDGER} DROP COLUMN IF EXISTS merchant_id",
+        f"DROP TABLE IF EXISTS {SCHEMA}.merchant_alias",
+        f"DROP TABLE IF EXISTS {SCHEMA}.merchant",
+    ]
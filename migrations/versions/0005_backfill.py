@@ -0,0 +1,53 @@
+"""backfill 진행 cursor(backfill_run)와 dry-run 제안 변경(backfill_diff) 테이블 (backfill.py)"""
+from models import metadata
+
+revision = "0005"
+description = "backfill_run, backfill_diff 테이블"
+transactional = True
+
+SCHEMA = metadata.schema
+
+
+def upgrade():
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.backfill_run (
+            run_id TEXT PRIMARY KEY,
+            stage TEXT NOT NULL,
+            range_start TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            range_end TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            reprocess BOOLEAN NOT NULL,
+            dry_run BOOLEAN NOT NULL,
+            cursor_time TIMESTAMP WITHOUT TIME ZONE,
+            cursor_message_id TEXT,
+            chunks_done INTEGER NOT NULL,
+            rows_done INTEGER NOT NULL,
+            rows_written INTEGER NOT NULL,
+            conflicts INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            started_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            finished_at TIMESTAMP WITHOUT TIME ZONE
+        )
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.backfill_diff (
+            diff_id BIGSERIAL PRIMARY KEY,
+            run_id TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            mac_message_id TEXT NOT NULL,
+            column_name TEXT NOT NULL,
+            old_value TEXT,
+            new_value TEXT,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now()
+        )
+        """,
+        f"CREATE INDEX IF NOT EXISTS ix_backfill_diff_run ON {SCHEMA}.backfill_diff (run_id, mac_message_id)",
+    ]
+
+
+def downgrade():
+    return [
+        f"DROP TABLE IF EXISTS {SCHEMA}.backfill_diff",
+        f"DROP TABLE IF EXISTS {SCHEMA}.backfill_run",
+    ]
@@ -0,0 +1,24 @@
+"""발신자명이 비어 있는 row 부분 인덱스 (update_all_records가 watermark 없이 미반영 row만 찾도록)
+
+운영 중인 테이블을 잠그지 않도록 CONCURRENTLY로 만들고 지운다.
+"""
+from models import metadata
+
+revision = "0006"
+description = "장부_결제문자 발신자명 미반영 인덱스"
+transactional = False
+
+SCHEMA = metadata.schema
+LEDGER = f'{SCHEMA}."장부_결제문자"'
+
+INDEXES = {
+    "ix_ledger_sender_name_missing": f'{LEDGER} ("발신번호") WHERE "발신자명" IS NULL',
+}
+
+
+def upgrade():
+    return [f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}" for name, definition in INDEXES.items()]
+
+
+def downgrade():
+    return [f"DROP INDEX CONCURRENTLY IF EXISTS {SCHEMA}.{name}" for name in reversed(INDEXES)]
@@ -0,0 +1,42 @@
+"""장부_결제문자 INSERT마다 mac_message_id를 NOTIFY하는 트리거 (pipeline.py의 StreamingPipeline이 LISTEN)"""
+from config import PIPELINE_NOTIFY_CHANNEL
+from models import metadata
+
+revision = "0007"
+description = "장부_결제문자 NOTIFY 트리거"
+transactional = True
+
+SCHEMA = metadata.schema
+LEDGER = f'{SCHEMA}."장부_결제문자"'
+
+
+def upgrade():
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION {SCHEMA}.notify_ledger_message_inserted() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify(
+                '{PIPELINE_NOTIFY_CHANNEL}',
+                json_build_object(
+                    'mac_message_id', NEW.mac_message_id,
+                    'inserted_at', extract(epoch from clock_timestamp())
+                )::text
+            );
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        f"DROP TRIGGER IF EXISTS ledger_message_inserted ON {LEDGER}",
+        f"""
+        CREATE TRIGGER ledger_message_inserted
+        AFTER INSERT ON {LEDGER}
+        FOR EACH ROW EXECUTE FUNCTION {SCHEMA}.notify_ledger_message_inserted()
+        """,
+    ]
+
+
+def downgrade():
+    return [
+        f"DROP TRIGGER IF EXISTS ledger_message_inserted ON {LEDGER}",
+        f"DROP FUNCTION IF EXISTS {SCHEMA}.notify_ledger_message_inserted()",
+    ]
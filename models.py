@@ -1,7 +1,7 @@
 from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float, MetaData
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.dialects.mysql import MEDIUMTEXT
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from sqlalchemy import (
     Column,
     Integer,
@@ -11,7 +11,7 @@ from sqlalchemy import (
     BigInteger,
     ForeignKey,
     Date,
-
+    Index,
 )
 # Database setup
 metadata = MetaData(schema="modepick_management_prod")
@@ -19,6 +19,39 @@ Base = declarative_base(metadata=metadata)
 
 class 장부_결제문자(Base):
     __tablename__ = '장부_결제문자'
+    # services.py의 stage 조회 쿼리용 인덱스 (migrations/versions/0002_ledger_query_indexes.py에서 생성).
+    # 바인드 파라미터로 들어가는 값(transaction_type, 거래목적 등)은 키 컬럼에 두고 partial 조건에는 NULL 검사만 둬서
+    # asyncpg prepared statement가 generic plan으로 바뀌어도 인덱스를 쓸 수 있게 한다.
+    __table_args__ = (
+        # message_divider_run: transaction_type IS NULL, 결제시간 순
+        Index("ix_ledger_divider_pending", "결제시간", postgresql_where=text("transaction_type IS NULL")),
+        # infer_account / update_cancel_transactions: 거래목적이 비어 있는 승인/승인취소
+        Index("ix_ledger_purpose_pending", "transaction_type", "결제시간", postgresql_where=text('"거래목적" IS NULL')),
+        # update_cancel_transactions: 기간 안의 승인 거래
+        Index("ix_ledger_type_time", "transaction_type", "결제시간"),
+        # link_receipt_to_payments / send_unlinked_receipt_notifications: 영수증 미연결 판매용상품
+        Index("ix_ledger_receipt_pending", "거래목적", "결제시간", postgresql_where=text("idtbl_receipt IS NULL")),
+        # infer_account 분류 컨텍스트: 확신도 높은 과거 분류
+        Index("ix_ledger_confident_history", "confidence", postgresql_where=text("transaction_type IS NOT NULL")),
+        # remove_duplicate_message: 발신번호 + mac_message_id LIKE 'SJ_%'
+        Index("ix_ledger_sender_message_id", "발신번호", "mac_message_id",
+              postgresql_ops={"mac_message_id": "text_pattern_ops"}),
+        # 업로드 지연 알림: SJ_/HJ_ 폰별 최근 결제시간
+        Index("ix_ledger_message_prefix_time", text("left(mac_message_id, 3)"), text('"결제시간"')),
+        # update_all_records: 장부에포함이 아직 반영되지 않은 row
+        Index("ix_ledger_not_included", "발신번호", postgresql_where=text('"장부에포함" IS NOT TRUE')),
+        # update_all_records: 발신번호가 나중에 설정에 추가되어 발신자명이 아직 없는 row
+        # (migrations/versions/0006_sender_name_missing_index.py)
+        Index("ix_ledger_sender_name_missing", "발신번호", postgresql_where=text('"발신자명" IS NULL')),
+        # stage checkpoint: high-water mark 조회와 watermark 이후 범위 조회 (migrations/versions/0003_pipeline_checkpoint.py)
+        Index("ix_ledger_time_message_id", "결제시간", "mac_message_id"),
+        # merchant_resolver.assign_merchants: 거래상대는 있지만 가맹점이 아직 배정되지 않은 row
+        # (migrations/versions/0004_merchant.py)
+        Index("ix_ledger_merchant_pending", "결제시간",
+              postgresql_where=text('merchant_id IS NULL AND "거래상대" IS NOT NULL')),
+        # 같은 가맹점 거래를 기간으로 조회 (문자열 유사도 대신 merchant_id 동등 조건)
+        Index("ix_ledger_merchant_time", "merchant_id", "결제시간"),
+    )
 
     mac_message_id = Column(Text, primary_key=True)
     message = Column(Text)
@@ -37,12 +70,15 @@ class 장부_결제문자(Base):
     account_reason = Column(Text)
     confidence = Column(Float)
     idtbl_receipt = Column(BigInteger, ForeignKey("tbl_receipt.idtbl_receipt"))
+    merchant_id = Column(BigInteger, ForeignKey("merchant.merchant_id", name="fk_ledger_merchant"))
 
 
 
 
 class Receipt(Base):
     __tablename__ = "tbl_receipt"
+    # link_receipt_to_payments의 buying_date 기간 조회
+    __table_args__ = (Index("ix_receipt_buying_date", "buying_date"),)
 
     idtbl_receipt = Column(BigInteger, primary_key=True)
     taxfree = Column(Boolean, default=None)
@@ -63,3 +99,96 @@ class Receipt(Base):
     buying_date = Column(Date, default=None)
     created_time = Column(DateTime, default=func.current_timestamp())
     update_time = Column(DateTime, default=func.current_timestamp(), onupdate=func.current_timestamp())
+
+
+class SlackOutbox(Base):
+    """슬랙으로 보낼 메시지 대기열 (slack_outbox.py의 sender가 전송 후 status를 'sent'로 변경)"""
+    __tablename__ = "slack_outbox"
+    __table_args__ = (Index("ix_slack_outbox_status_next_attempt", "status", "next_attempt_at"),)
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    channel = Column(Text, nullable=False)
+    text = Column(Text, nullable=False)
+    kind = Column(Text, nullable=False)  # account_result, unlinked_receipt, upload_alert 등
+    digest = Column(Boolean, nullable=False, default=False)  # 같은 채널/kind의 다른 row와 묶어서 보내도 되는지
+    status = Column(Text, nullable=False, default="pending")  # pending, sent, failed(재시도해도 안 되는 메시지, last_error 참고)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+    next_attempt_at = Column(DateTime, nullable=False, server_default=func.now())
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    sent_at = Column(DateTime)
+    slack_ts = Column(Text)
+
+
+class PipelineCheckpoint(Base):
+    """stage별로 마지막으로 처리한 (결제시간, mac_message_id) high-water mark와 실행 통계 (checkpoints.py)"""
+    __tablename__ = "pipeline_checkpoint"
+
+    stage = Column(Text, primary_key=True)
+    watermark_time = Column(DateTime)
+    watermark_message_id = Column(Text)
+    last_run_at = Column(DateTime)
+    last_run_seconds = Column(Float)
+    last_rows_in = Column(Integer)
+    last_rows_out = Column(Integer)
+    total_runs = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class Merchant(Base):
+    """거래상대 원문 변형들을 묶은 canonical 가맹점 (merchant_resolver.py)"""
+    __tablename__ = "merchant"
+
+    merchant_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    canonical_name = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class MerchantAlias(Base):
+    """정규화한 거래상대 키 -> 가맹점 (처음 본 키는 fuzzy clustering으로 기존 가맹점에 붙이거나 새 가맹점을 만듦)"""
+    __tablename__ = "merchant_alias"
+    __table_args__ = (Index("ix_merchant_alias_merchant", "merchant_id"),)
+
+    normalized_key = Column(Text, primary_key=True)  # merchant_resolver.merchant_key
+    merchant_id = Column(BigInteger, ForeignKey("merchant.merchant_id"), nullable=False)
+    raw_name = Column(Text, nullable=False)  # 이 키를 처음 만든 거래상대 원문
+    match_method = Column(Text, nullable=False)  # new, fuzzy, manual
+    match_score = Column(Float)  # fuzzy일 때 n-gram 코사인 유사도
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class BackfillRun(Base):
+    """backfill 실행 하나의 stage/결제시간 범위와 진행 cursor (backfill.py). 같은 run_id로 다시 실행하면 cursor 다음부터"""
+    __tablename__ = "backfill_run"
+
+    run_id = Column(Text, primary_key=True)
+    stage = Column(Text, nullable=False)  # divide, classify, cancel-match, receipt-link
+    range_start = Column(DateTime, nullable=False)  # 결제시간 >= range_start
+    range_end = Column(DateTime, nullable=False)  # 결제시간 < range_end
+    reprocess = Column(Boolean, nullable=False, default=False)  # 이미 처리된 row도 다시 처리
+    dry_run = Column(Boolean, nullable=False, default=False)  # 장부 대신 backfill_diff에 제안 변경만 기록
+    cursor_time = Column(DateTime)  # 마지막으로 끝낸 chunk의 마지막 (결제시간, mac_message_id)
+    cursor_message_id = Column(Text)
+    chunks_done = Column(Integer, nullable=False, default=0)
+    rows_done = Column(Integer, nullable=False, default=0)
+    rows_written = Column(Integer, nullable=False, default=0)
+    conflicts = Column(Integer, nullable=False, default=0)
+    status = Column(Text, nullable=False)  # running, interrupted, done
+    started_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
+    finished_at = Column(DateTime)
+
+
+class BackfillDiff(Base):
+    """dry-run backfill이 장부_결제문자에 쓰려던 변경 (컬럼 하나당 한 row, 값은 text로)"""
+    __tablename__ = "backfill_diff"
+    __table_args__ = (Index("ix_backfill_diff_run", "run_id", "mac_message_id"),)
+
+    diff_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    run_id = Column(Text, nullable=False)
+    stage = Column(Text, nullable=False)  # LedgerWriter stage 이름
+    mac_message_id = Column(Text, nullable=False)
+    column_name = Column(Text, nullable=False)
+    old_value = Column(Text)
+    new_value = Column(Text)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
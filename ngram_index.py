@@ -0,0 +1,281 @@
+"""거래상대 문자열의 문자 n-gram TF-IDF 인덱스 (유사 거래 이력 검색용)
+
+fuzz.ratio는 문자열 전체 편집거리라 "롯데백화점 본점"과 "롯데백화점잠실점", "(주)쿠팡"과 "쿠팡"처럼
+앞뒤에 지점명/법인 표기가 붙으면 점수가 떨어지고, 짧은 이름끼리는 우연히 높게 나온다.
+여기서는 normalize_party로 법인 표기/공백/구두점을 지운 뒤 문자 2~3-gram에 TF-IDF 가중치를 주고
+코사인 유사도로 이웃을 찾는다. 흔한 n-gram(지점, 점 등)은 idf가 낮아 영향이 작다.
+
+문서(고유 거래상대)는 CSR 형태 배열(indptr/indices/tf)로 저장하고, 검색할 때는 n-gram별 posting으로 뒤집은 행렬과
+쿼리 배치의 sparse 곱을 np.bincount 한 번으로 계산한다 (scipy 없이 numpy만 사용).
+새 거래상대는 n-gram 추출만 추가로 하고 idf/정규화 가중치는 다음 검색 때 배열 연산으로 다시 계산한다.
+"""
+import os
+import tempfile
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from account_history import normalize_party
+from config import SIMILARITY_QUERY_CHUNK, SIMILARITY_INDEX_PATH, SIMILARITY_NGRAM_SCORE_CUTOFF
+from similarity_index import SimilarityIndex
+
+NGRAM_SIZES = (2, 3)
+INDEX_FORMAT_VERSION = 1
+MAX_SCORE_CELLS = 4_000_000  # 쿼리 배치 x 문서 수 점수 행렬 상한 (float32 약 16MB)
+
+
+def char_ngrams(name: str) -> List[str]:
+    """정규화한 이름의 문자 n-gram (앞뒤 경계 표시 포함). 한 글자 이름도 n-gram 하나는 나오도록"""
+    key = normalize_party(name)
+    if not key:
+        return []
+    padded = f"<{key}>"
+    return [padded[i:i + size] for size in NGRAM_SIZES for i in range(len(padded) - size + 1)]
+
+
+class NgramIndex:
+    """고유 거래상대 이름의 문자 n-gram TF-IDF 벡터와 코사인 top-k 검색"""
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.name_ids: Dict[str, int] = {}
+        self.vocabulary: Dict[str, int] = {}
+        self.document_frequency = np.zeros(0, dtype=np.int64)
+        # 문서별 (n-gram id, tf) CSR
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.term_frequency = np.zeros(0, dtype=np.float32)
+        self._pending_indices: List[np.ndarray] = []
+        self._pending_tf: List[np.ndarray] = []
+        self._postings = None  # (posting_indptr, posting_documents, posting_weights) - 문서가 바뀌면 다시 계산
+        self.dirty = False  # 마지막 저장 이후 추가된 문서가 있는지
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name: str):
+        return name in self.name_ids
+
+    def add(self, names: Iterable[str]) -> int:
+        """처음 보는 이름만 추가하고 추가된 수를 반환"""
+        added = 0
+        for name in names:
+            if not name or name in self.name_ids:
+                continue
+            grams = char_ngrams(name)
+            if not grams:
+                continue
+            counts: Dict[int, int] = {}
+            for gram in grams:
+                gram_id = self.vocabulary.setdefault(gram, len(self.vocabulary))
+                counts[gram_id] = counts.get(gram_id, 0) + 1
+            self.name_ids[name] = len(self.names)
+            self.names.append(name)
+            self._pending_indices.append(np.fromiter(counts.keys(), dtype=np.int32, count=len(counts)))
+            self._pending_tf.append(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+            added += 1
+        if added:
+            self._postings = None
+            self.dirty = True
+        return added
+
+    def _flush_pending(self):
+        if not self._pending_indices:
+            return
+        lengths = np.array([len(indices) for indices in self._pending_indices], dtype=np.int64)
+        self.indptr = np.concatenate([self.indptr, self.indptr[-1] + np.cumsum(lengths)])
+        self.indices = np.concatenate([self.indices, *self._pending_indices])
+        self.term_frequency = np.concatenate([self.term_frequency, *self._pending_tf])
+        self._pending_indices.clear()
+        self._pending_tf.clear()
+        self.document_frequency = np.bincount(self.indices, minlength=len(self.vocabulary)).astype(np.int64)
+
+    def _idf(self, gram_ids: np.ndarray) -> np.ndarray:
+        """smooth idf: log((1 + N) / (1 + df)) + 1 (처음 보는 n-gram은 df=0)"""
+        frequency = np.zeros(len(gram_ids), dtype=np.float64)
+        known = gram_ids < len(self.document_frequency)
+        frequency[known] = self.document_frequency[gram_ids[known]]
+        return (np.log((1 + len(self.names)) / (1 + frequency)) + 1).astype(np.float32)
+
+    def _build_postings(self):
+        """문서 벡터를 L2 정규화한 TF-IDF로 만들고 n-gram별 posting(문서, 가중치)으로 뒤집음"""
+        self._flush_pending()
+        document_ids = np.repeat(np.arange(len(self.names), dtype=np.int32), np.diff(self.indptr))
+        weights = (1 + np.log(self.term_frequency)) * self._idf(self.indices)  # sublinear tf
+        norms = np.sqrt(np.bincount(document_ids, weights=weights.astype(np.float64) ** 2, minlength=len(self.names)))
+        weights = weights / norms[document_ids].astype(np.float32)
+
+        order = np.argsort(self.indices, kind="stable")
+        posting_indptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        posting_indptr[1:] = np.cumsum(np.bincount(self.indices, minlength=len(self.vocabulary)))
+        self._postings = (posting_indptr, document_ids[order], weights[order])
+
+    def _query_vectors(self, queries: Sequence[str]):
+        """쿼리 배치를 (쿼리 번호, n-gram id, 가중치) 배열로. 인덱스에 없는 n-gram은 노름에만 반영"""
+        query_rows, gram_ids, tf = [], [], []
+        norms = np.zeros(len(queries), dtype=np.float64)
+        for row, query in enumerate(queries):
+            counts: Dict[str, int] = {}
+            for gram in char_ngrams(query):
+                counts[gram] = counts.get(gram, 0) + 1
+            if not counts:
+                continue
+            ids = np.array([self.vocabulary.get(gram, len(self.vocabulary)) for gram in counts], dtype=np.int64)
+            weights = (1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))) * self._idf(ids)
+            norms[row] = np.sqrt(np.sum(weights.astype(np.float64) ** 2))
+            known = ids < len(self.vocabulary)
+            query_rows.append(np.full(int(known.sum()), row, dtype=np.int64))
+            gram_ids.append(ids[known])
+            tf.append(weights[known])
+        if not query_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        rows = np.concatenate(query_rows)
+        weights = np.concatenate(tf) / norms[rows].astype(np.float32)
+        return rows, np.concatenate(gram_ids), weights
+
+    def _score_chunk(self, queries: Sequence[str]) -> np.ndarray:
+        """쿼리 배치 x 문서 코사인 점수 행렬 (sparse 쿼리 행렬 x posting 행렬)"""
+        posting_indptr, posting_documents, posting_weights = self._postings
+        rows, gram_ids, weights = self._query_vectors(queries)
+        starts = posting_indptr[gram_ids]
+        lengths = posting_indptr[gram_ids + 1] - starts
+        total = int(lengths.sum())
+        scores = np.zeros(len(queries) * len(self.names), dtype=np.float64)
+        if total:
+            # posting 구간들을 이어붙인 위치: 각 구간 시작점 + 구간 안의 오프셋
+            offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+            cells = np.repeat(rows, lengths) * len(self.names) + posting_documents[offsets]
+            scores = np.bincount(cells, weights=np.repeat(weights, lengths) * posting_weights[offsets],
+                                 minlength=len(queries) * len(self.names))
+        return scores.reshape(len(queries), len(self.names)).astype(np.float32)
+
+    def mask(self, names: Iterable[str]) -> np.ndarray:
+        """주어진 이름들만 True인 문서 mask (search의 allowed 인자용)"""
+        allowed = np.zeros(len(self.names), dtype=bool)
+        ids = [self.name_ids[name] for name in names if name in self.name_ids]
+        allowed[ids] = True
+        return allowed
+
+    def search(self, queries: Sequence[str], limit: int = 10, min_score: float = 0.0,
+               allowed: Optional[np.ndarray] = None) -> Dict[str, List[Tuple[str, float]]]:
+        """쿼리별 (거래상대, 코사인 점수) 이웃을 점수 내림차순으로 최대 limit개. 같은 쿼리는 한번만 계산
+
+        allowed(mask)가 주어지면 True인 문서만 돌려준다 (limit은 필터 후 기준).
+        """
+        distinct_queries = list(dict.fromkeys(query for query in queries if query))
+        neighbours: Dict[str, List[Tuple[str, float]]] = {query: [] for query in distinct_queries}
+        if not distinct_queries or not self.names:
+            return neighbours
+        if self._postings is None:
+            self._build_postings()
+
+        chunk_size = max(1, min(SIMILARITY_QUERY_CHUNK, MAX_SCORE_CELLS // len(self.names)))
+        for start in range(0, len(distinct_queries), chunk_size):
+            chunk = distinct_queries[start:start + chunk_size]
+            scores = self._score_chunk(chunk)
+            for query, row_scores in zip(chunk, scores):
+                if allowed is not None:
+                    row_scores[~allowed] = 0
+                hit_indices = np.flatnonzero(row_scores >= max(min_score, 1e-6))
+                if len(hit_indices) > limit:
+                    top = np.argpartition(row_scores[hit_indices], -limit)[-limit:]
+                    hit_indices = hit_indices[top]
+                hit_indices = hit_indices[np.argsort(-row_scores[hit_indices], kind="stable")]
+                neighbours[query] = [(self.names[i], round(float(row_scores[i]), 4)) for i in hit_indices]
+        return neighbours
+
+    def save(self, path: str):
+        """npz로 저장 (임시 파일에 쓴 뒤 교체해서 중간에 죽어도 이전 파일이 남음)"""
+        self._flush_pending()
+        vocabulary = [""] * len(self.vocabulary)
+        for gram, gram_id in self.vocabulary.items():
+            vocabulary[gram_id] = gram
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, suffix=".npz", delete=False) as temporary:
+            np.savez_compressed(
+                temporary,
+                version=np.array(INDEX_FORMAT_VERSION),
+                ngram_sizes=np.array(NGRAM_SIZES),
+                names=np.array(self.names, dtype=str),
+                vocabulary=np.array(vocabulary, dtype=str),
+                indptr=self.indptr,
+                indices=self.indices,
+                term_frequency=self.term_frequency,
+            )
+        os.replace(temporary.name, path)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: str) -> "NgramIndex":
+        """저장된 인덱스를 읽음. 파일이 없거나 형식이 다르면 빈 인덱스"""
+        index = cls()
+        if not os.path.exists(path):
+            return index
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if int(data["version"]) != INDEX_FORMAT_VERSION or tuple(data["ngram_sizes"]) != NGRAM_SIZES:
+                    print(f"거래상대 n-gram 인덱스 형식이 달라 새로 만듭니다: {path}")
+                    return index
+                index.names = data["names"].tolist()
+                index.vocabulary = {gram: gram_id for gram_id, gram in enumerate(data["vocabulary"].tolist())}
+                index.indptr = data["indptr"]
+                index.indices = data["indices"]
+                index.term_frequency = data["term_frequency"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"거래상대 n-gram 인덱스를 읽지 못해 새로 만듭니다 ({path}): {e}")
+            return cls()
+        index.name_ids = {name: position for position, name in enumerate(index.names)}
+        index.document_frequency = np.bincount(index.indices, minlength=len(index.vocabulary)).astype(np.int64)
+        return index
+
+
+class NgramSimilarityIndex(SimilarityIndex):
+    """SimilarityIndex와 같은 인터페이스로, 이웃 검색만 n-gram TF-IDF 코사인으로 하는 인덱스
+
+    n-gram 인덱스는 프로세스/재시작 간에 공유(디스크 저장)하므로 이번 스냅샷에 없는 이름이 들어 있을 수 있어,
+    검색 결과는 이번에 add된 레코드의 거래상대로만 거른다.
+    점수는 rapidfuzz와 같은 0~100 척도로 바꾼 코사인 유사도 (score_cutoff도 같은 척도).
+    """
+
+    def __init__(self, records: Iterable = (), ngram_index: Optional[NgramIndex] = None,
+                 key: Callable = lambda record: record.거래상대):
+        self.ngram_index = ngram_index if ngram_index is not None else NgramIndex()
+        self._allowed = None
+        super().__init__(records, key=key)
+
+    def add(self, records: Iterable):
+        known = len(self.choices)
+        super().add(records)
+        self.ngram_index.add(self.choices[known:])
+        self._allowed = None
+
+    def search(self, queries: Sequence[str], score_cutoff: float = SIMILARITY_NGRAM_SCORE_CUTOFF,
+               limit: Optional[int] = None, workers: int = 1) -> Dict[str, List[Tuple[str, float]]]:
+        if self._allowed is None or len(self._allowed) != len(self.ngram_index):
+            self._allowed = self.ngram_index.mask(self.choices)
+        neighbours = self.ngram_index.search(
+            queries, limit=limit or len(self.ngram_index), min_score=score_cutoff / 100, allowed=self._allowed
+        )
+        return {
+            query: [(name, round(score * 100, 2)) for name, score in hits]
+            for query, hits in neighbours.items()
+        }
+
+
+_shared_index: Optional[NgramIndex] = None
+
+
+def shared_ngram_index(path: str = SIMILARITY_INDEX_PATH) -> NgramIndex:
+    """디스크에 저장된 거래상대 n-gram 인덱스 (프로세스에서 한 번만 읽음)"""
+    global _shared_index
+    if _shared_index is None:
+        _shared_index = NgramIndex.load(path)
+        print(f"거래상대 n-gram 인덱스 로드: {len(_shared_index)}개 ({path})")
+    return _shared_index
+
+
+def save_shared_ngram_index(path: str = SIMILARITY_INDEX_PATH):
+    """새 거래상대가 추가됐을 때만 저장"""
+    if _shared_index is not None and _shared_index.dirty:
+        _shared_index.save(path)
@@ -0,0 +1,190 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import traceback
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from config import PIPELINE_NOTIFY_CHANNEL, PIPELINE_BATCH_LINGER_SECONDS, PIPELINE_MAX_BATCH_SIZE, \
+    PIPELINE_RECONNECT_DELAY_SECONDS, PIPELINE_HISTORY_REFRESH_SECONDS
+from database import connect_listener, database_session
+from migrations import check_schema
+from run_guard import advisory_key, stage_lock
+from services import (
+    ClassificationHistory,
+    update_all_records,
+    remove_duplicate_message,
+    message_divider_run,
+    update_cancel_transactions,
+    infer_account,
+    link_receipt_to_payments,
+)
+
+
+class PipelineStage:
+    """입력 큐에서 mac_message_id를 모아 stage 함수를 실행하고, 다음 stage 큐로 넘김"""
+
+    def __init__(self, name: str, handler: Callable[[List[str]], Awaitable]):
+        self.name = name
+        self.handler = handler
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.next_stage: Optional["PipelineStage"] = None
+        self.on_done: Optional[Callable[[List[str]], None]] = None
+
+    async def _next_batch(self) -> List[str]:
+        # 첫 id가 오면 linger 동안 더 모아서 한 번에 처리 (짧은 시간에 몰린 insert를 한 배치로)
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + PIPELINE_BATCH_LINGER_SECONDS
+        while len(batch) < PIPELINE_MAX_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return list(dict.fromkeys(batch))
+
+    async def run(self):
+        while True:
+            mac_message_ids = await self._next_batch()
+            try:
+                # 주기 실행(reconciliation sweep)이나 다른 replica와 같은 stage를 동시에 처리하지 않음
+                async with stage_lock(self.name):
+                    await self.handler(mac_message_ids)
+            except Exception:
+                print(f"[pipeline:{self.name}] 처리 실패 ({len(mac_message_ids)}건)\n{traceback.format_exc()}")
+            if self.next_stage is not None:
+                for mac_message_id in mac_message_ids:
+                    self.next_stage.queue.put_nowait(mac_message_id)
+            if self.on_done is not None:
+                self.on_done(mac_message_ids)
+
+
+class StreamingPipeline:
+    """Postgres LISTEN/NOTIFY로 새 장부_결제문자 row를 받아 stage를 차례로 흘려보내는 파이프라인
+
+    NOTIFY 트리거는 migrations/versions/0007_ledger_notify_trigger.py가 설치한다.
+    """
+
+    def __init__(self, app):
+        # 분류 이력은 micro-batch마다 다시 읽지 않고 stage가 들고 있으면서 반영한 분류만 이어서 추가
+        self.classification_history = ClassificationHistory(refresh_seconds=PIPELINE_HISTORY_REFRESH_SECONDS)
+        self.stages = [
+            PipelineStage("update_all_records", update_all_records),
+            PipelineStage("remove_duplicate_message", remove_duplicate_message),
+            PipelineStage("message_divider", message_divider_run),
+            PipelineStage("update_cancel_transactions", update_cancel_transactions),
+            PipelineStage("infer_account", lambda mac_message_ids: infer_account(
+                app, mac_message_ids, history=self.classification_history
+            )),
+            PipelineStage("link_receipt_to_payments", link_receipt_to_payments),
+        ]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next_stage = next_stage
+        # infer_account(슬랙 전송)까지 끝난 시점을 insert 기준 end-to-end 지연으로 기록
+        self.stages[4].on_done = self._record_latency
+
+        self.inserted_at: Dict[str, float] = {}
+        self.latencies = deque(maxlen=1000)
+        self.received_count = 0
+        self._tasks: List[asyncio.Task] = []
+
+    def submit(self, mac_message_id: str, inserted_at: Optional[float] = None):
+        self.received_count += 1
+        self.inserted_at[mac_message_id] = inserted_at or time.time()
+        self.stages[0].queue.put_nowait(mac_message_id)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            data = json.loads(payload)
+            self.submit(data["mac_message_id"], data.get("inserted_at"))
+        except (ValueError, KeyError, TypeError):
+            # 예전 트리거처럼 id만 보내는 경우
+            self.submit(payload)
+
+    def _record_latency(self, mac_message_ids: List[str]):
+        now = time.time()
+        for mac_message_id in mac_message_ids:
+            inserted_at = self.inserted_at.pop(mac_message_id, None)
+            if inserted_at is not None:
+                self.latencies.append(now - inserted_at)
+
+    def latency_stats(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "received": self.received_count,
+            "in_flight": len(self.inserted_at),
+            "queued": {stage.name: stage.queue.qsize() for stage in self.stages},
+            "p50_latency_seconds": round(statistics.median(latencies), 2) if latencies else None,
+            "max_latency_seconds": round(latencies[-1], 2) if latencies else None,
+        }
+
+    async def listen(self):
+        """NOTIFY를 구독. 연결이 끊기면 재연결 (끊긴 동안의 row는 reconciliation sweep이 처리)
+
+        replica가 여럿이면 같은 NOTIFY를 모두 받으므로, listener advisory lock을 잡은 replica 하나만 LISTEN한다.
+        lock은 LISTEN 커넥션에 묶여 있어 이 replica가 죽거나 연결이 끊기면 다른 replica가 이어받는다.
+        """
+        waiting_for_leader = False
+        while True:
+            connection = None
+            try:
+                connection = await connect_listener()
+                if await connection.fetchval("SELECT pg_try_advisory_lock($1)", advisory_key("pipeline_listener")):
+                    waiting_for_leader = False
+                    closed = asyncio.Event()
+                    connection.add_termination_listener(lambda _: closed.set())
+                    await connection.add_listener(PIPELINE_NOTIFY_CHANNEL, self._on_notify)
+                    print(f"[pipeline] '{PIPELINE_NOTIFY_CHANNEL}' LISTEN 시작")
+                    await closed.wait()
+                    print("[pipeline] LISTEN 연결이 끊어졌습니다. 재연결합니다.")
+                elif not waiting_for_leader:
+                    print("[pipeline] 다른 replica가 LISTEN 중입니다. 대기합니다.")
+                    waiting_for_leader = True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[pipeline] LISTEN 연결 실패: {e}")
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(PIPELINE_RECONNECT_DELAY_SECONDS)
+
+    def start(self):
+        self._tasks = [asyncio.create_task(stage.run()) for stage in self.stages]
+        self._tasks.append(asyncio.create_task(self.listen()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def _listen_locally():
+    """슬랙 없이 로컬 Postgres에서 파이프라인을 돌려보는 용도"""
+    class _NoSlackApp:
+        class client:
+            @staticmethod
+            async def chat_postMessage(**kwargs):
+                print(f"[slack 생략] {kwargs.get('text')}")
+
+    await check_schema()
+    pipeline = StreamingPipeline(_NoSlackApp())
+    pipeline.start()
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f"[pipeline] {pipeline.latency_stats()}")
+    finally:
+        await pipeline.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="이벤트 기반 장부 파이프라인")
+    parser.add_argument("command", choices=["listen"])
+    parser.parse_args()
+
+    asyncio.run(_listen_locally())
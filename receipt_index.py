@@ -0,0 +1,65 @@
+import bisect
+import datetime
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+from config import RECEIPT_MATCH_WINDOW_DAYS
+
+
+def receipt_currency_code(receipt_currency) -> str:
+    """tbl_receipt.receipt_currency (0: JPY, 1: KRW) -> 통화 코드"""
+    return "JPY" if receipt_currency == 0 else "KRW"
+
+
+class ReceiptMatch(NamedTuple):
+    payment: object
+    idtbl_receipt: int
+    date_diff: int
+
+
+class ReceiptIndex:
+    """(통화, 합계금액)별로 buying_date 정렬 리스트를 만들어 결제마다 bisect로 날짜 window만 조회"""
+
+    def __init__(self, receipts: Iterable, window_days: int = RECEIPT_MATCH_WINDOW_DAYS):
+        self.window = datetime.timedelta(days=window_days)
+        buckets: Dict[Tuple[str, int], List[Tuple[datetime.date, int]]] = defaultdict(list)
+        for receipt in receipts:
+            if receipt.buying_date is None:
+                continue
+            total = (receipt.cash_receipt_price or 0) + (receipt.receipt_price or 0)
+            buckets[(receipt_currency_code(receipt.receipt_currency), total)].append(
+                (receipt.buying_date, receipt.idtbl_receipt)
+            )
+        for bucket in buckets.values():
+            bucket.sort()
+        self.buckets = dict(buckets)
+
+    def candidates(self, currency: str, amount: int, payment_date: datetime.date) -> List[Tuple[int, int]]:
+        """window 이내 영수증의 (날짜차이, idtbl_receipt) 목록"""
+        bucket = self.buckets.get((currency, amount))
+        if not bucket:
+            return []
+        start = bisect.bisect_left(bucket, (payment_date - self.window,))
+        end = bisect.bisect_right(bucket, (payment_date + self.window, float("inf")))
+        return [(abs((buying_date - payment_date).days), idtbl_receipt) for buying_date, idtbl_receipt in bucket[start:end]]
+
+    def assign(self, payments: Iterable) -> List[ReceiptMatch]:
+        """전체 (결제, 영수증) 후보를 날짜차이 순으로 정렬해 영수증/결제가 각각 한 번씩만 쓰이도록 배정"""
+        pairs = []
+        for order, payment in enumerate(payments):
+            if payment.결제시간 is None or payment.amount is None:
+                continue
+            for date_diff, idtbl_receipt in self.candidates(payment.currency, payment.amount, payment.결제시간.date()):
+                pairs.append((date_diff, order, idtbl_receipt, payment))
+
+        pairs.sort(key=lambda pair: pair[:3])
+        used_receipts = set()
+        used_payments = set()
+        matches = []
+        for date_diff, order, idtbl_receipt, payment in pairs:
+            if idtbl_receipt in used_receipts or order in used_payments:
+                continue
+            used_receipts.add(idtbl_receipt)
+            used_payments.add(order)
+            matches.append(ReceiptMatch(payment, idtbl_receipt, date_diff))
+        return matches
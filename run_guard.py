@@ -0,0 +1,215 @@
+"""주기 실행 job과 stage의 중복 실행 방지 (Postgres advisory lock)
+
+- job guard: 같은 job이 이미 (다른 replica에서라도) 실행 중이면 이번 fire는 건너뛰고,
+  최근 min_interval 안에 실행된 적이 있으면 밀린 fire로 보고 합친다(coalesce).
+- stage lock: 파이프라인과 주기 실행, 여러 replica가 같은 stage를 동시에 처리하지 않도록 stage별로 잠근다.
+- 시간 예산: job마다 deadline을 두고, 넘기면 worker pool과 stage 루프가 새 작업을 시작하지 않는다.
+  남은 row는 처리 대기 상태 그대로 남아 다음 실행에서 처리된다.
+
+advisory lock은 세션 단위라 풀 커넥션으로는 잡을 수 없으므로 프로세스당 전용 커넥션 하나에서 잡고 푼다.
+이 커넥션이 끊기면 서버가 lock을 모두 풀기 때문에 다른 replica가 바로 이어받을 수 있다.
+"""
+import asyncio
+import contextvars
+import datetime
+import functools
+import hashlib
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Set
+
+import asyncpg
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import func
+
+from config import APP_NAME, RUN_GUARD_ENABLED, RUN_LOCK_POLL_SECONDS
+from database import connect_raw, database_session
+from models import PipelineCheckpoint
+from telemetry import RUN_GUARD_EVENTS, LOCK_WAIT
+
+# 같은 프로세스 안에서 stage를 직렬화하는 lock (advisory lock은 같은 세션에서 재진입이 되므로 프로세스 안은 이걸로 막음)
+STAGE_LOCKS: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+# job 실행 기록은 pipeline_checkpoint에 이 접두어를 붙인 stage 이름으로 저장
+JOB_CHECKPOINT_PREFIX = "job:"
+
+
+def advisory_key(name: str) -> int:
+    """lock 이름을 pg_advisory_lock용 signed bigint로"""
+    digest = hashlib.blake2b(f"{APP_NAME}:{name}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class AdvisoryLocks:
+    """프로세스 전용 커넥션 하나에서 advisory lock을 잡고 푸는 헬퍼"""
+
+    def __init__(self):
+        self._connection: Optional[asyncpg.Connection] = None
+        self._io_lock = asyncio.Lock()  # asyncpg 커넥션은 동시에 한 쿼리만 실행 가능
+        self.held: Set[str] = set()
+
+    async def _get_connection(self) -> asyncpg.Connection:
+        if self._connection is None or self._connection.is_closed():
+            if self.held:
+                print(f"[run_guard] lock 커넥션이 끊겨 {sorted(self.held)} lock이 풀렸습니다")
+                self.held.clear()
+            self._connection = await connect_raw()
+        return self._connection
+
+    def holds(self, name: str) -> bool:
+        """이 프로세스가 lock을 아직 잡고 있는지 (커넥션이 끊겼으면 이미 풀린 것)"""
+        if self._connection is None or self._connection.is_closed():
+            self.held.clear()
+        return name in self.held
+
+    async def try_acquire(self, name: str) -> bool:
+        async with self._io_lock:
+            connection = await self._get_connection()
+            acquired = await connection.fetchval("SELECT pg_try_advisory_lock($1)", advisory_key(name))
+        if acquired:
+            self.held.add(name)
+        return acquired
+
+    async def acquire(self, name: str, timeout: Optional[float] = None) -> bool:
+        """lock을 얻을 때까지 polling (timeout이 지나면 False)"""
+        started = time.monotonic()
+        while True:
+            if await self.try_acquire(name):
+                LOCK_WAIT.observe(time.monotonic() - started, lock=name, outcome="acquired")
+                return True
+            if timeout is not None and time.monotonic() - started >= timeout:
+                LOCK_WAIT.observe(time.monotonic() - started, lock=name, outcome="timeout")
+                return False
+            await asyncio.sleep(RUN_LOCK_POLL_SECONDS)
+
+    async def release(self, name: str):
+        if name not in self.held:
+            return
+        self.held.discard(name)
+        async with self._io_lock:
+            if self._connection is None or self._connection.is_closed():
+                return  # 커넥션이 끊기면서 이미 풀림
+            await self._connection.fetchval("SELECT pg_advisory_unlock($1)", advisory_key(name))
+
+    async def close(self):
+        if self._connection is not None and not self._connection.is_closed():
+            await self._connection.close()
+        self._connection = None
+        self.held.clear()
+
+
+advisory_locks = AdvisoryLocks()
+
+
+class RunBudget:
+    """job 한 번의 실행 시간 예산"""
+
+    def __init__(self, job: str, seconds: Optional[float]):
+        self.job = job
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds if seconds else None
+        self.truncated: Set[str] = set()  # 예산 초과로 일부만 처리한 stage
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def exceeded(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def truncate(self, stage: str):
+        """stage가 예산 초과로 남은 작업을 다음 실행에 넘겼음을 기록 (checkpoint는 이 stage의 watermark를 옮기지 않음)"""
+        if stage not in self.truncated:
+            self.truncated.add(stage)
+            RUN_GUARD_EVENTS.inc(job=self.job, event="truncated")
+            print(f"[run_guard] {self.job}: 시간 예산({self.seconds}s) 초과로 {stage}의 남은 작업을 다음 실행으로 넘김")
+
+
+_current_budget: contextvars.ContextVar[Optional[RunBudget]] = contextvars.ContextVar("current_budget", default=None)
+
+
+def current_budget() -> Optional[RunBudget]:
+    """현재 job의 시간 예산 (job 밖, 예: streaming 파이프라인이면 None)"""
+    return _current_budget.get()
+
+
+async def _recently_ran(job: str, min_interval_seconds: float) -> bool:
+    async with database_session() as db_session:
+        record = await db_session.get(PipelineCheckpoint, JOB_CHECKPOINT_PREFIX + job)
+    if record is None or record.last_run_at is None:
+        return False
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    return (now - record.last_run_at).total_seconds() < min_interval_seconds
+
+
+async def _record_job_run(job: str, started_at: datetime.datetime, seconds: float):
+    values = {"last_run_at": started_at, "last_run_seconds": round(seconds, 3), "updated_at": func.now()}
+    async with database_session() as db_session:
+        await db_session.execute(
+            insert(PipelineCheckpoint).values(stage=JOB_CHECKPOINT_PREFIX + job, total_runs=1, **values)
+            .on_conflict_do_update(
+                index_elements=[PipelineCheckpoint.stage],
+                set_={**values, "total_runs": PipelineCheckpoint.total_runs + 1}
+            )
+        )
+        await db_session.commit()
+
+
+def guarded_job(job: str, budget_seconds: Optional[float] = None, min_interval_seconds: Optional[float] = None):
+    """scheduler job용 decorator: replica 간 단일 실행, 밀린 fire 합치기, 시간 예산"""
+    def decorator(job_func):
+        @functools.wraps(job_func)
+        async def wrapper(*args, **kwargs):
+            if not RUN_GUARD_ENABLED:
+                return await job_func(*args, **kwargs)
+
+            if not await advisory_locks.try_acquire(f"job:{job}"):
+                RUN_GUARD_EVENTS.inc(job=job, event="skipped")
+                print(f"[run_guard] {job}: 다른 실행이 진행 중이라 이번 실행은 건너뜀")
+                return None
+            try:
+                if min_interval_seconds and await _recently_ran(job, min_interval_seconds):
+                    RUN_GUARD_EVENTS.inc(job=job, event="coalesced")
+                    print(f"[run_guard] {job}: 최근 {min_interval_seconds}초 안에 실행되어 이번 실행은 건너뜀")
+                    return None
+                RUN_GUARD_EVENTS.inc(job=job, event="acquired")
+                budget = RunBudget(job, budget_seconds)
+                token = _current_budget.set(budget)
+                started_at = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+                started = time.perf_counter()
+                try:
+                    return await job_func(*args, **kwargs)
+                finally:
+                    _current_budget.reset(token)
+                    elapsed = time.perf_counter() - started
+                    if budget_seconds and elapsed > budget_seconds:
+                        # 이미 시작한 LLM 호출/stage가 끝나길 기다리느라 예산을 넘긴 경우
+                        RUN_GUARD_EVENTS.inc(job=job, event="overrun")
+                        print(f"[run_guard] {job}: 시간 예산 {budget_seconds}s를 넘겨 {elapsed:.1f}s 동안 실행됨")
+                    await _record_job_run(job, started_at, elapsed)
+            finally:
+                await advisory_locks.release(f"job:{job}")
+        return wrapper
+    return decorator
+
+
+@asynccontextmanager
+async def stage_lock(stage: str) -> AsyncIterator[bool]:
+    """stage를 프로세스 안/replica 간에 한 곳에서만 실행. 시간 예산 안에 lock을 못 얻으면 False를 yield"""
+    async with STAGE_LOCKS[stage]:
+        if not RUN_GUARD_ENABLED:
+            yield True
+            return
+        budget = current_budget()
+        timeout = budget.remaining() if budget is not None else None
+        if not await advisory_locks.acquire(f"stage:{stage}", timeout):
+            if budget is not None:
+                budget.truncate(stage)
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            await advisory_locks.release(f"stage:{stage}")
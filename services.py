@@ -1,61 +1,245 @@
 import datetime
 import asyncio
 import re
+import sys
+import time
 import traceback
-from typing import List, Tuple, Optional
-from sqlalchemy import select
+from collections import defaultdict
+from typing import List, NamedTuple, Tuple, Optional
+from sqlalchemy import select, update, values, column, or_, func, Text, literal_column
 from rapidfuzz import fuzz
-from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
-from google.genai import types
 
-from database import get_database_session
+from database import database_session
 from models import 장부_결제문자, Receipt
-from config import CARD_SENDER_LIST, BANK_SENDER_LIST, APP_NAME, USER_ID, SLACK_ERROR_LOG_CHANNEL_ID, \
-    SLACK_ACCOUNT_CHANNEL_ID, SLACK_REACT_APP_CHANNEL_ID, MAX_CONCURRENT_SESSIONS
-from agents.account_classifier import account_classifier, AccountClassificationOutput
-from agents.message_divider_agent import card_message_divider_agent, DividedMessageOutput, bank_message_divider_agent
-
-async def update_all_records():
-    """모든 장부_결제문자 레코드를 업데이트하여 장부에포함을 True로 설정하고 카드사명을 추가"""
-    db_session = await get_database_session()
-    try:
-        # 모든 레코드 조회
-        stmt = select(장부_결제문자)
-        result = await db_session.execute(stmt)
-        rows = result.scalars().all()
-        
-        for row in rows:
-            # 장부에포함을 True로 설정
-            row.장부에포함 = True
-            
-            # 발신번호를 기반으로 카드사명 설정
-            if row.발신번호 in CARD_SENDER_LIST:
-                row.발신자명 = CARD_SENDER_LIST[row.발신번호]
-
-            elif row.발신번호 in BANK_SENDER_LIST:
-                row.발신자명 = BANK_SENDER_LIST[row.발신번호]
-            else:
-                print(f"없는 번호: {row.발신번호}")
+from config import CARD_SENDER_LIST, BANK_SENDER_LIST, SLACK_ERROR_LOG_CHANNEL_ID, \
+    SLACK_ACCOUNT_CHANNEL_ID, SLACK_REACT_APP_CHANNEL_ID, SIMILAR_RECORD_TOP_K, \
+    HISTORY_FASTPATH_ENABLED, CLASSIFIER_BATCH_SIZE, DIVIDER_BATCH_SIZE, CANCEL_MATCH_WINDOW_DAYS, CANCEL_REFUND_MAX_AGE_DAYS, \
+    RECEIPT_MATCH_WINDOW_DAYS, SLACK_ACCOUNT_RESULT_DIGEST, SLACK_ACCOUNT_RESULT_DIGEST_MIN_ROWS, \
+    HISTORY_STREAM_BATCH_SIZE, SIMILARITY_BACKEND, \
+    SIMILARITY_NGRAM_SCORE_CUTOFF, SIMILARITY_RAPIDFUZZ_SCORE_CUTOFF, LOCAL_CLASSIFIER_ENABLED
+from agents.account_classifier import account_classifier, AccountClassificationOutput, \
+    account_classifier_batch_agent, AccountClassificationBatchItem
+from agents.message_divider_agent import card_message_divider_agent, DividedMessageOutput, bank_message_divider_agent, \
+    card_message_divider_batch_agent, bank_message_divider_batch_agent, DividedMessageBatchItem
+from similarity_index import SimilarityIndex
+from ngram_index import NgramSimilarityIndex, shared_ngram_index, save_shared_ngram_index
+from account_history import AccountHistoryLookup, HistoryRecord
+from message_parsers import parse_message, parser_stats
+from agent_runner import run_agent, run_batch_agent, cached_item_responses
+from worker_pool import run_worker_pool, is_rate_limit_error
+from cancel_matcher import CancelMatcher, LedgerTransaction, FULL_CANCEL, PARTIAL_CANCEL
+from receipt_index import ReceiptIndex
+from slack_outbox import enqueue_slack_messages
+from telemetry import traced_stage, record_rows
+from checkpoints import stage_checkpoint
+from merchant_resolver import assign_merchants
+from ledger_writer import LedgerWriter, ledger_write, current_dry_run
+from local_classifier import get_local_classifier
+
+def _sender_name_values():
+    """CARD_SENDER_LIST/BANK_SENDER_LIST를 (발신번호, 발신자명) VALUES 테이블로 변환"""
+    sender_map = {**CARD_SENDER_LIST, **BANK_SENDER_LIST}
+    return values(
+        column('발신번호', Text),
+        column('발신자명', Text),
+        name='sender_map'
+    ).data(list(sender_map.items()))
+
+
+def _only_ids(stmt, mac_message_ids):
+    """mac_message_ids가 주어지면 해당 row로만 제한 (이벤트 기반 파이프라인에서 새 row만 처리할 때 사용)"""
+    if mac_message_ids is None:
+        return stmt
+    return stmt.where(장부_결제문자.mac_message_id.in_(list(mac_message_ids)))
+
+
+# --- stage 조회 쿼리 (models.py의 인덱스와 짝을 이룸, benchmarks/check_query_plans.py에서 EXPLAIN으로 검사) ---
+DIVIDER_START_TIME = datetime.datetime(2025, 9, 1, 0, 0, 0)
+RECEIPT_LINK_START_TIME = datetime.datetime(2025, 10, 1, 0, 0, 0)
+UNLINKED_RECEIPT_START_TIME = datetime.datetime(2025, 10, 14, 0, 0, 0) - datetime.timedelta(hours=9)  # KST -> UTC
+
+
+def duplicate_message_query():
+    """SJ_로 시작하고 발신번호가 현대카드이며 '고*지'가 포함된 중복 수신 문자 (ix_ledger_sender_message_id)"""
+    return select(장부_결제문자).filter(
+        장부_결제문자.발신번호 == '+8215776200',
+        장부_결제문자.mac_message_id.like('SJ_%'),
+        장부_결제문자.message.like('%고*지%')
+    )
+
+
+def _columns(record_type):
+    """NamedTuple 필드 이름과 같은 장부_결제문자 컬럼들"""
+    return [getattr(장부_결제문자, field) for field in record_type._fields]
+
+
+HISTORY_CONTEXT_MIN_CONFIDENCE = 0.90
+
+
+def history_context_query():
+    """분류 컨텍스트로 쓸 확신도 높은 과거 분류, HistoryRecord 컬럼만 (ix_ledger_confident_history)"""
+    return select(*_columns(HistoryRecord)).filter(
+        장부_결제문자.transaction_type != 'N',
+        장부_결제문자.transaction_type.is_not(None),
+        장부_결제문자.confidence >= HISTORY_CONTEXT_MIN_CONFIDENCE,
+        장부_결제문자.거래상대.is_not(None)  # 거래상대가 없으면 이력 조회/유사도 검색 모두에서 쓰이지 않음
+    )
+
+
+def classify_target_query():
+    """거래목적이 없는 승인 거래 (ix_ledger_purpose_pending)"""
+    return select(장부_결제문자).filter(
+        장부_결제문자.transaction_type == '승인',
+        장부_결제문자.거래상대.is_not(None),
+        장부_결제문자.거래목적.is_(None)
+    ).order_by(장부_결제문자.결제시간.asc())
+
+
+def reclassify_target_query():
+    """backfill --reprocess용: 이미 분류된 승인도 포함 (사용자가 확정한 1.0과 취소건은 제외, ix_ledger_type_time)"""
+    return select(장부_결제문자).filter(
+        장부_결제문자.transaction_type == '승인',
+        장부_결제문자.거래상대.is_not(None),
+        장부_결제문자.거래목적.is_distinct_from('취소건'),
+        or_(장부_결제문자.confidence.is_(None), 장부_결제문자.confidence < 1.0)
+    ).order_by(장부_결제문자.결제시간.asc())
+
+
+def divider_target_query():
+    """아직 분해되지 않은 문자 (ix_ledger_divider_pending)"""
+    return select(장부_결제문자).filter(
+        장부_결제문자.transaction_type.is_(None),
+        장부_결제문자.결제시간 >= DIVIDER_START_TIME
+    ).order_by(장부_결제문자.결제시간.asc())
+
+
+def redivide_target_query():
+    """backfill --reprocess용: 이미 분해된 문자도 포함 (장부 제외 N, 취소건, 사용자가 확정한 1.0은 제외, ix_ledger_time_message_id)"""
+    return select(장부_결제문자).filter(
+        장부_결제문자.message.is_not(None),
+        장부_결제문자.transaction_type.is_distinct_from('N'),
+        장부_결제문자.거래목적.is_distinct_from('취소건'),
+        or_(장부_결제문자.confidence.is_(None), 장부_결제문자.confidence < 1.0)
+    ).order_by(장부_결제문자.결제시간.asc())
+
+
+def latest_message_time_query(prefix: str):
+    """SJ_/HJ_ 폰에서 올라온 가장 최근 문자 시간 (ix_ledger_message_prefix_time를 역순으로 한 건만 읽음)"""
+    return select(장부_결제문자.결제시간).filter(
+        func.left(장부_결제문자.mac_message_id, literal_column('3')) == f'{prefix}_'  # 인덱스 식과 같도록 3은 리터럴
+    ).order_by(장부_결제문자.결제시간.desc()).limit(1)
+
+
+def refund_target_query(since: Optional[datetime.datetime] = None):
+    """아직 매칭되지 않은 승인취소, LedgerTransaction 컬럼만 (ix_ledger_purpose_pending)"""
+    stmt = select(*_columns(LedgerTransaction)).filter(
+        장부_결제문자.transaction_type == '승인취소',
+        장부_결제문자.거래목적.is_(None)
+    )
+    if since is not None:
+        stmt = stmt.filter(장부_결제문자.결제시간 >= since)
+    return stmt
+
+
+def approval_window_query(start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None):
+    """기간 안의, 아직 취소건으로 쓰이지 않은 승인 거래, LedgerTransaction 컬럼만 (ix_ledger_type_time)"""
+    stmt = select(*_columns(LedgerTransaction)).filter(
+        장부_결제문자.transaction_type == '승인',
+        장부_결제문자.거래목적.is_distinct_from('취소건')
+    )
+    if start is not None and end is not None:
+        stmt = stmt.filter(장부_결제문자.결제시간 >= start, 장부_결제문자.결제시간 <= end)
+    return stmt
+
+
+def unlinked_purchase_query(start_time: datetime.datetime):
+    """Receipt와 연결되지 않은 판매용상품 결제 (ix_ledger_receipt_pending)"""
+    return select(장부_결제문자).filter(
+        장부_결제문자.거래목적 == '판매용상품',
+        장부_결제문자.idtbl_receipt.is_(None),
+        장부_결제문자.결제시간 >= start_time
+    ).order_by(장부_결제문자.결제시간)
+
+
+async def stream_records(db_session, stmt, record_type) -> list:
+    """컬럼만 select한 쿼리를 서버측 커서로 HISTORY_STREAM_BATCH_SIZE건씩 읽어 record_type 목록으로 반환
+
+    같은 거래상대/계정과목 문자열이 수천 번 반복되므로 intern해서 하나의 객체를 공유한다.
+    """
+    records = []
+    result = await db_session.stream(stmt.execution_options(yield_per=HISTORY_STREAM_BATCH_SIZE))
+    async for partition in result.partitions():
+        records.extend(
+            record_type._make(sys.intern(value) if isinstance(value, str) else value for value in row)
+            for row in partition
+        )
+    return records
+
+
+def receipt_window_query(start: datetime.date, end: datetime.date):
+    """기간 안의 Receipt를 매칭에 필요한 컬럼만 조회 (ix_receipt_buying_date)"""
+    return select(
+        Receipt.idtbl_receipt,
+        Receipt.receipt_currency,
+        Receipt.receipt_price,
+        Receipt.cash_receipt_price,
+        Receipt.buying_date
+    ).filter(
+        Receipt.buying_date >= start,
+        Receipt.buying_date <= end
+    )
+
+
+@traced_stage("update_all_records")
+async def update_all_records(mac_message_ids=None):
+    """장부에포함/발신자명이 아직 반영되지 않은 레코드만 서버측 UPDATE로 갱신
+
+    대상 조건 자체가 미반영 row라(ix_ledger_not_included, ix_ledger_sender_name_missing) watermark를 쓰지 않는다.
+    이미 발신자명이 있는 row는 설정에서 이름을 바꿔도 다시 쓰지 않는다.
+    """
+    async with database_session() as db_session:
+        sender_map = _sender_name_values()
+
+        # 1) 알려진 발신번호: 발신자명과 장부에포함을 VALUES 조인으로 한번에 설정 (미반영 row만)
+        known_stmt = update(장부_결제문자).where(
+            장부_결제문자.발신번호 == sender_map.c.발신번호,
+            or_(
+                장부_결제문자.장부에포함.is_not(True),
+                장부_결제문자.발신자명.is_(None)
+            )
+        ).values(
+            장부에포함=True,
+            발신자명=sender_map.c.발신자명
+        ).execution_options(synchronize_session=False)
+        known_result = await db_session.execute(_only_ids(known_stmt, mac_message_ids))
+
+        # 2) 나머지(모르는 발신번호)는 장부에포함만 설정하고, 새로 포함된 번호를 집계
+        unknown_update = _only_ids(update(장부_결제문자).where(
+            장부_결제문자.장부에포함.is_not(True)
+        ), mac_message_ids).values(
+            장부에포함=True
+        ).returning(장부_결제문자.발신번호).cte('newly_included')
+        unknown_stmt = select(
+            unknown_update.c.발신번호,
+            func.count().label('count')
+        ).group_by(unknown_update.c.발신번호)
+        unknown_rows = (await db_session.execute(unknown_stmt)).all()
 
-        # 모든 변경사항 커밋
         await db_session.commit()
-        
-    finally:
-        await db_session.close()
+        record_rows(rows_out=known_result.rowcount + sum(row.count for row in unknown_rows))
 
-async def remove_duplicate_message():
+        print(f"발신자명 업데이트: {known_result.rowcount}건, "
+              f"모르는 번호로 장부에 포함: {sum(row.count for row in unknown_rows)}건")
+        for row in unknown_rows:
+            print(f"없는 번호: {row.발신번호} ({row.count}건)")
+
+@traced_stage("remove_duplicate_message")
+async def remove_duplicate_message(mac_message_ids=None):
     """SJ_로 시작하고 발신번호가 현대카드이며 '고*지'가 포함된 메시지들의 transaction_type을 N으로 업데이트"""
-    db_session = await get_database_session()
-    try:
-        # SJ_로 시작하고, 발신번호가 '+8215776200'이며, '고*지'가 포함된 레코드 조회
-        stmt = select(장부_결제문자).filter(
-            장부_결제문자.mac_message_id.like('SJ_%'),
-            장부_결제문자.발신번호 == '+8215776200',
-            장부_결제문자.message.like('%고*지%')
-        )
-        
-        result = await db_session.execute(stmt)
+    async with stage_checkpoint("remove_duplicate_message", mac_message_ids) as checkpoint, \
+            database_session() as db_session:
+        # SJ_로 시작하고, 발신번호가 '+8215776200'이며, '고*지'가 포함된 레코드 중 watermark 이후만 조회
+        result = await db_session.execute(_only_ids(checkpoint.filter(duplicate_message_query()), mac_message_ids))
         rows = result.scalars().all()
         
         # transaction_type을 'N'으로 업데이트
@@ -66,8 +250,7 @@ async def remove_duplicate_message():
         
         # 모든 변경사항 커밋
         await db_session.commit()
-    finally:
-        await db_session.close()
+        record_rows(rows_in=len(rows), rows_out=updated_count)
 
 async def preprocess_message(_message):
     new_message = _message
@@ -89,171 +272,327 @@ def similarity(a, b):
     """두 문자열의 유사도 계산"""
     return fuzz.ratio(a, b)
 
-async def infer_account(_app):
-    """거래목적이 없는 승인 레코드들 처리하기"""
-    db_session = await get_database_session()
-    try:
-        # 먼저 transaction_type이 N이 아니고 None도 아니며 confidence가 0.95 이상인 레코드 조회 (컨텍스트 용도)
-        all_records_stmt = select(장부_결제문자).filter(
-            장부_결제문자.transaction_type != 'N',
-            장부_결제문자.transaction_type.is_not(None),
-            장부_결제문자.confidence >= 0.90
-        )
-        all_records_result = await db_session.execute(all_records_stmt)
-        all_records = all_records_result.scalars().all()
-        
+def classification_values(output: AccountClassificationOutput) -> dict:
+    """분류 결과를 장부_결제문자 컬럼 값으로"""
+    return {
+        "거래목적": output.business_purpose,
+        "계정과목_대": output.main_category,
+        "계정과목_소": output.sub_category,
+        "account_reason": output.reason,
+        "confidence": output.confidence,
+    }
+
+
+class ClassifiedTransaction(NamedTuple):
+    """DB 반영이 확인된 분류 결과 (슬랙 결과 메시지용)"""
+    mac_message_id: str
+    결제시간: Optional[datetime.datetime]
+    발신자명: Optional[str]
+    거래상대: Optional[str]
+    amount: Optional[int]
+    currency: Optional[str]
+    거래목적: Optional[str]
+    계정과목_대: Optional[str]
+    계정과목_소: Optional[str]
+
+
+def classified_transaction(row, new_values: dict) -> ClassifiedTransaction:
+    return ClassifiedTransaction._make(
+        new_values[field] if field in new_values else getattr(row, field) for field in ClassifiedTransaction._fields
+    )
+
+class ClassificationHistory:
+    """infer_account의 분류 컨텍스트: 확신도 높은 과거 분류로 만든 이력 조회, 유사도 인덱스, 가맹점별 이력
+
+    주기 실행은 호출마다 새로 만든다. 스트리밍 파이프라인은 infer_account stage에 하나를 두고 micro-batch마다
+    writer가 반영한 분류만 add해서 이어 쓰고, 슬랙 수정처럼 다른 경로로 바뀐 이력은 refresh_seconds마다 다시 읽어 반영한다.
+    """
+
+    def __init__(self, refresh_seconds: Optional[float] = None):
+        self.refresh_seconds = refresh_seconds
+        self.loaded_at: Optional[float] = None
+        self.history_lookup: Optional[AccountHistoryLookup] = None
+        self.similarity_index: Optional[SimilarityIndex] = None
+        self.similarity_cutoff = SIMILARITY_RAPIDFUZZ_SCORE_CUTOFF
+        self.labelled_by_merchant = defaultdict(list)
+
+    @property
+    def stale(self) -> bool:
+        if self.loaded_at is None:
+            return True
+        return self.refresh_seconds is not None and time.monotonic() - self.loaded_at >= self.refresh_seconds
+
+    async def load(self, db_session, exclude_ids=None):
+        """과거 분류 이력을 스트리밍으로 읽어 새로 만듦 (exclude_ids는 다시 분류할 row라 근거에서 제외)"""
+        history_stmt = history_context_query()
+        if exclude_ids is not None:
+            history_stmt = history_stmt.where(장부_결제문자.mac_message_id.not_in(list(exclude_ids)))
+        records = await stream_records(db_session, history_stmt, HistoryRecord)
+
+        self.history_lookup = AccountHistoryLookup(records) if HISTORY_FASTPATH_ENABLED else None
+        self.labelled_by_merchant = defaultdict(list)
+        if SIMILARITY_BACKEND == 'ngram':
+            # 디스크에 저장된 n-gram 인덱스에 새 거래상대만 추가하고, 추가된 게 있으면 다시 저장
+            self.similarity_index = NgramSimilarityIndex(ngram_index=shared_ngram_index())
+            self.similarity_cutoff = SIMILARITY_NGRAM_SCORE_CUTOFF
+        else:
+            self.similarity_index = SimilarityIndex()
+            self.similarity_cutoff = SIMILARITY_RAPIDFUZZ_SCORE_CUTOFF
+        await self._add_labelled(records)
+        self.loaded_at = time.monotonic()
+        print(f"분류 이력 로드: {len(records)}건")
+
+    async def add(self, records: List[HistoryRecord]):
+        """새로 반영된 분류를 이어서 추가 (history_context_query와 같은 조건만)"""
+        records = [
+            record for record in records
+            if record.거래상대 and (record.confidence or 0) >= HISTORY_CONTEXT_MIN_CONFIDENCE
+        ]
+        if not records or self.loaded_at is None:
+            return
+        if self.history_lookup is not None:
+            self.history_lookup.add(records)
+        await self._add_labelled(records)
+
+    async def _add_labelled(self, records):
+        # 거래목적, 계정과목 정보가 있는 레코드만 유사도 인덱스와 가맹점별 이력에
+        labelled_records = [
+            record for record in records
+            if record.거래목적 or record.계정과목_대 or record.계정과목_소 or record.account_reason
+        ]
+        # merchant_id가 있는 row는 문자열 유사도 대신 같은 가맹점의 이력을 컨텍스트로 씀
+        for record in labelled_records:
+            if record.merchant_id is not None:
+                self.labelled_by_merchant[record.merchant_id].append(record)
+        self.similarity_index.add(labelled_records)
+        if SIMILARITY_BACKEND == 'ngram':
+            await asyncio.to_thread(save_shared_ngram_index)
+
+
+def history_record(row, new_values: dict) -> HistoryRecord:
+    return HistoryRecord._make(
+        new_values[field] if field in new_values else getattr(row, field) for field in HistoryRecord._fields
+    )
+
+
+@traced_stage("infer_account")
+async def infer_account(_app, mac_message_ids=None, reprocess=False, notify=True,
+                        history: Optional[ClassificationHistory] = None):
+    """거래목적이 없는 승인 레코드들 처리하기
+
+    reprocess(backfill)면 mac_message_ids의 이미 분류된 승인도 다시 분류하고, notify가 False면 슬랙으로 보내지 않는다.
+    history를 넘기면(스트리밍 파이프라인) 과거 분류 이력을 매번 다시 읽지 않고 이어 쓴다.
+    """
+    async with database_session() as db_session:
         # 처리할 대상 레코드들 조회 (거래목적이 없는 승인 레코드)
-        target_stmt = select(장부_결제문자).filter(
-            장부_결제문자.transaction_type.in_(['승인']),
-            장부_결제문자.거래상대.is_not(None),
-            장부_결제문자.거래목적.is_(None)
-        ).order_by(장부_결제문자.결제시간.asc())
-        
-        target_result = await db_session.execute(target_stmt)
+        target_stmt = reclassify_target_query() if reprocess else classify_target_query()
+        target_result = await db_session.execute(_only_ids(target_stmt, mac_message_ids))
         target_rows = target_result.scalars().all()
+        record_rows(rows_in=len(target_rows))
+        if not target_rows:
+            print("분류할 승인 거래가 없습니다.")
+            return
 
-        session_count = 0
+        # 확신도 높은 과거 분류 이력 (컨텍스트 용도)
+        if history is None or reprocess:
+            history = ClassificationHistory()
+        if history.stale:
+            # 다시 분류할 row의 이전 분류가 자기 자신의 근거가 되지 않도록 제외
+            await history.load(db_session, exclude_ids=mac_message_ids if reprocess else None)
+
+        # 과거 확정 이력이 충분히 일치하는 거래상대는 LLM 없이 이력으로 바로 분류
+        rows_by_id = {row.mac_message_id: row for row in target_rows}
+        fast_path_writes = []  # LLM 없이 분류한 결과 (이력, 로컬 분류기)
+        if history.history_lookup is not None:
+            llm_target_rows = []
+            for row in target_rows:
+                history_output = history.history_lookup.lookup(row.거래상대, row.merchant_id)
+                if history_output is None:
+                    llm_target_rows.append(row)
+                    continue
+                fast_path_writes.append(ledger_write(row, classification_values(history_output)))
+            print(f"이력 기반 분류: {len(fast_path_writes)}/{len(target_rows)}건 "
+                  f"(적중률 {len(fast_path_writes) / len(target_rows):.1%}), LLM 분류 대상: {len(llm_target_rows)}건")
+            target_rows = llm_target_rows
+
+        # 로컬 분류기가 보정된 확률로 충분히 확신하는 row도 LLM 없이 분류 (모델 파일이 없으면 건너뜀)
+        local_classifier = get_local_classifier() if LOCAL_CLASSIFIER_ENABLED and target_rows else None
+        if local_classifier is not None:
+            llm_target_rows = []
+            for row in target_rows:
+                local_output = local_classifier.classify(row)
+                if local_output is None:
+                    llm_target_rows.append(row)
+                    continue
+                fast_path_writes.append(ledger_write(row, classification_values(local_output)))
+            resolved = len(target_rows) - len(llm_target_rows)
+            print(f"로컬 분류기: {resolved}/{len(target_rows)}건 "
+                  f"(이번 처리율 {resolved / len(target_rows):.1%}, 누적 {local_classifier.local_fraction:.1%}), "
+                  f"LLM 분류 대상: {len(llm_target_rows)}건")
+            target_rows = llm_target_rows
+
+        # 모든 대상의 이웃을 한번에 계산 (merchant_id가 있는 row는 가맹점별 이력을 씀)
+        similarity_index = history.similarity_index
+        similarity_cutoff = history.similarity_cutoff
+        labelled_by_merchant = history.labelled_by_merchant
+        similar_records_by_party = similarity_index.similar_records(
+            [row.거래상대 for row in target_rows if row.merchant_id is None],
+            score_cutoff=similarity_cutoff, limit=SIMILAR_RECORD_TOP_K
+        )
 
-        async def process_single_row(row, session_id_suffix):
-            """단일 row 처리 함수 - 슬랙 전송 없이 DB 업데이트만"""
-            # 각 작업마다 독립적인 데이터베이스 세션 생성
-            local_db_session = await get_database_session()
-            
+        def build_classifier_prompt(row):
+            """거래상대/금액과 유사 거래 이력으로 분류 에이전트 프롬프트 구성"""
+            # 같은 가맹점의 이력, merchant_id가 없으면 현재 row의 거래상대와 비슷한 거래상대들 (미리 일괄 계산된 결과 사용)
+            current_party = row.거래상대
+            if row.merchant_id is not None:
+                similar_records = labelled_by_merchant.get(row.merchant_id, [])
+            else:
+                similar_records = similar_records_by_party.get(current_party)
+            if similar_records is None:
+                similar_records = similarity_index.similar_records(
+                    [current_party], score_cutoff=similarity_cutoff, limit=SIMILAR_RECORD_TOP_K
+                ).get(current_party, [])
+
+            # agent에 넘길 컨텍스트 정보 구성 (거래목적, 계정과목_대, 계정과목_소가 유니크하며 confidence가 가장 높은 것만)
+            combination_best = {}
+
+            for similar in similar_records:
+                # 거래목적, 계정과목_대, 계정과목_소 조합을 키로 사용
+                combination_key = (similar.거래목적, similar.계정과목_대, similar.계정과목_소)
+
+                # 해당 조합이 처음이거나, 더 높은 confidence를 가진 경우 업데이트
+                if (combination_key not in combination_best or
+                    (similar.confidence and similar.confidence > (combination_best[combination_key]["confidence"] or 0))):
+                    combination_best[combination_key] = {
+                        "거래상대": similar.거래상대,
+                        "거래목적": similar.거래목적,
+                        "계정과목_대": similar.계정과목_대,
+                        "계정과목_소": similar.계정과목_소,
+                        "account_reason": similar.account_reason,
+                        "confidence": similar.confidence
+                    }
+
+            # confidence 순으로 정렬하여 context_info 구성
+            context_info = sorted(combination_best.values(),
+                                  key=lambda x: x["confidence"] or 0, reverse=True)
+
+            # 컨텍스트 정보와 함께 메시지 구성
+            party_str = f"거래상대: {row.거래상대}, 금액: {row.amount}{row.currency}"
+            if context_info:
+                party_str += f"\n\n유사한 거래 이력:\n"
+                for i, ctx in enumerate(context_info[:30]):  # 최대 30개까지만
+                    party_str += f"{i+1}. 거래상대: {ctx['거래상대']}, 거래목적: {ctx['거래목적']}, 계정과목(대): {ctx['계정과목_대']}, 계정과목(소): {ctx['계정과목_소']}, 사유: {ctx['account_reason']}\n"
+            return party_str
+
+        async def process_single_row(row):
+            """단일 row를 분류해서 LedgerWrite로 반환 (DB 반영은 writer가 모아서)"""
             try:
-                # 현재 처리할 row를 새 세션에서 다시 조회
-                local_row_stmt = select(장부_결제문자).filter(
-                    장부_결제문자.mac_message_id == row.mac_message_id
-                )
-                local_row_result = await local_db_session.execute(local_row_stmt)
-                local_row = local_row_result.scalars().first()
-                
-                if not local_row:
+                final_response_text = await run_agent(account_classifier, build_classifier_prompt(row))
+                if not final_response_text:
                     return None
-                
-                # 현재 row의 거래상대와 비슷한 거래상대들을 모든 레코드에서 찾기
-                similar_records = []
-                current_party = local_row.거래상대
-
-                for record in all_records:
-                    similarity_score = similarity(current_party, record.거래상대)
-                    if record.거래상대 and similarity_score > 70:  # 80% 이상 유사
-                        # 거래목적, 계정과목 정보가 있는 경우만 추가
-                        if (record.거래목적 or record.계정과목_대 or record.계정과목_소 or record.account_reason):
-                            similar_records.append(record)
-                
-                # agent에 넘길 컨텍스트 정보 구성 (거래목적, 계정과목_대, 계정과목_소가 유니크하며 confidence가 가장 높은 것만)
-                combination_best = {}
-                
-                for similar in similar_records:
-                    # 거래목적, 계정과목_대, 계정과목_소 조합을 키로 사용
-                    combination_key = (similar.거래목적, similar.계정과목_대, similar.계정과목_소)
-                    
-                    # 해당 조합이 처음이거나, 더 높은 confidence를 가진 경우 업데이트
-                    if (combination_key not in combination_best or 
-                        (similar.confidence and similar.confidence > (combination_best[combination_key]["confidence"] or 0))):
-                        combination_best[combination_key] = {
-                            "거래상대": similar.거래상대,
-                            "거래목적": similar.거래목적,
-                            "계정과목_대": similar.계정과목_대,
-                            "계정과목_소": similar.계정과목_소,
-                            "account_reason": similar.account_reason,
-                            "confidence": similar.confidence
-                        }
-                
-                # confidence 순으로 정렬하여 context_info 구성
-                context_info = sorted(combination_best.values(), 
-                                    key=lambda x: x["confidence"] or 0, reverse=True)
-                
-                SESSION_ID = f"session_{session_id_suffix}"
-                adk_session_service = InMemorySessionService()
-                adk_session = await adk_session_service.create_session(app_name=APP_NAME, user_id=USER_ID,
-                                                                       session_id=SESSION_ID)
-
-                runner = Runner(
-                    agent=account_classifier,
-                    app_name=APP_NAME,
-                    session_service=adk_session_service
-                )
-                
-                # 컨텍스트 정보와 함께 메시지 구성
-                party_str = f"거래상대: {local_row.거래상대}, 금액: {local_row.amount}{local_row.currency}"
-                if context_info:
-                    party_str += f"\n\n유사한 거래 이력:\n"
-                    for i, ctx in enumerate(context_info[:30]):  # 최대 30개까지만
-                        party_str += f"{i+1}. 거래상대: {ctx['거래상대']}, 거래목적: {ctx['거래목적']}, 계정과목(대): {ctx['계정과목_대']}, 계정과목(소): {ctx['계정과목_소']}, 사유: {ctx['account_reason']}\n"
-                
-                content = types.Content(role='user', parts=[types.Part(text=party_str)])
-                final_response_text = None
-                async for event in runner.run_async(user_id=USER_ID, session_id=SESSION_ID,
-                                                    new_message=content):
-                    if event.is_final_response():
-                        if event.content and event.content.parts:
-                            final_response_text = event.content.parts[0].text
-                        elif event.actions and event.actions.escalate:
-                            final_response_text = f"Agent escalated: {event.error_message or 'No specific message.'}"
-
-                if final_response_text:
-                    account_classification_output = AccountClassificationOutput.model_validate_json(final_response_text)
-                    
-                    # DB 업데이트만 수행 (슬랙 전송은 별도 처리)
-                    local_row.거래목적 = account_classification_output.business_purpose
-                    local_row.계정과목_대 = account_classification_output.main_category
-                    local_row.계정과목_소 = account_classification_output.sub_category
-                    local_row.account_reason = account_classification_output.reason
-                    local_row.confidence = account_classification_output.confidence
-                    await local_db_session.commit()
-                
-                return local_row
-                
+                account_classification_output = AccountClassificationOutput.model_validate_json(final_response_text)
+                return ledger_write(row, classification_values(account_classification_output))
             except Exception as e:
+                if is_rate_limit_error(e):
+                    raise  # worker pool이 동시성을 줄이고 재시도
                 print(f"에러 발생: {e}")
-                await local_db_session.rollback()
                 return None
-            finally:
-                await local_db_session.close()
-
-        # 10개 단위로 배치 처리
-        batch_size = 5
-        total_processed = 0
-        processed_results = []  # 처리된 결과들을 저장할 리스트
-        
-        for i in range(0, len(target_rows), batch_size):
-            batch = target_rows[i:i + batch_size]
-            print(f"\n배치 {i//batch_size + 1} 처리 중... ({len(batch)}개 레코드)")
-            
-            # 배치 내 작업들을 병렬로 실행
-            tasks = []
-            for j, row in enumerate(batch):
-                session_id = f"{total_processed + j}"
-                tasks.append(process_single_row(row, session_id))
-            
-            # 배치 단위로 병렬 실행
-            batch_results = await asyncio.gather(*tasks)
-            
-            # 성공적으로 처리된 결과만 수집
-            for result in batch_results:
-                if result and result.거래목적:  # 처리가 성공하고 거래목적이 설정된 경우만
-                    processed_results.append(result)
-            
-            total_processed += len(batch)
-            print(f"배치 완료. 총 {total_processed}개 처리됨")
 
+        async def process_row_batch(batch_rows, prompts):
+            """여러 row를 한 번의 LLM 호출로 분류하고 (LedgerWrite 목록, 검증 실패 row 목록)을 반환"""
+            outputs = await run_batch_agent(
+                account_classifier_batch_agent, account_classifier,
+                [(row.mac_message_id, prompts[row.mac_message_id]) for row in batch_rows], AccountClassificationBatchItem
+            )
+            writes = [ledger_write(row, classification_values(outputs[row.mac_message_id]))
+                      for row in batch_rows if row.mac_message_id in outputs]
+            failed_rows = [row for row in batch_rows if row.mac_message_id not in outputs]
+            return writes, failed_rows
+
+        # 분류 결과는 worker들이 돌려준 LedgerWrite를 writer 하나가 chunk 단위로 반영
+        # (조회 이후 슬랙 수정 등으로 바뀐 row는 덮어쓰지 않음)
+        all_writes = list(fast_path_writes)
+        async with LedgerWriter("infer_account") as writer:
+            await writer.add(fast_path_writes)
+
+            # 배치 모드: 항목별로 캐시를 먼저 보고, 나머지를 K건씩 한 번에 분류한 뒤 검증에 실패한 row만 단건 처리로 다시 보냄
+            if CLASSIFIER_BATCH_SIZE > 1 and len(target_rows) > 1:
+                prompts = {row.mac_message_id: build_classifier_prompt(row) for row in target_rows}
+                cached = await cached_item_responses(
+                    [(mac_message_id, account_classifier, prompt) for mac_message_id, prompt in prompts.items()]
+                )
+                cached_writes = [
+                    ledger_write(row, classification_values(
+                        AccountClassificationOutput.model_validate_json(cached[row.mac_message_id])
+                    ))
+                    for row in target_rows if row.mac_message_id in cached
+                ]
+                all_writes.extend(cached_writes)
+                await writer.add(cached_writes)
+                target_rows = [row for row in target_rows if row.mac_message_id not in cached]
+                print(f"분류 캐시 적중: {len(cached_writes)}건, LLM 분류 대상: {len(target_rows)}건")
+
+                batches = [target_rows[i:i + CLASSIFIER_BATCH_SIZE]
+                           for i in range(0, len(target_rows), CLASSIFIER_BATCH_SIZE)]
+                batch_results, batch_stats = await run_worker_pool(
+                    'infer_account', batches,
+                    lambda batch_rows, index: process_row_batch(batch_rows, prompts)
+                )
+                retry_rows = []
+                for batch_rows, batch_result in zip(batches, batch_results):
+                    if batch_result is None:
+                        retry_rows.extend(batch_rows)
+                        continue
+                    batch_writes, failed_rows = batch_result
+                    all_writes.extend(batch_writes)
+                    await writer.add(batch_writes)
+                    retry_rows.extend(failed_rows)
+                print(f"배치 분류: {len(target_rows) - len(retry_rows)}/{len(target_rows)}건 성공, "
+                      f"단건 재처리 {len(retry_rows)}건, 통계: {batch_stats.summary()}")
+                target_rows = retry_rows
+
+            # 동시 실행 수를 조절하는 worker pool로 처리 (느린 호출 하나가 다른 작업을 막지 않음)
+            pool_results, pool_stats = await run_worker_pool(
+                'infer_account', target_rows,
+                lambda row, index: process_single_row(row)
+            )
+            single_writes = [write for write in pool_results if write is not None]
+            all_writes.extend(single_writes)
+            await writer.add(single_writes)
+            print(f"분류 worker pool 통계: {pool_stats.summary()}")
+
+        # 반영된 분류는 다음 micro-batch의 이력으로 이어서 씀 (dry-run이면 DB에 없으므로 추가하지 않음)
+        if current_dry_run() is None:
+            await history.add([
+                history_record(rows_by_id[write.mac_message_id], write.values)
+                for write in all_writes if write.mac_message_id in writer.applied
+            ])
+
+        # 실제로 반영된 결과만 슬랙으로 (거래목적이 설정된 경우만)
+        processed_results = [
+            classified_transaction(rows_by_id[write.mac_message_id], write.values)
+            for write in all_writes
+            if write.mac_message_id in writer.applied and write.values.get("거래목적")
+        ]
+        record_rows(rows_out=len(processed_results))
         # 모든 처리 완료 후, 처리된 결과만 시간순으로 슬랙 전송
-        if processed_results:
+        if not notify or current_dry_run() is not None:
+            print(f"분류 결과 {len(processed_results)}건은 슬랙으로 보내지 않습니다.")
+        elif processed_results:
             print(f"처리 완료. {len(processed_results)}개 결과를 시간순으로 슬랙 전송 시작...")
             await send_processed_results_to_slack(_app, processed_results)
         else:
             print("처리된 결과가 없습니다.")
             
-    finally:
-        await db_session.close()
 
 async def send_processed_results_to_slack(_app, processed_results):
-    """처리된 결과를 시간순으로 슬랙에 전송"""
+    """처리된 결과를 시간순으로 슬랙 outbox에 적재 (전송은 SlackOutboxSender가 담당)"""
     # 처리된 결과들을 결제시간 순으로 정렬
     sorted_results = sorted(processed_results, key=lambda x: x.결제시간 or datetime.datetime.min)
-    
-    sent_count = 0
+    # 결과가 많으면 digest로 묶어 채널 rate limit(초당 1건)에 막히지 않게 함, 적으면 건별 스레드로 수정 요청을 받음
+    digest = SLACK_ACCOUNT_RESULT_DIGEST and len(sorted_results) >= SLACK_ACCOUNT_RESULT_DIGEST_MIN_ROWS
+
+    messages = []
     for row in sorted_results:
         # KST 기준으로 날짜 포맷팅
         if row.결제시간:
@@ -263,155 +602,188 @@ async def send_processed_results_to_slack(_app, processed_results):
             date_str = "미확인"
             
         slack_message = f"""{date_str} | {row.발신자명} | {row.거래상대} | {row.amount:,}{row.currency} → `{row.거래목적}` > `{row.계정과목_대}` > `{row.계정과목_소}` | 아이디: {row.mac_message_id}"""
-        
-        try:
-            await _app.client.chat_postMessage(
-                channel=SLACK_ACCOUNT_CHANNEL_ID,
-                text=slack_message
-            )
-            sent_count += 1
-            # 슬랙 API 부하 방지를 위한 짧은 딜레이
-            await asyncio.sleep(0.1)
-        except Exception as e:
-            print(f"Slack 메시지 전송 실패: {e}")
-    
-    print(f"시간순으로 {sent_count}개의 처리 결과를 슬랙으로 전송했습니다.")
-
-async def message_divider_run():
-    db_session = await get_database_session()
-    try:
-        # 2025-09-01 00:00:00 (KST 기준으로 저장된 시간)
-        filter_date = datetime.datetime(2025, 9, 1, 0, 0, 0)
-
-        stmt = select(장부_결제문자).filter(
-            장부_결제문자.transaction_type.is_(None),
-            장부_결제문자.결제시간 >= filter_date
-        ).order_by(장부_결제문자.결제시간.asc())
-
-        result = await db_session.execute(stmt)
+        messages.append({
+            "channel": SLACK_ACCOUNT_CHANNEL_ID,
+            "text": slack_message,
+            "kind": "account_result",
+            "digest": digest,
+        })
+
+    await enqueue_slack_messages(messages)
+    print(f"시간순으로 {len(messages)}개의 처리 결과를 슬랙 outbox에 적재했습니다.")
+
+def division_values(divided_message: DividedMessageOutput) -> dict:
+    """문자 분해 결과를 장부_결제문자 컬럼 값으로"""
+    return {
+        "transaction_type": divided_message.transaction_type,
+        "amount": divided_message.amount,
+        "currency": divided_message.currency,
+        "거래상대": divided_message.transaction_party,
+    }
+
+
+# 다시 분해해서 거래상대/금액이 바뀌면 이전 값으로 붙인 가맹점과 분류는 버리고 다시 배정/분류되게 함
+DIVISION_DEPENDENT_VALUES = {
+    "merchant_id": None,
+    "거래목적": None,
+    "계정과목_대": None,
+    "계정과목_소": None,
+    "account_reason": None,
+    "confidence": None,
+}
+
+
+def redivision_values(row, divided_message: DividedMessageOutput) -> dict:
+    """reprocess용 division_values: 분해 결과가 기존 값과 다르면 가맹점/분류 컬럼도 비움"""
+    new_values = division_values(divided_message)
+    if any(new_values[name] != getattr(row, name) for name in new_values):
+        new_values.update(DIVISION_DEPENDENT_VALUES)
+    return new_values
+
+@traced_stage("message_divider")
+async def message_divider_run(mac_message_ids=None, reprocess=False):
+    async with database_session() as db_session:
+        # 2025-09-01 00:00:00 이후 아직 분해되지 않은 문자 (reprocess면 지정한 row 전부)
+        # 대상 조건 자체가 미처리 row라 watermark를 쓰지 않음 (실패한 row는 오래되어도 다음 실행에서 다시 봄)
+        target_stmt = redivide_target_query() if reprocess else divider_target_query()
+        result = await db_session.execute(_only_ids(target_stmt, mac_message_ids))
         rows = result.scalars().all()
 
-        async def process_single_message(row, session_id_suffix):
-            """단일 메시지 처리 함수 - 독립적인 DB 세션 사용"""
-            local_db_session = await get_database_session()
+        def divided_write(row, divided_message):
+            if reprocess:
+                return ledger_write(row, redivision_values(row, divided_message))
+            return ledger_write(row, division_values(divided_message))
 
+        # 발신사별 문자 템플릿으로 먼저 분해하고, 맞는 템플릿이 없는 문자만 LLM으로 처리
+        llm_rows = []
+        parser_writes = []
+        for row in rows:
+            divided_message = parse_message(row.발신번호, row.message)
+            if divided_message is None:
+                llm_rows.append(row)
+                continue
+            parser_writes.append(divided_write(row, divided_message))
+        total_count = len(llm_rows)
+
+        async def process_single_message(row):
+            """단일 메시지를 분해해서 LedgerWrite로 반환 (DB 반영은 writer가 모아서)"""
             try:
-                # 현재 처리할 row를 새 세션에서 다시 조회
-                local_row_stmt = select(장부_결제문자).filter(
-                    장부_결제문자.mac_message_id == row.mac_message_id
-                )
-                local_row_result = await local_db_session.execute(local_row_stmt)
-                local_row = local_row_result.scalars().first()
-
-                if not local_row:
-                    return None
-
-                SESSION_ID = f"session_{session_id_suffix}"
-                adk_session_service = InMemorySessionService()
-                adk_session = await adk_session_service.create_session(
-                    app_name=APP_NAME,
-                    user_id=USER_ID,
-                    session_id=SESSION_ID
-                )
-
-                if local_row.발신번호 in CARD_SENDER_LIST:
-                    runner = Runner(
-                        agent=card_message_divider_agent,
-                        app_name=APP_NAME,
-                        session_service=adk_session_service
-                    )
-                elif local_row.발신번호 in BANK_SENDER_LIST:
-                    runner = Runner(
-                        agent=bank_message_divider_agent,
-                        app_name=APP_NAME,
-                        session_service=adk_session_service
-                    )
+                if row.발신번호 in CARD_SENDER_LIST:
+                    agent = card_message_divider_agent
+                elif row.발신번호 in BANK_SENDER_LIST:
+                    agent = bank_message_divider_agent
                 else:
-                    print(local_row.message, local_row.발신번호, "runner 생성 실패.")
+                    print(row.message, row.발신번호, "에이전트 선택 실패.")
                     return None
 
-                preprocessed_message = await preprocess_message(local_row.message)
+                preprocessed_message = await preprocess_message(row.message)
 
-                content = types.Content(role='user', parts=[types.Part(text=preprocessed_message)])
-                final_response_text = None
-                async for event in runner.run_async(user_id=USER_ID, session_id=SESSION_ID,
-                                                    new_message=content):
-                    if event.is_final_response():
-                        if event.content and event.content.parts:
-                            final_response_text = event.content.parts[0].text
-                        elif event.actions and event.actions.escalate:
-                            final_response_text = f"Agent escalated: {event.error_message or 'No specific message.'}"
+                final_response_text = await run_agent(agent, preprocessed_message)
 
                 if final_response_text:
                     divided_message = DividedMessageOutput.model_validate_json(final_response_text)
                     print(preprocessed_message)
                     print(divided_message)
                     print("-" * 50)
-                    local_row.transaction_type = divided_message.transaction_type
-                    local_row.amount = divided_message.amount
-                    local_row.currency = divided_message.currency
-                    local_row.거래상대 = divided_message.transaction_party
-                    await local_db_session.commit()
-                    return local_row
+                    return divided_write(row, divided_message)
 
                 return None
 
             except Exception as e:
+                if is_rate_limit_error(e):
+                    raise  # worker pool이 동시성을 줄이고 재시도
                 print(f"메시지 처리 에러 (ID: {row.mac_message_id}): {e}")
-                await local_db_session.rollback()
                 return None
-            finally:
-                await local_db_session.close()
 
-        # 배치 처리
-        batch_size = MAX_CONCURRENT_SESSIONS
-        total_processed = 0
-        processed_count = 0
-
-        for i in range(0, len(rows), batch_size):
-            batch = rows[i:i + batch_size]
-            print(f"\n배치 {i//batch_size + 1} 처리 중... ({len(batch)}개 메시지)")
-
-            # 배치 내 작업들을 병렬로 실행
-            tasks = []
-            for j, row in enumerate(batch):
-                session_id = f"{total_processed + j}"
-                tasks.append(process_single_message(row, session_id))
-
-            # 배치 단위로 병렬 실행
-            batch_results = await asyncio.gather(*tasks)
-
-            # 성공적으로 처리된 결과만 카운트
-            for result in batch_results:
-                if result:
-                    processed_count += 1
+        async def process_message_batch(batch_rows, batch_agent, item_agent, prompts):
+            """같은 종류(카드/은행) 문자 여러 건을 한 번의 LLM 호출로 분해하고 (LedgerWrite 목록, 검증 실패 row 목록)을 반환"""
+            outputs = await run_batch_agent(
+                batch_agent, item_agent,
+                [(row.mac_message_id, prompts[row.mac_message_id]) for row in batch_rows], DividedMessageBatchItem
+            )
+            writes = [divided_write(row, outputs[row.mac_message_id])
+                      for row in batch_rows if row.mac_message_id in outputs]
+            failed_rows = [row for row in batch_rows if row.mac_message_id not in outputs]
+            return writes, failed_rows
+
+        # 분해 결과는 worker들이 돌려준 LedgerWrite를 writer 하나가 chunk 단위로 반영
+        # (조회 이후 다른 실행이 이미 분해한 row는 덮어쓰지 않음)
+        async with LedgerWriter("message_divider") as writer:
+            await writer.add(parser_writes)
+            await writer.flush()
+            parser_count = len(writer.applied)
+            print(f"템플릿 파서 분해: {parser_count}/{len(rows)}건, LLM 분해 대상: {len(llm_rows)}건")
+            record_rows(rows_in=len(rows), rows_out=parser_count)
+            rows = llm_rows
+
+            # 배치 모드: 항목별로 캐시를 먼저 보고, 나머지 카드/은행 문자를 K건씩 묶어 분해한 뒤
+            # 항목별 검증에 실패한 row만 단건 처리로 다시 보냄
+            if DIVIDER_BATCH_SIZE > 1 and len(rows) > 1:
+                batches = []
+                single_rows = []
+                prompts = {row.mac_message_id: await preprocess_message(row.message) for row in rows}
+                senders = [(CARD_SENDER_LIST, card_message_divider_batch_agent, card_message_divider_agent),
+                           (BANK_SENDER_LIST, bank_message_divider_batch_agent, bank_message_divider_agent)]
+                cache_requests = [(row.mac_message_id, item_agent, prompts[row.mac_message_id])
+                                  for sender_list, _, item_agent in senders
+                                  for row in rows if row.발신번호 in sender_list]
+                cached = await cached_item_responses(cache_requests)
+                cached_writes = [divided_write(row, DividedMessageOutput.model_validate_json(cached[row.mac_message_id]))
+                                 for row in rows if row.mac_message_id in cached]
+                await writer.add(cached_writes)
+                print(f"분해 캐시 적중: {len(cached_writes)}/{len(rows)}건")
+                rows = [row for row in rows if row.mac_message_id not in cached]
+                for sender_list, batch_agent, item_agent in senders:
+                    sender_rows = [row for row in rows if row.발신번호 in sender_list]
+                    batches.extend((sender_rows[i:i + DIVIDER_BATCH_SIZE], batch_agent, item_agent, prompts)
+                                   for i in range(0, len(sender_rows), DIVIDER_BATCH_SIZE))
+                single_rows.extend(row for row in rows
+                                   if row.발신번호 not in CARD_SENDER_LIST and row.발신번호 not in BANK_SENDER_LIST)
+
+                batch_results, batch_stats = await run_worker_pool(
+                    'message_divider', batches,
+                    lambda batch, index: process_message_batch(*batch)
+                )
+                batch_count = 0
+                for (batch_rows, *_), batch_result in zip(batches, batch_results):
+                    if batch_result is None:
+                        single_rows.extend(batch_rows)
+                        continue
+                    batch_writes, failed_rows = batch_result
+                    batch_count += len(batch_writes)
+                    await writer.add(batch_writes)
+                    single_rows.extend(failed_rows)
+                print(f"배치 분해: {batch_count}/{len(rows)}건 성공, 단건 재처리 {len(single_rows)}건, "
+                      f"통계: {batch_stats.summary()}")
+                rows = single_rows
+
+            # 동시 실행 수를 조절하는 worker pool로 처리
+            pool_results, pool_stats = await run_worker_pool(
+                'message_divider', rows,
+                lambda row, index: process_single_message(row)
+            )
+            await writer.add(pool_results)
+            print(f"문자 분해 worker pool 통계: {pool_stats.summary()}")
 
-            total_processed += len(batch)
-            print(f"배치 완료. 총 {total_processed}개 처리됨 (성공: {processed_count}개)")
+        processed_count = len(writer.applied) - parser_count
+        record_rows(rows_out=processed_count)
+        print(f"\n처리 완료: 총 {processed_count}/{total_count}개 메시지 처리 성공")
+        print(f"발신사별 파서 적중/LLM 처리 누적: {parser_stats()}")
 
-        print(f"\n처리 완료: 총 {processed_count}/{len(rows)}개 메시지 처리 성공")
+    # 분해가 끝나 거래상대가 생긴 row에 가맹점 배정 (주기 실행에서는 기존 row backfill도 함께, dry-run이면 건너뜀)
+    if current_dry_run() is None:
+        await assign_merchants(mac_message_ids)
 
-    finally:
-        await db_session.close()
 
 async def check_last_message_upload(_app):
     async def check_async():
-        db_session = await get_database_session()
-        try:
+        async with database_session() as db_session:
             # SJ로 시작하는 가장 최신 메시지 조회
-            sj_stmt = select(장부_결제문자.결제시간).filter(
-                장부_결제문자.mac_message_id.like('SJ_%')
-            ).order_by(장부_결제문자.결제시간.desc()).limit(1)
-            
-            sj_result = await db_session.execute(sj_stmt)
+            sj_result = await db_session.execute(latest_message_time_query('SJ'))
             sj_latest = sj_result.scalar()
             
             # HJ로 시작하는 가장 최신 메시지 조회
-            hj_stmt = select(장부_결제문자.결제시간).filter(
-                장부_결제문자.mac_message_id.like('HJ_%')
-            ).order_by(장부_결제문자.결제시간.desc()).limit(1)
-            
-            hj_result = await db_session.execute(hj_stmt)
+            hj_result = await db_session.execute(latest_message_time_query('HJ'))
             hj_latest = hj_result.scalar()
 
             current_time = datetime.datetime.now(datetime.timezone.utc)
@@ -426,14 +798,13 @@ async def check_last_message_upload(_app):
                 print(f"SJ 최신 메시지 시간: {sj_latest}, 현재 시간: {current_time}, 차이: {time_diff}")
                 
                 if time_diff >= datetime.timedelta(hours=48):
-                    try:
-                        await _app.client.chat_postMessage(
-                            channel=SLACK_ACCOUNT_CHANNEL_ID,
-                            text="<@U061Q5EC7FS> 마지막 메세지 업로드가 48시간 지났습니다. 업로드 부탁드려요~"
-                        )
-                        print("SJ 48시간 경고 메시지 전송 완료")
-                    except Exception as e:
-                        raise e
+                    await enqueue_slack_messages([{
+                        "channel": SLACK_ACCOUNT_CHANNEL_ID,
+                        "text": "<@U061Q5EC7FS> 마지막 메세지 업로드가 48시간 지났습니다. 업로드 부탁드려요~",
+                        "kind": "upload_alert",
+                    }], db_session)
+                    await db_session.commit()
+                    print("SJ 48시간 경고 메시지 적재 완료")
                 else:
                     print(f"SJ는 아직 48시간이 지나지 않음 (남은 시간: {datetime.timedelta(hours=48) - time_diff})")
             
@@ -447,19 +818,16 @@ async def check_last_message_upload(_app):
                 print(f"HJ 최신 메시지 시간: {hj_latest}, 현재 시간: {current_time}, 차이: {time_diff}")
                 
                 if time_diff >= datetime.timedelta(hours=48):
-                    try:
-                        await _app.client.chat_postMessage(
-                            channel=SLACK_ACCOUNT_CHANNEL_ID,
-                            text="<@U061DQFDYEM> 마지막 메세지 업로드가 48시간 지났습니다. 업로드 부탁드려요~"
-                        )
-                        print("HJ 48시간 경고 메시지 전송 완료")
-                    except Exception as e:
-                        raise e
+                    await enqueue_slack_messages([{
+                        "channel": SLACK_ACCOUNT_CHANNEL_ID,
+                        "text": "<@U061DQFDYEM> 마지막 메세지 업로드가 48시간 지났습니다. 업로드 부탁드려요~",
+                        "kind": "upload_alert",
+                    }], db_session)
+                    await db_session.commit()
+                    print("HJ 48시간 경고 메시지 적재 완료")
                 else:
                     print(f"HJ는 아직 48시간이 지나지 않음 (남은 시간: {datetime.timedelta(hours=48) - time_diff})")
                         
-        finally:
-            await db_session.close()
 
     try:
         await check_async()
@@ -469,144 +837,114 @@ async def check_last_message_upload(_app):
             text=traceback.format_exc()
         )
 
-async def update_cancel_transactions():
-    """승인취소 거래와 매칭되는 승인 거래들의 거래목적을 '취소건'으로 업데이트"""
-    db_session = await get_database_session()
-    try:
-        # 승인취소 거래들 조회
-        refund_stmt = select(장부_결제문자).filter(
-            장부_결제문자.transaction_type == '승인취소',
-            장부_결제문자.거래목적.is_(None)
-        )
-        refund_result = await db_session.execute(refund_stmt)
-        refund_rows = refund_result.scalars().all()
-        
-        # 승인 거래들 조회
-        approval_stmt = select(장부_결제문자).filter(
-            장부_결제문자.transaction_type == '승인'
-        )
-        approval_result = await db_session.execute(approval_stmt)
-        approval_rows = approval_result.scalars().all()
-        
-        updated_count = 0
-        
-        for refund_row in refund_rows:
-            # amount와 currency가 동일한 승인 거래들 찾기
-            matching_approvals = [
-                approval for approval in approval_rows
-                if approval.amount == refund_row.amount and approval.currency == refund_row.currency
-            ]
-
-            if not matching_approvals:
-                print("승인취소를 매칭 시킬 수 없음.", refund_row.message)
-            
-            # 거래상대 유사도가 0.8 이상인 것 찾기
-            for approval in matching_approvals:
-                if approval.거래상대 and refund_row.거래상대:
-                    similarity_score = similarity(refund_row.거래상대, approval.거래상대)
-                    if similarity_score >= 80:
-                        # 매칭되는 승인 거래와 승인취소 거래 모두 거래목적을 '취소건'으로 설정
-                        approval.거래목적 = "취소건"
-                        refund_row.거래목적 = "취소건"
-                        updated_count += 2
-                        
-                        # print(f"취소건 매칭: 승인({approval.mac_message_id}) <-> 승인취소({refund_row.mac_message_id}) (유사도: {similarity_score:.1f}%)")
-        
-        await db_session.commit()
-        print(f"총 {updated_count}개의 거래가 '취소건'으로 업데이트되었습니다.")
+@traced_stage("update_cancel_transactions")
+async def update_cancel_transactions(mac_message_ids=None):
+    """승인취소 거래를 window 이내의 승인 거래 하나와 1:1로 매칭하여 거래목적을 '취소건'으로 업데이트"""
+    async with database_session() as db_session:
+        # 아직 매칭되지 않은 승인취소 거래들 조회 (승인 후보는 승인취소 시점 기준 window로 따로 조회)
+        # 대상 조건 자체가 미매칭 row라 watermark를 쓰지 않음 (지금 매칭 못 한 취소도 다음 실행에서 다시 봄)
+        # 주기 실행은 최근 CANCEL_REFUND_MAX_AGE_DAYS 안의 승인취소만 봄 (그보다 오래된 건 수동 확인이나 backfill로)
+        since = None
+        if mac_message_ids is None:
+            since = (datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+                     - datetime.timedelta(days=CANCEL_REFUND_MAX_AGE_DAYS))
+        refund_result = await db_session.execute(_only_ids(refund_target_query(since), mac_message_ids))
+        refund_rows = [LedgerTransaction._make(row) for row in refund_result]
+        if not refund_rows:
+            print("매칭할 승인취소 거래가 없습니다.")
+            return
+
+        # 승인취소 시점 이전 window 안의, 아직 취소건으로 쓰이지 않은 승인 거래만 조회
+        refund_times = [refund_row.결제시간 for refund_row in refund_rows if refund_row.결제시간]
+        if refund_times:
+            approval_stmt = approval_window_query(
+                min(refund_times) - datetime.timedelta(days=CANCEL_MATCH_WINDOW_DAYS), max(refund_times)
+            )
+        else:
+            approval_stmt = approval_window_query()
+        approval_rows = await stream_records(db_session, approval_stmt, LedgerTransaction)
+
+        matches, unmatched_refunds = CancelMatcher(approval_rows).match(refund_rows)
+
+        # 매칭 결과는 LedgerWriter로 반영 (조회 이후 다른 실행이 이미 바꾼 row는 덮어쓰지 않음)
+        def cancel_write(row, reason):
+            return ledger_write(row, {"거래목적": "취소건", "account_reason": reason})
+
+        writes = []
+        partial_count = 0
+        for cancel_match in matches:
+            refund_row, approval = cancel_match.refund, cancel_match.approval
+            if cancel_match.match_type == FULL_CANCEL:
+                # 전체취소: 승인 거래도 취소건으로 설정
+                writes.append(cancel_write(refund_row, f"{FULL_CANCEL}: 승인 {approval.mac_message_id}"))
+                writes.append(cancel_write(approval, f"{FULL_CANCEL}: 승인취소 {refund_row.mac_message_id}"))
+            else:
+                # 부분취소: 승인 거래는 남은 금액이 실제 지출이므로 분류를 유지
+                partial_count += 1
+                writes.append(cancel_write(refund_row, f"{PARTIAL_CANCEL}: 승인 {approval.mac_message_id} "
+                                                       f"({approval.amount:,}{approval.currency} 중 "
+                                                       f"{refund_row.amount:,}{refund_row.currency})"))
+
+        async with LedgerWriter("update_cancel_transactions") as writer:
+            await writer.add(writes)
+        record_rows(rows_in=len(refund_rows), rows_out=len(matches))
+        print(f"승인취소 {len(refund_rows)}건 중 {len(matches)}건 매칭 "
+              f"(전체취소 {len(matches) - partial_count}건, 부분취소 {partial_count}건)")
+        if unmatched_refunds:
+            print(f"승인취소를 매칭 시킬 수 없음 {len(unmatched_refunds)}건: " + ", ".join(
+                f"{refund_row.mac_message_id}({refund_row.거래상대}, {refund_row.amount}{refund_row.currency})"
+                for refund_row in unmatched_refunds
+            ))
         
-    finally:
-        await db_session.close()
 
-async def link_receipt_to_payments():
+@traced_stage("link_receipt_to_payments")
+async def link_receipt_to_payments(mac_message_ids=None):
     """거래목적이 '판매용상품'인 결제문자와 Receipt를 매칭하여 연결"""
-    db_session = await get_database_session()
-    try:
-        filter_date = datetime.datetime(2025, 10, 1, 0, 0, 0)
-
+    async with database_session() as db_session:
         # 거래목적이 '판매용상품'인 결제문자들 조회 (아직 Receipt와 연결되지 않은 것들)
-        payment_stmt = select(장부_결제문자).filter(
-            장부_결제문자.거래목적 == '판매용상품',
-            장부_결제문자.idtbl_receipt.is_(None),
-            장부_결제문자.결제시간 >= filter_date
-        ).order_by(장부_결제문자.결제시간)
-        payment_result = await db_session.execute(payment_stmt)
+        # 대상 조건 자체가 미연결 row라(ix_ledger_receipt_pending) watermark를 쓰지 않음 (영수증이 늦게 올라와도 연결)
+        payment_result = await db_session.execute(
+            _only_ids(unlinked_purchase_query(RECEIPT_LINK_START_TIME), mac_message_ids)
+        )
         payment_rows = payment_result.scalars().all()
         
-        # 모든 Receipt 조회
-        receipt_stmt = select(Receipt)
-        receipt_result = await db_session.execute(receipt_stmt)
-        receipt_rows = receipt_result.scalars().all()
-        
-        linked_count = 0
-        
-        for payment_row in payment_rows:
-            # amount와 currency가 매칭되는 Receipt들 찾기
-            matching_receipts = []
-            
-            for receipt in receipt_rows:
-                # currency 매칭 확인 (0: JPY, 1: KRW)
-                payment_currency = payment_row.currency
-                receipt_currency_code = "JPY" if receipt.receipt_currency == 0 else "KRW"
-                receipt_amount = (receipt.cash_receipt_price or 0) + (receipt.receipt_price or 0)
-
-                if (payment_currency == receipt_currency_code and 
-                    payment_row.amount == receipt_amount):
-                    
-                    # 날짜 차이 확인 (30일 이내)
-                    if payment_row.결제시간 and receipt.buying_date:
-                        # 결제시간은 datetime, buying_date는 date이므로 date로 변환하여 비교
-                        payment_date = payment_row.결제시간.date()
-                        date_diff = abs((payment_date - receipt.buying_date).days)
-                        
-                        if date_diff <= 30:
-                            matching_receipts.append((receipt, date_diff))
-            
-            # 날짜 차이가 가장 작은 Receipt와 매칭
-            if matching_receipts:
-                # 날짜 차이 순으로 정렬하여 가장 가까운 것 선택
-                matching_receipts.sort(key=lambda x: x[1])
-                best_receipt = matching_receipts[0][0]
-                date_diff = matching_receipts[0][1]
-                
-                # 연결 설정
-                payment_row.idtbl_receipt = best_receipt.idtbl_receipt
-                linked_count += 1
-                
-                print(f"Receipt 연결: {payment_row.mac_message_id} -> Receipt {best_receipt.idtbl_receipt} "
-                      f"(금액: {payment_row.amount} {payment_row.currency}, 날짜차이: {date_diff}일)")
-        
-        await db_session.commit()
-        print(f"총 {linked_count}개의 결제문자가 Receipt와 연결되었습니다.")
+        if not payment_rows:
+            print("Receipt와 연결할 결제문자가 없습니다.")
+            return
+
+        # 결제 기간 ±window 안의 Receipt만, 매칭에 필요한 컬럼만 조회 (이미지 경로 등 제외)
+        payment_dates = [payment_row.결제시간.date() for payment_row in payment_rows if payment_row.결제시간]
+        window = datetime.timedelta(days=RECEIPT_MATCH_WINDOW_DAYS)
+        receipt_result = await db_session.execute(
+            receipt_window_query(min(payment_dates) - window, max(payment_dates) + window)
+        )
+        receipt_index = ReceiptIndex(receipt_result.all())
+
+        # 날짜 차이가 가장 작은 쌍부터 배정 (한 Receipt는 한 결제문자에만 연결)
+        matches = receipt_index.assign(payment_rows)
+        async with LedgerWriter("link_receipt_to_payments") as writer:
+            for receipt_match in matches:
+                payment_row = receipt_match.payment
+                await writer.add([ledger_write(payment_row, {"idtbl_receipt": receipt_match.idtbl_receipt})])
+                print(f"Receipt 연결: {payment_row.mac_message_id} -> Receipt {receipt_match.idtbl_receipt} "
+                      f"(금액: {payment_row.amount} {payment_row.currency}, 날짜차이: {receipt_match.date_diff}일)")
+        record_rows(rows_in=len(payment_rows), rows_out=len(writer.applied))
+        print(f"총 {len(writer.applied)}개의 결제문자가 Receipt와 연결되었습니다.")
         
-    finally:
-        await db_session.close()
 
 async def send_unlinked_receipts_to_slack(_app):
     """Receipt와 연결되지 않은 판매용상품 거래를 슬랙으로 전송"""
-    db_session = await get_database_session()
-    try:
-        # KST 2025-10-01 00:00:00
-        kst_filter_date = datetime.datetime(2025, 10, 14, 0, 0, 0)
-        # KST에서 UTC로 변환 (KST = UTC + 9시간이므로 UTC = KST - 9시간)
-        filter_date = kst_filter_date - datetime.timedelta(hours=9)
-        
-        # 조건에 맞는 레코드들 조회
-        stmt = select(장부_결제문자).filter(
-            장부_결제문자.idtbl_receipt.is_(None),
-            장부_결제문자.거래목적 == '판매용상품',
-            장부_결제문자.결제시간 >= filter_date
-        ).order_by(장부_결제문자.결제시간)
-        
-        result = await db_session.execute(stmt)
+    async with database_session() as db_session:
+        # KST 2025-10-14 00:00:00 이후의 조건에 맞는 레코드들 조회
+        result = await db_session.execute(unlinked_purchase_query(UNLINKED_RECEIPT_START_TIME))
         rows = result.scalars().all()
         
         if not rows:
             print("조건에 맞는 미연결 거래가 없습니다.")
             return
         
-        # 각 거래를 개별 메시지로 전송
-        sent_count = 0
+        # 각 거래를 한 줄로 만들어 outbox에 적재 (sender가 채널별로 digest로 묶어서 전송)
+        messages = []
         for row in rows:
             # KST 기준으로 날짜 포맷팅 (MM/dd HH:mm)
             if row.결제시간:
@@ -619,16 +957,14 @@ async def send_unlinked_receipts_to_slack(_app):
             
             message = f"영수증 없음:pleading_face: {date_str} | {row.발신자명 or '미확인'} | {row.거래상대 or '미확인'} | {amount_str}"
             
-            try:
-                await _app.client.chat_postMessage(
-                    channel=SLACK_REACT_APP_CHANNEL_ID,
-                    text=message
-                )
-                sent_count += 1
-            except Exception as e:
-                print(f"Slack 메시지 전송 실패: {e}")
-        
-        print(f"미연결 거래 {sent_count}/{len(rows)}건을 슬랙으로 전송했습니다.")
+            messages.append({
+                "channel": SLACK_REACT_APP_CHANNEL_ID,
+                "text": message,
+                "kind": "unlinked_receipt",
+                "digest": True,
+            })
+
+        await enqueue_slack_messages(messages, db_session)
+        await db_session.commit()
+        print(f"미연결 거래 {len(messages)}건을 슬랙 outbox에 적재했습니다.")
         
-    finally:
-        await db_session.close()
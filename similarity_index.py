@@ -0,0 +1,72 @@
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from config import SIMILARITY_WORKERS, SIMILARITY_QUERY_CHUNK
+
+
+class SimilarityIndex:
+    """과거 레코드의 거래상대 문자열을 중복 제거해두고, 여러 거래상대를 한번에 유사도 검색하는 인덱스
+
+    검색은 rapidfuzz.process.cdist 한 번(쿼리 chunk 단위)으로 모든 쌍의 점수를 계산하며,
+    `score_cutoff` 이상인 이웃만 점수 내림차순으로 돌려준다.
+    """
+
+    def __init__(self, records: Iterable = (), key: Callable = lambda record: record.거래상대,
+                 scorer=fuzz.ratio):
+        self.key = key
+        self.scorer = scorer
+        self.choices: List[str] = []
+        self.records_by_choice: Dict[str, list] = defaultdict(list)
+        self.add(records)
+
+    def __len__(self):
+        return len(self.choices)
+
+    def add(self, records: Iterable):
+        """레코드 추가 (처음 보는 거래상대만 후보 목록에 추가)"""
+        for record in records:
+            name = self.key(record)
+            if not name:
+                continue
+            if name not in self.records_by_choice:
+                self.choices.append(name)
+            self.records_by_choice[name].append(record)
+
+    def search(self, queries: Sequence[str], score_cutoff: float = 70, limit: Optional[int] = None,
+               workers: int = SIMILARITY_WORKERS) -> Dict[str, List[Tuple[str, float]]]:
+        """쿼리별로 (거래상대, 점수) 이웃 목록을 반환. 같은 쿼리는 한번만 계산"""
+        distinct_queries = list(dict.fromkeys(query for query in queries if query))
+        neighbours = {query: [] for query in distinct_queries}
+        if not distinct_queries or not self.choices:
+            return neighbours
+
+        for start in range(0, len(distinct_queries), SIMILARITY_QUERY_CHUNK):
+            chunk = distinct_queries[start:start + SIMILARITY_QUERY_CHUNK]
+            # cutoff 미만 점수는 0으로 채워짐
+            scores = process.cdist(
+                chunk, self.choices,
+                scorer=self.scorer,
+                score_cutoff=score_cutoff,
+                dtype=np.float32,
+                workers=workers
+            )
+            for query, row_scores in zip(chunk, scores):
+                hit_indices = np.flatnonzero(row_scores >= max(score_cutoff, 1e-6))
+                if limit is not None and len(hit_indices) > limit:
+                    top = np.argpartition(row_scores[hit_indices], -limit)[-limit:]
+                    hit_indices = hit_indices[top]
+                hit_indices = hit_indices[np.argsort(-row_scores[hit_indices], kind="stable")]
+                neighbours[query] = [(self.choices[i], float(row_scores[i])) for i in hit_indices]
+
+        return neighbours
+
+    def similar_records(self, queries: Sequence[str], score_cutoff: float = 70,
+                        limit: Optional[int] = None) -> Dict[str, list]:
+        """쿼리별로 유사한 거래상대를 가진 원본 레코드 목록을 반환 (유사도 높은 순)"""
+        return {
+            query: [record for name, _ in hits for record in self.records_by_choice[name]]
+            for query, hits in self.search(queries, score_cutoff=score_cutoff, limit=limit).items()
+        }
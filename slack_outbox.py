@@ -0,0 +1,354 @@
+"""Slack 메시지 outbox: 장부 처리와 같은 트랜잭션으로 저장하고, 백그라운드 sender가 채널별 rate limit에 맞춰 전송
+
+일시적 오류는 백오프(최대 SLACK_OUTBOX_MAX_BACKOFF_SECONDS)로 계속 재시도하고, 다시 보내도 성공하지 않는
+오류(채널 없음, 인증 실패, 메시지 길이 초과 등)만 failed로 둔다. failed row는 원인을 고친 뒤 requeue로 다시 보낸다.
+
+    uv run python -m slack_outbox status
+    uv run python -m slack_outbox requeue [--id 1 2 3] [--channel C123] [--kind account_result]
+"""
+import argparse
+import asyncio
+import datetime
+import time
+import traceback
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from slack_sdk.errors import SlackApiError
+from sqlalchemy import select, update, func, insert
+
+from config import SLACK_CHANNEL_RATE_PER_SECOND, SLACK_CHANNEL_BURST, SLACK_OUTBOX_POLL_SECONDS, \
+    SLACK_OUTBOX_BATCH_SIZE, SLACK_OUTBOX_MAX_BACKOFF_SECONDS, SLACK_DIGEST_MAX_LINES, RUN_GUARD_ENABLED
+from database import database_session
+from migrations import check_schema
+from models import SlackOutbox
+from run_guard import advisory_locks
+from telemetry import record_slack_call
+from thread_cache import ThreadRoot, bot_identity, thread_root_cache
+
+# enqueue 직후 sender를 깨우기 위한 이벤트 (같은 프로세스 안에서만 의미 있음, 나머지는 polling)
+_wakeup = asyncio.Event()
+
+# 다시 보내도 성공하지 않는 Slack 오류 (재시도하지 않고 바로 failed, 그 밖의 오류는 횟수 제한 없이 재시도)
+CHANNEL_ERRORS = {"channel_not_found", "not_in_channel", "is_archived", "restricted_action", "cannot_reply_to_message",
+                  "invalid_auth", "not_authed", "account_inactive", "token_revoked"}
+PAYLOAD_ERRORS = {"invalid_blocks", "invalid_blocks_format", "msg_too_long", "no_text", "too_many_attachments",
+                  "invalid_arguments"}
+
+
+async def enqueue_slack_messages(messages: List[dict], db_session=None) -> int:
+    """{"channel", "text", "kind", "digest"} 목록을 outbox에 저장
+
+    db_session을 넘기면 호출한 쪽 트랜잭션에 포함되어 commit 시점에 함께 저장된다.
+    """
+    if not messages:
+        return 0
+    rows = [{
+        "channel": message["channel"],
+        "text": message["text"],
+        "kind": message.get("kind", "message"),
+        "digest": message.get("digest", False),
+    } for message in messages]
+    if db_session is not None:
+        await db_session.execute(insert(SlackOutbox), rows)
+    else:
+        async with database_session() as own_session:
+            await own_session.execute(insert(SlackOutbox), rows)
+            await own_session.commit()
+    _wakeup.set()
+    return len(rows)
+
+
+class TokenBucket:
+    """초당 rate개씩 채워지고 최대 burst개까지 쌓이는 토큰 버킷"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def pause(self, seconds: float):
+        """429 Retry-After 동안 버킷을 비우고 멈춤"""
+        self.tokens = 0.0
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """SlackApiError가 429이면 Retry-After(초)를 반환"""
+    response = getattr(error, "response", None)
+    if response is None or getattr(response, "status_code", None) != 429:
+        return None
+    return float(response.headers.get("Retry-After", response.headers.get("retry-after", 1)))
+
+
+def _slack_error_code(error: Exception) -> Optional[str]:
+    """SlackApiError 응답의 error 코드 (channel_not_found 등)"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return response.get("error")
+    except (AttributeError, TypeError):
+        return None
+
+
+def build_digest(rows: List) -> dict:
+    """여러 row를 Block Kit digest 메시지 하나로 묶음 (text는 알림/검색용 fallback)"""
+    lines = [row.text for row in rows]
+    blocks = [{
+        "type": "header",
+        "text": {"type": "plain_text", "text": f"{len(rows)}건 알림"}
+    }]
+    # section 블록 text는 3000자 제한이 있으므로 줄 단위로 나눠 담음
+    chunk = []
+    for line in lines:
+        if chunk and len("\n".join(chunk + [line])) > 2900:
+            blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": "\n".join(chunk)}})
+            chunk = []
+        chunk.append(line)
+    if chunk:
+        blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": "\n".join(chunk)}})
+    return {"text": "\n".join(lines), "blocks": blocks}
+
+
+class SlackOutboxSender:
+    """outbox의 pending 메시지를 채널별 token bucket에 맞춰 전송하는 백그라운드 작업"""
+
+    def __init__(self, app):
+        self.app = app
+        self.buckets: Dict[str, TokenBucket] = defaultdict(
+            lambda: TokenBucket(SLACK_CHANNEL_RATE_PER_SECOND, SLACK_CHANNEL_BURST)
+        )
+        self.sent_messages = 0
+        self.sent_rows = 0
+        self.digests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def stats(self) -> dict:
+        return {
+            "sent_messages": self.sent_messages,
+            "sent_rows": self.sent_rows,
+            "digests": self.digests,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "failed": self.failed,
+        }
+
+    async def _pending_rows(self) -> List:
+        async with database_session() as db_session:
+            stmt = select(
+                SlackOutbox.id, SlackOutbox.channel, SlackOutbox.text, SlackOutbox.kind,
+                SlackOutbox.digest, SlackOutbox.attempts
+            ).filter(
+                SlackOutbox.status == "pending",
+                SlackOutbox.next_attempt_at <= func.now()
+            ).order_by(SlackOutbox.id).limit(SLACK_OUTBOX_BATCH_SIZE)
+            return (await db_session.execute(stmt)).all()
+
+    @staticmethod
+    def _group_messages(rows: List) -> List[List]:
+        """채널 내 순서를 유지하면서 digest 가능한 연속 row를 (kind별로) 묶음"""
+        groups = []
+        for row in rows:
+            last = groups[-1] if groups else None
+            if last and row.digest and last[0].digest and last[0].kind == row.kind \
+                    and len(last) < SLACK_DIGEST_MAX_LINES:
+                last.append(row)
+            else:
+                groups.append([row])
+        return groups
+
+    async def _mark_sent(self, rows: List, slack_ts: Optional[str]):
+        async with database_session() as db_session:
+            await db_session.execute(
+                update(SlackOutbox).where(SlackOutbox.id.in_([row.id for row in rows])).values(
+                    status="sent", sent_at=func.now(), slack_ts=slack_ts, attempts=SlackOutbox.attempts + 1
+                )
+            )
+            await db_session.commit()
+
+    async def _mark_retry(self, rows: List, postponed: List, error: Exception, delay: float):
+        """실패한 row는 attempts를 늘리고, 같은 채널의 뒤 순서 row는 순서 유지를 위해 함께 미룸"""
+        next_attempt_at = func.now() + datetime.timedelta(seconds=delay)
+        async with database_session() as db_session:
+            await db_session.execute(
+                update(SlackOutbox).where(SlackOutbox.id.in_([row.id for row in rows])).values(
+                    attempts=SlackOutbox.attempts + 1,
+                    last_error=str(error)[:2000],
+                    next_attempt_at=next_attempt_at
+                )
+            )
+            if postponed:
+                await db_session.execute(
+                    update(SlackOutbox).where(SlackOutbox.id.in_([row.id for row in postponed])).values(
+                        next_attempt_at=next_attempt_at
+                    )
+                )
+            await db_session.commit()
+
+    async def _mark_failed(self, rows: List, error: Exception):
+        """재시도해도 안 되는 row는 failed로 (같은 채널의 다음 메시지를 더 이상 막지 않음)"""
+        async with database_session() as db_session:
+            await db_session.execute(
+                update(SlackOutbox).where(SlackOutbox.id.in_([row.id for row in rows])).values(
+                    status="failed", attempts=SlackOutbox.attempts + 1, last_error=str(error)[:2000]
+                )
+            )
+            await db_session.commit()
+        self.failed += len(rows)
+
+    async def _send_channel(self, channel: str, rows: List):
+        """한 채널의 메시지를 순서대로 전송. 일시적으로 실패하면 해당 채널의 나머지는 다음 회차로 미룸"""
+        bucket = self.buckets[channel]
+        groups = self._group_messages(rows)
+        position = -1
+        while position + 1 < len(groups):
+            position += 1
+            group = groups[position]
+            payload = build_digest(group) if len(group) > 1 else {"text": group[0].text}
+            await bucket.acquire()
+            started = time.perf_counter()
+            try:
+                response = await self.app.client.chat_postMessage(channel=channel, **payload)
+            except Exception as e:
+                retry_after = _retry_after(e) if isinstance(e, SlackApiError) else None
+                record_slack_call("chat.postMessage", "rate_limited" if retry_after is not None else "error",
+                                  time.perf_counter() - started)
+                error_code = _slack_error_code(e) if isinstance(e, SlackApiError) else None
+                attempts = max(row.attempts for row in group)
+                if error_code in CHANNEL_ERRORS:
+                    # 채널(또는 토큰) 자체로 보낼 수 없으므로 이번에 읽은 이 채널의 나머지도 모두 failed
+                    remaining = [row for later_group in groups[position:] for row in later_group]
+                    print(f"Slack 채널에 보낼 수 없어 {len(remaining)}건을 failed로 둡니다 ({channel}): {e}")
+                    await self._mark_failed(remaining, e)
+                    return
+                if retry_after is None and error_code in PAYLOAD_ERRORS and len(group) > 1:
+                    # digest로 묶은 메시지가 문제면 한 건씩 다시 보냄
+                    groups[position + 1:position + 1] = [[row] for row in group]
+                    continue
+                if retry_after is None and error_code in PAYLOAD_ERRORS:
+                    print(f"Slack 메시지 전송 포기 ({channel}, {len(group)}건, {error_code}): {e}")
+                    await self._mark_failed(group, e)
+                    continue
+                if retry_after is not None:
+                    self.rate_limited += 1
+                    bucket.pause(retry_after)
+                    delay = retry_after
+                else:
+                    delay = min(2 ** attempts, SLACK_OUTBOX_MAX_BACKOFF_SECONDS)
+                self.retries += 1
+                print(f"Slack 메시지 전송 실패 ({channel}, {len(group)}건, {delay:.0f}초 후 재시도): {e}")
+                postponed = [row for later_group in groups[position + 1:] for row in later_group]
+                await self._mark_retry(group, postponed, e, delay)
+                return
+            record_slack_call("chat.postMessage", "ok", time.perf_counter() - started)
+            # 봇이 보낸 메시지를 스레드 원본 캐시에 넣어 답글 처리 시 Slack 조회를 생략
+            posted = response.get("message") or {}
+            thread_root_cache.put(channel, response.get("ts"), ThreadRoot(
+                payload["text"], posted.get("user", bot_identity.user_id), posted.get("bot_id", bot_identity.bot_id)
+            ))
+            await self._mark_sent(group, response.get("ts"))
+            self.sent_messages += 1
+            self.sent_rows += len(group)
+            if len(group) > 1:
+                self.digests += 1
+
+    async def flush(self) -> int:
+        """현재 전송 가능한 pending 메시지를 모두 보냄. 전송 시도한 row 수 반환"""
+        rows = await self._pending_rows()
+        by_channel = defaultdict(list)
+        for row in rows:
+            by_channel[row.channel].append(row)
+        # 채널마다 rate limit이 따로 적용되므로 채널 간에는 병렬로 전송
+        await asyncio.gather(*(self._send_channel(channel, channel_rows) for channel, channel_rows in by_channel.items()))
+        return len(rows)
+
+    async def run(self):
+        while True:
+            _wakeup.clear()
+            try:
+                # replica가 여럿이어도 sender lock을 잡은 한 곳에서만 전송 (같은 row를 두 번 보내지 않도록)
+                if RUN_GUARD_ENABLED and not advisory_locks.holds("slack_outbox_sender") \
+                        and not await advisory_locks.try_acquire("slack_outbox_sender"):
+                    pass
+                elif await self.flush() >= SLACK_OUTBOX_BATCH_SIZE:
+                    continue
+            except Exception:
+                print(f"Slack outbox 전송 중 오류\n{traceback.format_exc()}")
+            try:
+                await asyncio.wait_for(_wakeup.wait(), SLACK_OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+async def requeue_failed(ids: Optional[List[int]] = None, channel: Optional[str] = None,
+                         kind: Optional[str] = None) -> int:
+    """failed row를 pending으로 되돌려 바로 다시 보내게 함 (조건이 없으면 전부)"""
+    stmt = update(SlackOutbox).where(SlackOutbox.status == "failed")
+    if ids:
+        stmt = stmt.where(SlackOutbox.id.in_(ids))
+    if channel is not None:
+        stmt = stmt.where(SlackOutbox.channel == channel)
+    if kind is not None:
+        stmt = stmt.where(SlackOutbox.kind == kind)
+    async with database_session() as db_session:
+        result = await db_session.execute(stmt.values(status="pending", attempts=0, next_attempt_at=func.now()))
+        await db_session.commit()
+    return result.rowcount
+
+
+async def _main(args):
+    await check_schema()
+    if args.command == "requeue":
+        print(f"failed -> pending: {await requeue_failed(args.id, args.channel, args.kind)}건")
+    async with database_session() as db_session:
+        counts = (await db_session.execute(
+            select(SlackOutbox.status, SlackOutbox.channel, func.count()).group_by(SlackOutbox.status, SlackOutbox.channel)
+            .order_by(SlackOutbox.status, SlackOutbox.channel)
+        )).all()
+        failed = (await db_session.execute(
+            select(SlackOutbox.id, SlackOutbox.channel, SlackOutbox.kind, SlackOutbox.last_error).filter(
+                SlackOutbox.status == "failed"
+            ).order_by(SlackOutbox.id.desc()).limit(20)
+        )).all()
+    for status, channel, count in counts:
+        print(f"{status:>8} {channel}: {count}건")
+    for row in failed:
+        print(f"  failed #{row.id} {row.channel} {row.kind}: {(row.last_error or '')[:200]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Slack outbox 상태 확인/재전송")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="status/채널별 row 수와 최근 failed row")
+    requeue_parser = subparsers.add_parser("requeue", help="failed row를 다시 전송 대기로")
+    requeue_parser.add_argument("--id", type=int, nargs="+", help="이 row만")
+    requeue_parser.add_argument("--channel", help="이 채널만")
+    requeue_parser.add_argument("--kind", help="이 kind만 (account_result 등)")
+    asyncio.run(_main(parser.parse_args()))
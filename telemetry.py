@@ -0,0 +1,266 @@
+import asyncio
+import bisect
+import contextvars
+import functools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from opentelemetry import trace
+
+from config import METRICS_ENABLED, METRICS_HOST, METRICS_PORT
+
+# TracerProvider가 설정되어 있으면(langsmith configure(), OTLP collector 등) 그쪽으로 내보내고,
+# 없으면 no-op span이라 비용이 거의 없다.
+tracer = trace.get_tracer("modepick.account_agent")
+
+# 현재 실행 중인 stage (DB 쿼리/LLM 호출을 stage별로 집계할 때 사용)
+_current_stage: contextvars.ContextVar[Optional["StageRecorder"]] = contextvars.ContextVar("current_stage", default=None)
+
+
+class Counter:
+    """Prometheus counter (label 값 조합별 누적값)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labelnames)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Prometheus histogram (누적 bucket + sum + count)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values: Dict[Tuple[str, ...], list] = {}  # key -> [bucket별 개수..., sum, count]
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labelnames)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            entry[index] += 1
+        entry[-2] += value
+        entry[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, entry in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + (repr(float(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + ('+Inf',))} {entry[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {entry[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {entry[-1]}")
+        return lines
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+REGISTRY: List = []
+
+STAGE_DURATION = Histogram("agent_stage_duration_seconds", "Stage 실행 시간", ["stage", "outcome"])
+STAGE_ROWS = Counter("agent_stage_rows_total", "Stage 입력/출력 row 수", ["stage", "direction"])
+DB_QUERIES = Counter("agent_db_queries_total", "DB round trip 수", ["stage"])
+DB_SECONDS = Counter("agent_db_seconds_total", "DB 쿼리 실행 시간 합계(초)", ["stage"])
+LEDGER_WRITES = Counter("agent_ledger_writes_total", "LedgerWriter 반영 결과 (applied, conflict)", ["stage", "outcome"])
+LLM_DURATION = Histogram("agent_llm_call_duration_seconds", "LLM 호출 시간", ["agent", "outcome"])
+LLM_CALLS = Counter("agent_llm_calls_total", "LLM 호출 수 (캐시 적중 포함)", ["agent", "cache", "outcome"])
+LLM_TOKENS = Counter("agent_llm_tokens_total", "LLM 토큰 수", ["agent", "kind"])
+SLACK_DURATION = Histogram("agent_slack_call_duration_seconds", "Slack API 호출 시간", ["method", "outcome"],
+                           buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+SLACK_CALLS = Counter("agent_slack_calls_total", "Slack API 호출 수", ["method", "outcome"])
+RUN_GUARD_EVENTS = Counter("agent_run_guard_events_total", "job guard 이벤트 (acquired, skipped, coalesced, truncated, overrun)",
+                           ["job", "event"])
+MERCHANT_RESOLUTIONS = Counter("agent_merchant_resolutions_total",
+                               "거래상대 -> 가맹점 resolve 결과 (cache_hit, db_hit, fuzzy, new)", ["outcome"])
+LOCAL_CLASSIFICATIONS = Counter("agent_local_classifications_total",
+                                "로컬 분류기 결과 (resolved, escalated)", ["outcome"])
+LOCK_WAIT = Histogram("agent_lock_wait_seconds", "advisory lock 대기 시간", ["lock", "outcome"],
+                      buckets=(0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300))
+
+
+class StageRecorder:
+    def __init__(self, name: str, span):
+        self.name = name
+        self.span = span
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.llm_calls = 0
+        self.rows_in = 0
+        self.rows_out = 0
+
+    def rows(self, rows_in: Optional[int] = None, rows_out: Optional[int] = None):
+        """stage 안에서 여러 번 호출되면 누적 (예: 파서 분해 + LLM 분해)"""
+        if rows_in is not None:
+            STAGE_ROWS.inc(rows_in, stage=self.name, direction="in")
+            self.rows_in += rows_in
+            self.span.set_attribute("rows.in", self.rows_in)
+        if rows_out is not None:
+            STAGE_ROWS.inc(rows_out, stage=self.name, direction="out")
+            self.rows_out += rows_out
+            self.span.set_attribute("rows.out", self.rows_out)
+
+
+def current_stage() -> Optional[StageRecorder]:
+    """현재 실행 중인 stage의 recorder (stage 밖이면 None)"""
+    return _current_stage.get()
+
+
+def record_rows(rows_in: Optional[int] = None, rows_out: Optional[int] = None):
+    """현재 stage의 입력/출력 row 수 기록 (stage 밖에서 호출되면 무시)"""
+    recorder = _current_stage.get()
+    if recorder is not None:
+        recorder.rows(rows_in, rows_out)
+
+
+def traced_stage(name: str):
+    """stage 함수에 span과 실행 시간/DB 쿼리/LLM 호출 집계를 붙이는 decorator"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(f"stage.{name}") as span:
+                recorder = StageRecorder(name, span)
+                token = _current_stage.set(recorder)
+                started = time.perf_counter()
+                outcome = "ok"
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    outcome = "error"
+                    raise
+                finally:
+                    _current_stage.reset(token)
+                    STAGE_DURATION.observe(time.perf_counter() - started, stage=name, outcome=outcome)
+                    span.set_attribute("db.round_trips", recorder.db_queries)
+                    span.set_attribute("db.seconds", round(recorder.db_seconds, 3))
+                    span.set_attribute("llm.calls", recorder.llm_calls)
+        return wrapper
+    return decorator
+
+
+def instrument_engine(engine):
+    """SQLAlchemy AsyncEngine의 쿼리 실행마다 stage별 DB round trip 수와 실행 시간 집계"""
+    from sqlalchemy import event
+
+    def before_cursor_execute(connection, *args):
+        recorder = _current_stage.get()
+        if recorder is not None:
+            recorder.db_queries += 1
+        DB_QUERIES.inc(stage=recorder.name if recorder else "")
+        connection.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def after_cursor_execute(connection, *args):
+        started = connection.info.get("query_started")
+        if not started:
+            return
+        seconds = time.perf_counter() - started.pop()
+        recorder = _current_stage.get()
+        if recorder is not None:
+            recorder.db_seconds += seconds
+        DB_SECONDS.inc(seconds, stage=recorder.name if recorder else "")
+
+    def handle_error(exception_context):
+        # 실패한 쿼리는 after_cursor_execute가 불리지 않으므로 시작 시각만 버림
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine.sync_engine, "handle_error", handle_error)
+
+
+@asynccontextmanager
+async def llm_span(agent_name: str):
+    """LLM 호출 하나의 span. yield한 dict에 cache/prompt_tokens/completion_tokens를 채우면 함께 기록"""
+    with tracer.start_as_current_span(f"llm.{agent_name}") as span:
+        result = {"cache": "miss", "prompt_tokens": 0, "completion_tokens": 0}
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            yield result
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            latency = time.perf_counter() - started
+            recorder = _current_stage.get()
+            if recorder is not None:
+                recorder.llm_calls += 1
+            LLM_CALLS.inc(agent=agent_name, cache=result["cache"], outcome=outcome)
+            if result["cache"] == "miss":
+                LLM_DURATION.observe(latency, agent=agent_name, outcome=outcome)
+                LLM_TOKENS.inc(result["prompt_tokens"], agent=agent_name, kind="prompt")
+                LLM_TOKENS.inc(result["completion_tokens"], agent=agent_name, kind="completion")
+            span.set_attribute("llm.agent", agent_name)
+            span.set_attribute("llm.cache", result["cache"])
+            span.set_attribute("llm.latency_seconds", latency)
+            span.set_attribute("llm.prompt_tokens", result["prompt_tokens"])
+            span.set_attribute("llm.completion_tokens", result["completion_tokens"])
+
+
+def record_slack_call(method: str, outcome: str, latency: float):
+    SLACK_CALLS.inc(method=method, outcome=outcome)
+    SLACK_DURATION.observe(latency, method=method, outcome=outcome)
+    trace.get_current_span().add_event("slack.call", {"method": method, "outcome": outcome})
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+async def _handle_metrics_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        # 헤더는 읽고 버림
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+        path = request_line.split(b" ")[1] if request_line.count(b" ") >= 2 else b""
+        if path.split(b"?")[0] == b"/metrics":
+            status, body = "200 OK", render_metrics().encode("utf-8")
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server() -> Optional[asyncio.base_events.Server]:
+    """이벤트 루프 안에서 Prometheus /metrics 엔드포인트 제공 (METRICS_ENABLED=false면 실행 안 함)"""
+    if not METRICS_ENABLED:
+        return None
+    server = await asyncio.start_server(_handle_metrics_request, METRICS_HOST, METRICS_PORT)
+    print(f"/metrics 엔드포인트: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return server
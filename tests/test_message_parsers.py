@@ -0,0 +1,7 @@
+"""message_parsers 템플릿에 등록된 예시 문자가 기대 결과대로 분해되는지"""
+from message_parsers import verify_examples
+
+
+def test_template_examples():
+    failures = verify_examples()
+    assert not failures, "\n".join(failures)
@@ -0,0 +1,75 @@
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+from config import THREAD_CACHE_MAX_ENTRIES, THREAD_CACHE_TTL_SECONDS
+
+
+class ThreadRoot(NamedTuple):
+    text: str
+    user: Optional[str]
+    bot_id: Optional[str]
+
+
+class BotIdentity:
+    """auth_test 결과(봇 user id, bot id)를 시작 시 한 번만 조회해서 보관"""
+
+    def __init__(self):
+        self.user_id: Optional[str] = None
+        self.bot_id: Optional[str] = None
+
+    async def load(self, client):
+        result = await client.auth_test()
+        self.user_id = result.get("user_id")
+        self.bot_id = result.get("bot_id")
+        print(f"봇 정보 로드: user_id={self.user_id}, bot_id={self.bot_id}")
+
+    async def ensure(self, client):
+        if self.user_id is None:
+            await self.load(client)
+
+    def is_ours(self, root: ThreadRoot) -> bool:
+        return (root.user is not None and root.user == self.user_id) or \
+            (root.bot_id is not None and root.bot_id == self.bot_id)
+
+
+class ThreadRootCache:
+    """(channel, thread_ts) -> 스레드 원본 메시지 LRU + TTL 캐시"""
+
+    def __init__(self, max_entries: int = THREAD_CACHE_MAX_ENTRIES, ttl_seconds: int = THREAD_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, ThreadRoot]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, channel: str, thread_ts: str) -> Optional[ThreadRoot]:
+        key = (channel, thread_ts)
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, channel: str, thread_ts: str, root: ThreadRoot):
+        key = (channel, thread_ts)
+        self._entries[key] = (time.monotonic(), root)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+bot_identity = BotIdentity()
+thread_root_cache = ThreadRootCache()
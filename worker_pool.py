@@ -0,0 +1,204 @@
+import asyncio
+import statistics
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, List, Sequence
+
+from config import WORKER_POOL_CONFIG
+from run_guard import current_budget
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """LLM 호출 예외가 429/rate limit인지 판별 (litellm, openai, http 예외 공통)
+
+    메시지의 "429"는 보지 않는다 (검증 오류 메시지에 '4290원' 같은 입력이 들어가면 오판해서 유료 호출을 반복함).
+    """
+    if getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError":
+        return True
+    message = str(error).lower()
+    return "rate limit" in message or "ratelimit" in message or "rate_limit" in message
+
+
+class AdaptiveLimiter:
+    """AIMD 방식 동시 실행 제한: 건강하면 +1씩 늘리고, rate limit이거나 최근 p95 지연이 목표를 넘으면 절반으로 줄임"""
+
+    def __init__(self, initial: int, minimum: int, maximum: int, target_latency: float,
+                 backoff_cooldown: float = 5.0, latency_window: int = 50, min_latency_samples: int = 20):
+        self.limit = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.backoff_cooldown = backoff_cooldown
+        self.min_latency_samples = min_latency_samples
+        self.in_flight = 0
+        self.peak_limit = self.limit
+        self.recent_latencies = deque(maxlen=latency_window)
+        self._successes_since_change = 0
+        self._last_backoff = 0.0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def recent_p95(self) -> float:
+        if len(self.recent_latencies) < 2:
+            return self.recent_latencies[0] if self.recent_latencies else 0.0
+        return statistics.quantiles(self.recent_latencies, n=20, method="inclusive")[-1]
+
+    async def on_success(self, latency: float):
+        self.recent_latencies.append(latency)
+        # 응답이 느려지면 429가 오기 전이라도 줄임 (최근 window의 p95 기준, 줄인 뒤에는 새 limit에서 다시 측정)
+        if len(self.recent_latencies) >= self.min_latency_samples and self.recent_p95() > self.target_latency:
+            if await self._decrease():
+                self.recent_latencies.clear()
+            return
+        if latency > self.target_latency:
+            return
+        self._successes_since_change += 1
+        # 현재 limit 만큼 연속으로 건강한 응답을 받으면 1 증가 (additive increase)
+        if self._successes_since_change >= self.limit and self.limit < self.maximum:
+            async with self._condition:
+                self.limit += 1
+                self.peak_limit = max(self.peak_limit, self.limit)
+                self._successes_since_change = 0
+                self._condition.notify_all()
+
+    async def on_rate_limit(self):
+        await self._decrease()
+
+    async def _decrease(self) -> bool:
+        now = time.monotonic()
+        # 동시에 여러 요청이 429를 받거나 느려져도 한 번만 줄이도록 cooldown 적용 (multiplicative decrease)
+        if now - self._last_backoff < self.backoff_cooldown:
+            return False
+        self._last_backoff = now
+        self._successes_since_change = 0
+        async with self._condition:
+            self.limit = max(self.minimum, self.limit // 2)
+        return True
+
+
+class WorkerPoolStats:
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.latencies: List[float] = []
+        self.succeeded = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.skipped = 0  # job 시간 예산 초과로 시작하지 않고 남긴 항목
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.final_concurrency = 0
+        self.peak_concurrency = 0
+
+    def percentile(self, ratio: float) -> float:
+        if not self.latencies:
+            return 0.0
+        if len(self.latencies) == 1:
+            return self.latencies[0]
+        return statistics.quantiles(self.latencies, n=100, method="inclusive")[int(ratio * 100) - 1]
+
+    def summary(self) -> dict:
+        total = self.succeeded + self.failed
+        return {
+            "stage": self.stage,
+            "items": total,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+            "skipped": self.skipped,
+            "elapsed_seconds": round(self.elapsed, 2),
+            "throughput_per_second": round(total / self.elapsed, 2) if self.elapsed else 0.0,
+            "p50_latency_seconds": round(self.percentile(0.50), 3),
+            "p95_latency_seconds": round(self.percentile(0.95), 3),
+            "concurrency": self.final_concurrency,
+            "peak_concurrency": self.peak_concurrency,
+        }
+
+
+async def run_worker_pool(stage: str, items: Sequence, worker: Callable[[Any, int], Awaitable[Any]]):
+    """items를 stage 설정에 따른 동시성으로 worker(item, index)에 넘기고 (결과 목록, 통계)를 반환
+
+    결과 목록은 items 순서를 유지하며, 실패한 항목은 None이다.
+    rate limit 예외는 동시성을 줄인 뒤 재시도하고, 그 외 예외는 실패로 기록한다.
+    consumer는 모든 항목이 끝날 때까지(재시도 대기 중인 항목 포함) 남아 있다.
+    job 시간 예산을 넘기면 새 항목을 시작하지 않고 남은 항목은 None으로 둔다 (다음 실행에서 처리).
+    """
+    budget = current_budget()
+    stage_config = WORKER_POOL_CONFIG[stage]
+    limiter = AdaptiveLimiter(
+        initial=stage_config["initial_concurrency"],
+        minimum=stage_config["min_concurrency"],
+        maximum=stage_config["max_concurrency"],
+        target_latency=stage_config["target_latency_seconds"],
+    )
+    stats = WorkerPoolStats(stage)
+    results: List[Any] = [None] * len(items)
+    queue: asyncio.Queue = asyncio.Queue()
+    for index in range(len(items)):
+        queue.put_nowait((index, 0))
+    # 최대 동시성만큼 consumer를 띄우고, 실제 동시 실행 수는 limiter가 제한
+    consumers = min(len(items), stage_config["max_concurrency"])
+    # 성공/실패/건너뜀으로 끝나지 않은 항목 수 (재시도를 기다리는 항목 포함)
+    # 큐가 잠깐 비어도 재시도 대기 중인 항목이 있으면 consumer가 끝나지 않아야 재시도 때 동시성이 유지됨
+    remaining = len(items)
+
+    def finish():
+        nonlocal remaining
+        remaining -= 1
+        if remaining == 0:
+            for _ in range(consumers):
+                queue.put_nowait(None)
+
+    async def consume():
+        while True:
+            entry = await queue.get()
+            if entry is None:
+                return
+            index, attempt = entry
+            if budget is not None and budget.exceeded():
+                stats.skipped += 1
+                budget.truncate(stage)
+                finish()
+                continue
+            retry_after = None
+            async with limiter.slot():
+                started = time.perf_counter()
+                try:
+                    results[index] = await worker(items[index], index)
+                except Exception as e:
+                    if not is_rate_limit_error(e) or attempt >= stage_config["max_retries"]:
+                        print(f"[{stage}] 처리 실패 (index {index}): {e}")
+                        stats.failed += 1
+                        finish()
+                        continue
+                    stats.rate_limited += 1
+                    await limiter.on_rate_limit()
+                    retry_after = getattr(e, "retry_after", None) or stage_config["retry_delay_seconds"] * (2 ** attempt)
+                latency = time.perf_counter() - started
+            if retry_after is not None:
+                # slot을 돌려준 뒤에 기다림 (기다리는 동안 다른 항목이 줄어든 동시성 안에서 진행)
+                await asyncio.sleep(retry_after)
+                queue.put_nowait((index, attempt + 1))
+                continue
+            stats.latencies.append(latency)
+            stats.succeeded += 1
+            await limiter.on_success(latency)
+            finish()
+
+    await asyncio.gather(*(consume() for _ in range(consumers)))
+
+    stats.elapsed = time.perf_counter() - stats.started
+    stats.final_concurrency = limiter.limit
+    stats.peak_concurrency = limiter.peak_limit
+    return results, stats